@@ -0,0 +1,189 @@
+"""
+Adaptive (AIMD) concurrency limits per (provider, model).
+
+Each model starts at CONFIG['adaptive_concurrency']['initial'] requests in
+flight. After every full window of completions (one per slot) with a low
+error rate and a p95 latency close to the best seen so far, the limit grows
+by one; a rate-limit or overload error cuts it multiplicatively. Errors from
+requests sent before the last cut are ignored, so a burst of 429s from one
+overshoot only cuts once. The run settles near the highest concurrency each
+model sustains without throttling.
+
+The per-provider cap (CONFIG['provider_concurrency']) is a SendSlot that
+key_pool.pooled_call takes only around the API call itself, after a key
+and its rate-limit budget are in hand. A request waiting for a throttled
+model's slot, a benched key, token-bucket budget, or sleeping before a
+retry holds no provider slot, so it does not hold back the provider's
+other models; and the latency the limit adapts to is the call's alone.
+"""
+import time
+import asyncio
+import threading
+import logging
+from collections import deque
+
+from config import CONFIG
+
+logger = logging.getLogger(__name__)
+
+# Outcomes (from retry.classify_error) that mean the model is being pushed too hard
+BACKOFF_OUTCOMES = ('rate_limit', 'overload')
+
+LATENCY_SAMPLES = 100
+
+# One semaphore per provider, shared by every coroutine in the process
+provider_semaphores = {
+    provider: asyncio.Semaphore(limit)
+    for provider, limit in CONFIG['provider_concurrency'].items()
+}
+
+
+def p95(samples) -> float:
+    ordered = sorted(samples)
+    return ordered[min(int(len(ordered) * 0.95), len(ordered) - 1)]
+
+
+class AdaptiveLimiter:
+    """Concurrency limit for one (provider, model), adjusted from request outcomes."""
+
+    def __init__(self, provider: str, model: str):
+        settings = CONFIG['adaptive_concurrency']
+        self.provider = provider
+        self.model = model
+        self.min_limit = settings['min']
+        self.max_limit = settings['max']
+        self.increase = settings['increase']
+        self.decrease_factor = settings['decrease_factor']
+        self.latency_tolerance = settings['latency_tolerance']
+        self.max_error_rate = settings['max_error_rate']
+
+        self.limit = float(settings['initial'])
+        self.in_flight = 0
+        self.condition = asyncio.Condition()
+        self.latencies = deque(maxlen=LATENCY_SAMPLES)
+        self.best_p95 = None
+        self.window_completions = 0
+        self.window_errors = 0
+        self.last_decrease = 0.0
+        self.peak_limit = self.limit
+
+    async def acquire(self):
+        """Wait for a free slot."""
+        async with self.condition:
+            await self.condition.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+
+    async def release(self, started: float, finished: float, outcome: str):
+        """Free a slot and adapt the limit to the outcome ('ok' or an error class) of a call sent at `started`."""
+        now = time.monotonic()
+        async with self.condition:
+            self.in_flight -= 1
+            if outcome == 'ok':
+                self.latencies.append(finished - started)
+                self.on_completion(error=False)
+            elif outcome in BACKOFF_OUTCOMES:
+                self.on_backoff(started, now, outcome)
+            elif outcome != 'cancelled':
+                self.on_completion(error=True)
+            self.condition.notify_all()
+
+    def on_completion(self, error: bool):
+        """Additive increase once a full window completes with healthy errors and latency."""
+        self.window_completions += 1
+        self.window_errors += error
+        if self.window_completions < int(self.limit):
+            return
+
+        error_rate = self.window_errors / self.window_completions
+        healthy = error_rate <= self.max_error_rate
+        if healthy and self.latencies:
+            current_p95 = p95(self.latencies)
+            if self.best_p95 is None or current_p95 < self.best_p95:
+                self.best_p95 = current_p95
+            healthy = current_p95 <= self.best_p95 * self.latency_tolerance
+
+        if healthy and self.limit < self.max_limit:
+            self.limit = min(self.limit + self.increase, self.max_limit)
+            self.peak_limit = max(self.peak_limit, self.limit)
+            logger.debug(f"Concurrency for {self.model} raised to {int(self.limit)}")
+        self.window_completions = 0
+        self.window_errors = 0
+
+    def on_backoff(self, started: float, now: float, outcome: str):
+        """Multiplicative decrease, once per overshoot."""
+        self.window_completions = 0
+        self.window_errors = 0
+        if started < self.last_decrease:
+            return
+        self.limit = max(self.limit * self.decrease_factor, self.min_limit)
+        self.last_decrease = now
+        logger.warning(f"Concurrency for {self.model} cut to {int(self.limit)} after {outcome}")
+
+
+limiters = {}
+limiters_lock = threading.Lock()
+
+
+def get_adaptive_limiter(provider: str, model: str) -> AdaptiveLimiter:
+    with limiters_lock:
+        if (provider, model) not in limiters:
+            limiters[(provider, model)] = AdaptiveLimiter(provider, model)
+        return limiters[(provider, model)]
+
+
+class SendSlot:
+    """One attempt's provider slot, held only around the API call; records when the call ran."""
+
+    def __init__(self, provider: str):
+        self.semaphore = provider_semaphores[provider]
+        self.sent_at = None
+        self.finished_at = None
+
+    async def __aenter__(self):
+        await self.semaphore.acquire()
+        self.sent_at = time.monotonic()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.finished_at = time.monotonic()
+        self.semaphore.release()
+
+
+async def adaptive_call(provider: str, model: str, request, classify_error, on_attempt=None):
+    """Run one attempt, `request(slot)`, in one of the model's slots.
+
+    `request` must wrap the API call itself in `slot` (see key_pool.pooled_call).
+    The attempt's outcome is fed back to the model's limit and, with the
+    seconds the call took, to `on_attempt(outcome, seconds)`. An attempt that
+    never reached the API (no key, cancelled while waiting) is not counted.
+    """
+    limiter = get_adaptive_limiter(provider, model)
+    await limiter.acquire()
+    slot = SendSlot(provider)
+    outcome = 'cancelled'
+    try:
+        result = await request(slot)
+        outcome = 'ok'
+        return result
+    except Exception as e:
+        outcome = classify_error(e)
+        raise
+    finally:
+        finished = slot.finished_at or time.monotonic()
+        if slot.sent_at is None:
+            outcome = 'cancelled'
+        elif on_attempt:
+            on_attempt(outcome, finished - slot.sent_at)
+        await limiter.release(slot.sent_at, finished, outcome)
+
+
+def log_concurrency_summary():
+    """Log where each model's concurrency limit settled."""
+    with limiters_lock:
+        entries = sorted(limiters.items())
+    for (provider, model), limiter in entries:
+        latency = f"{p95(limiter.latencies):.2f}s" if limiter.latencies else "n/a"
+        logger.info(
+            f"Concurrency for {model} ({provider}): settled at {int(limiter.limit)} "
+            f"(peak {int(limiter.peak_limit)}), p95 latency {latency}"
+        )
@@ -0,0 +1,254 @@
+"""
+Condition-effect analysis over the full results matrix.
+
+Loads every result row into one typed frame (via ResultTable's compact
+columns), labels each resume with its design
+condition (see design.py), and computes in vectorized operations:
+- per-model means of Q1..Q17 (and the manipulation-check pass rate) per condition
+- Black minus white gaps per model and record condition, with Welch t-tests
+- per model and question, an OLS model (HC1 standard errors) of the score on
+  a Black indicator plus record-condition fixed effects; with --ordinal also
+  an ordered logit with the same terms, fitted on aggregated counts in a
+  process pool (questions answered identically every time are reported as
+  'constant' instead)
+
+Scores outside config.QUESTION_RANGES are treated as missing. Resumes are
+matched by condition ID (design runs) or by variant name (resume_1_2_3.md,
+...); rows of unknown resumes are left out and logged.
+
+Usage:
+    python analysis.py [--output-base DIR] [--out DIR] [--ordinal]
+"""
+import os
+import time
+import argparse
+import logging
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+import statsmodels.api as sm
+from scipy import stats
+from statsmodels.miscmodels.ordinal_model import OrderedModel
+
+from config import CONFIG, QUESTION_RANGES
+from design import condition_labels
+from result_table import ResultTable
+
+logger = logging.getLogger(__name__)
+
+QUESTIONS = [f'Q{q}' for q in range(1, CONFIG['num_questions'] + 1)]
+CONDITION_KEYS = ['applicant', 'record_type', 'record_pages']
+CELL_KEYS = ['model', 'record_type', 'record_pages']
+
+
+def label_conditions(frame: pd.DataFrame) -> pd.DataFrame:
+    """Add applicant / record_type / record_pages columns from the resume name; drops unknown resumes."""
+    by_name = {}
+    for condition_id, labels in condition_labels().items():
+        by_name[condition_id] = labels
+        if labels['variant']:
+            by_name[labels['variant']] = labels
+
+    # One lookup per distinct resume, then broadcast through the categorical codes
+    resumes = frame['resume'].cat.categories
+    found = [by_name.get(os.path.splitext(name)[0]) for name in resumes]
+    unknown = [name for name, labels in zip(resumes, found) if labels is None]
+    if unknown:
+        logger.warning(f"No design condition for {unknown}; their rows are left out")
+    codes = frame['resume'].cat.codes.to_numpy()
+    for key in CONDITION_KEYS:
+        levels = np.array([labels[key] if labels else None for labels in found], dtype=object)
+        frame[key] = levels[codes]
+    frame = frame[np.array([labels is not None for labels in found])[codes]].copy()
+    for key in ('applicant', 'record_type'):
+        frame[key] = frame[key].astype('category')
+    frame['record_pages'] = frame['record_pages'].astype(np.int8)
+    return frame
+
+
+def load_results(output_base: str) -> pd.DataFrame:
+    """Every result under `output_base` as one frame, scores as floats (NaN when out of range)."""
+    table = ResultTable.from_csvs(output_base)
+    frame = table.to_pandas()
+    scores = table.column('scores').astype(np.float64)
+    low = np.array([QUESTION_RANGES[q][0] for q in range(1, table.num_questions + 1)])
+    high = np.array([QUESTION_RANGES[q][1] for q in range(1, table.num_questions + 1)])
+    scores[(scores < low) | (scores > high)] = np.nan
+    for q, column in enumerate(QUESTIONS):
+        frame[column] = scores[:, q]
+    frame['manipulation_yes'] = (frame['ManipulationCheck'] == 'YES').astype(np.float64)
+    return label_conditions(frame)
+
+
+def condition_means(frame: pd.DataFrame) -> pd.DataFrame:
+    """Mean of every question per (model, condition), with row counts."""
+    grouped = frame.groupby(['model'] + CONDITION_KEYS, observed=True)
+    means = grouped[QUESTIONS + ['manipulation_yes']].mean()
+    means.insert(0, 'n', grouped.size())
+    return means.reset_index()
+
+
+def applicant_gaps(frame: pd.DataFrame) -> pd.DataFrame:
+    """Black minus white mean per (model, record condition, question), with Welch's t-test."""
+    grouped = frame.groupby(CELL_KEYS + ['applicant'], observed=True)[QUESTIONS]
+    summary = {'mean': grouped.mean(), 'var': grouped.var(), 'n': grouped.count()}
+    black = {name: values.xs('black', level='applicant') for name, values in summary.items()}
+    white = {name: values.xs('white', level='applicant') for name, values in summary.items()}
+    # Only record conditions both applicants were evaluated in
+    cells = black['mean'].index.intersection(white['mean'].index)
+    black = {name: values.loc[cells].to_numpy(dtype=float) for name, values in black.items()}
+    white = {name: values.loc[cells].to_numpy(dtype=float) for name, values in white.items()}
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        black_share = black['var'] / black['n']
+        white_share = white['var'] / white['n']
+        se = np.sqrt(black_share + white_share)
+        gap = black['mean'] - white['mean']
+        t = gap / se
+        df = (black_share + white_share) ** 2 / (
+            black_share ** 2 / (black['n'] - 1) + white_share ** 2 / (white['n'] - 1)
+        )
+        p = 2 * stats.t.sf(np.abs(t), df)
+
+    columns = {
+        'black_mean': black['mean'], 'white_mean': white['mean'], 'gap': gap, 'se': se,
+        't': t, 'df': df, 'p': p, 'n_black': black['n'].astype(int), 'n_white': white['n'].astype(int),
+    }
+    # (cells x questions) arrays -> one row per (cell, question)
+    index = pd.MultiIndex.from_tuples(
+        [cell + (question,) for cell in cells for question in QUESTIONS], names=CELL_KEYS + ['question']
+    )
+    return pd.DataFrame({name: values.ravel() for name, values in columns.items()}, index=index).reset_index()
+
+
+def gap_design_matrix(frame: pd.DataFrame) -> pd.DataFrame:
+    """Constant, Black indicator and record-condition fixed effects."""
+    record_condition = frame['record_type'].astype(str) + '-' + frame['record_pages'].astype(str)
+    X = pd.get_dummies(record_condition, prefix='record', drop_first=True, dtype=float)
+    X.insert(0, 'black', (frame['applicant'] == 'black').to_numpy(dtype=float))
+    return sm.add_constant(X, has_constant='add')
+
+
+class FrequencyWeightedOrderedModel(OrderedModel):
+    """OrderedModel over aggregated rows: each row's log-likelihood counts `freq_weights` times."""
+
+    def __init__(self, endog, exog, freq_weights, **kwargs):
+        super().__init__(endog, exog, **kwargs)
+        self.freq_weights = np.asarray(freq_weights, dtype=float)
+
+    def loglikeobs(self, params):
+        return self.freq_weights * super().loglikeobs(params)
+
+
+def fit_gap_models(frame: pd.DataFrame, ordinal: bool = False, workers: int = None) -> pd.DataFrame:
+    """Black coefficient per (model, question): OLS with HC1 errors, and optionally an ordered logit.
+
+    Ordered logits are fitted in a process pool of `workers` (default: one per CPU).
+    """
+    fits = []
+    ordinal_jobs = []
+    for model, group in frame.groupby('model', observed=True):
+        if group['applicant'].nunique() < 2:
+            continue
+        X = gap_design_matrix(group)
+        for question in QUESTIONS:
+            y = group[question].to_numpy(dtype=float)
+            valid = ~np.isnan(y)
+            if valid.sum() <= X.shape[1]:
+                continue
+            if np.ptp(y[valid]) == 0:
+                # Same answer every time: no gap, and nothing to test
+                fits.append({'model': model, 'question': question, 'method': 'constant', 'coef': 0.0,
+                             'se': np.nan, 'p': np.nan, 'n': int(valid.sum())})
+                continue
+            with warnings.catch_warnings():
+                warnings.simplefilter('ignore')
+                result = sm.OLS(y[valid], X[valid]).fit(cov_type='HC1')
+            fits.append({
+                'model': model, 'question': question, 'method': 'ols', 'coef': result.params['black'],
+                'se': result.bse['black'], 'p': result.pvalues['black'], 'n': int(valid.sum()),
+            })
+            if ordinal:
+                ordinal_jobs.append((model, question, y[valid], X[valid].drop(columns='const')))
+
+    workers = workers or os.cpu_count() or 1
+    if workers > 1 and len(ordinal_jobs) > 1:
+        with ProcessPoolExecutor(max_workers=min(workers, len(ordinal_jobs))) as pool:
+            fits.extend(pool.map(fit_ordered_logit, ordinal_jobs))
+    else:
+        fits.extend(map(fit_ordered_logit, ordinal_jobs))
+    return pd.DataFrame(fits, columns=['model', 'question', 'method', 'coef', 'se', 'p', 'n'])
+
+
+def fit_ordered_logit(job) -> dict:
+    """Worker: ordered logit of one (model, question) on the aggregated (design row, answer) counts."""
+    model, question, y, X = job
+    row = {'model': model, 'question': question, 'method': 'ordered_logit', 'n': len(y)}
+    # The design has only a few distinct rows, so fitting on counts is several times faster
+    counts = X.assign(answer=y).groupby(list(X.columns) + ['answer']).size().reset_index(name='count')
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            result = FrequencyWeightedOrderedModel(
+                counts['answer'].to_numpy(), counts[X.columns], counts['count'].to_numpy(), distr='logit'
+            ).fit(method='bfgs', disp=False)
+        row.update(coef=result.params['black'], se=result.bse['black'], p=result.pvalues['black'])
+    except (ValueError, np.linalg.LinAlgError) as e:
+        logger.warning(f"Ordered logit for {model} {question} failed: {e}")
+    return row
+
+
+def format_gap_matrix(fits: pd.DataFrame, method: str = 'ols') -> str:
+    """Model x question matrix of Black coefficients, starred by p-value."""
+    # Questions answered the same way every time show as a plain 0
+    fits = fits[fits['method'].isin([method, 'constant'])]
+    if fits.empty:
+        return "(no fits)"
+    stars = np.select([fits['p'] < 0.001, fits['p'] < 0.01, fits['p'] < 0.05], ['***', '**', '*'], '')
+    cells = fits.assign(cell=[
+        '0' if kind == 'constant' else f"{coef:+.2f}{star}"
+        for coef, star, kind in zip(fits['coef'], stars, fits['method'])
+    ])
+    matrix = cells.pivot(index='model', columns='question', values='cell').reindex(columns=QUESTIONS).fillna('')
+    return matrix.to_string()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Black-vs-white condition effects over the results CSVs.")
+    parser.add_argument('--output-base', default=os.getenv('OUTPUT_DIR', '.'),
+                        help="directory holding output_csvs_* (default OUTPUT_DIR or .)")
+    parser.add_argument('--out', help="where to write the tables (default OUTPUT_BASE/analysis)")
+    parser.add_argument('--ordinal', action='store_true', help="also fit ordered logit models (slower)")
+    parser.add_argument('--workers', type=int, default=None, help="processes for the ordered logit fits")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    start = time.perf_counter()
+    frame = load_results(args.output_base)
+    if frame.empty:
+        logger.error(f"No labelled results under {args.output_base}")
+        return
+    means = condition_means(frame)
+    gaps = applicant_gaps(frame)
+    fits = fit_gap_models(frame, ordinal=args.ordinal, workers=args.workers)
+
+    out = args.out or os.path.join(args.output_base, 'analysis')
+    os.makedirs(out, exist_ok=True)
+    means.to_csv(os.path.join(out, 'condition_means.csv'), index=False)
+    gaps.to_csv(os.path.join(out, 'applicant_gaps.csv'), index=False)
+    fits.to_csv(os.path.join(out, 'gap_models.csv'), index=False)
+
+    print(f"{len(frame)} results, {frame['model'].nunique()} models, "
+          f"{frame.groupby(CONDITION_KEYS, observed=True).ngroups} conditions")
+    print("\nBlack coefficient (OLS, record-condition fixed effects, HC1): * p<.05 ** p<.01 *** p<.001")
+    print(format_gap_matrix(fits, 'ols'))
+    if args.ordinal:
+        print("\nBlack coefficient (ordered logit, log-odds):")
+        print(format_gap_matrix(fits, 'ordered_logit'))
+    logger.info(f"Analysis written to {out} in {time.perf_counter() - start:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
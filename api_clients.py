@@ -1,40 +1,21 @@
 """
 API client functions for OpenAI, Claude, and Mistral.
-Handles structured outputs, retries, and error handling.
+Handles structured outputs and error handling; retries live in retry.py.
 """
-import time
-import threading
 import logging
-import anthropic
-import requests
-from openai import OpenAI, OpenAIError
-from mistralai import Mistral
+from openai import OpenAIError
 
-from config import (
-    OPENAI_API_KEYS, ANTHROPIC_API_KEY, MISTRAL_API_KEY,
-    OPENAI_MODELS_MAIN, CLAUDE_MODELS, MISTRAL_MODELS,
-    CONFIG
-)
 from prompts import SYSTEM_PROMPT
-from utils import get_response_schema, get_claude_response_schema, get_mistral_response_schema
+from key_pool import pooled_call, PROVIDER_KEYS
+from adaptive_concurrency import adaptive_call
+from retry import classify_error
+from response_cache import cached_call, CacheMissError
+from utils import get_response_schema, get_claude_response_schema, get_mistral_response_schema, split_prompt_prefix
+from metrics import record_token_usage
+from client_registry import get_client
 
 logger = logging.getLogger(__name__)
 
-# Global OpenAI client state
-openai_client = OpenAI(api_key=OPENAI_API_KEYS[0])
-current_key_index = 0
-openai_key_lock = threading.Lock()  # Lock for thread-safe key switching
-
-
-def switch_openai_key():
-    """Switch to the next available OpenAI API key (thread-safe)."""
-    global current_key_index, openai_client
-    with openai_key_lock:
-        current_key_index = (current_key_index + 1) % len(OPENAI_API_KEYS)
-        openai_client = OpenAI(api_key=OPENAI_API_KEYS[current_key_index])
-        logger.info(f"Switched to OpenAI API key {current_key_index + 1}")
-
-
 def get_json_structure_instruction():
     """JSON format instructions for models without schema enforcement."""
     return """
@@ -60,203 +41,266 @@ Remember:
 """
 
 
-def get_openai_score(prompt: str, model: str) -> str:
-    """Get score from OpenAI API."""
-    global current_key_index, openai_client
+def extract_usage(provider: str, response) -> dict:
+    """Normalize a response's token usage, including prompt-cache reads and writes."""
+    usage = getattr(response, 'usage', None)
+    if usage is None:
+        return {}
+    
+    if provider == 'anthropic':
+        # Anthropic reports cached input separately from input_tokens
+        cache_read = getattr(usage, 'cache_read_input_tokens', 0) or 0
+        cache_write = getattr(usage, 'cache_creation_input_tokens', 0) or 0
+        return {
+            'input_tokens': (usage.input_tokens or 0) + cache_read + cache_write,
+            'cached_tokens': cache_read,
+            'cache_write_tokens': cache_write,
+            'output_tokens': usage.output_tokens or 0
+        }
     
+    details = getattr(usage, 'prompt_tokens_details', None)
+    if isinstance(details, dict):
+        cached = details.get('cached_tokens', 0)
+    else:
+        cached = getattr(details, 'cached_tokens', 0)
+    return {
+        'input_tokens': usage.prompt_tokens or 0,
+        'cached_tokens': cached or 0,
+        'output_tokens': usage.completion_tokens or 0
+    }
+
+
+def build_openai_request(prompt: str, model: str) -> dict:
+    """Chat completion parameters for an OpenAI model (shared by live and batch requests)."""
     response_schema = get_response_schema()
     
-    try:
-        schema_support_models = ["gpt-4o", "gpt-4o-mini", "gpt-4.1", "gpt-4.1-mini", "gpt-5.1", "o1", "o3-mini", "o4-mini"]
-        use_schema = model in schema_support_models
-        
-        # Models that require max_completion_tokens instead of max_tokens
-        new_token_param_models = ["gpt-5.1", "o1", "o3-mini", "o4-mini"]
-        
-        if model in ['o1', 'o3-mini', 'o4-mini']:
-            messages = [
-                {"role": "developer", "content": SYSTEM_PROMPT},
-                {"role": "user", "content": prompt}
-            ]
-            create_kwargs = {
-                "model": model,
-                "messages": messages,
-                "response_format": {
-                    "type": "json_schema",
-                    "json_schema": {
-                        "name": "evaluation_response",
-                        "strict": True,
-                        "schema": response_schema
-                    }
+    schema_support_models = ["gpt-4o", "gpt-4o-mini", "gpt-4.1", "gpt-4.1-mini", "gpt-5.1", "o1", "o3-mini", "o4-mini"]
+    use_schema = model in schema_support_models
+    
+    # Models that require max_completion_tokens instead of max_tokens
+    new_token_param_models = ["gpt-5.1", "o1", "o3-mini", "o4-mini"]
+    
+    if model in ['o1', 'o3-mini', 'o4-mini']:
+        messages = [
+            {"role": "developer", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": prompt}
+        ]
+        create_kwargs = {
+            "model": model,
+            "messages": messages,
+            "response_format": {
+                "type": "json_schema",
+                "json_schema": {
+                    "name": "evaluation_response",
+                    "strict": True,
+                    "schema": response_schema
+                }
+            }
+        }
+    elif model == "gpt-5.1":
+        # gpt-5.1 uses developer role and max_completion_tokens
+        messages = [
+            {"role": "developer", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": prompt}
+        ]
+        create_kwargs = {
+            "model": model,
+            "messages": messages,
+            "max_completion_tokens": 4096,
+            "response_format": {
+                "type": "json_schema",
+                "json_schema": {
+                    "name": "evaluation_response",
+                    "strict": True,
+                    "schema": response_schema
                 }
             }
-            response = openai_client.chat.completions.create(**create_kwargs)
-        elif model == "gpt-5.1":
-            # gpt-5.1 uses developer role and max_completion_tokens
-            messages = [
-                {"role": "developer", "content": SYSTEM_PROMPT},
-                {"role": "user", "content": prompt}
-            ]
-            create_kwargs = {
-                "model": model,
-                "messages": messages,
-                "max_completion_tokens": 4096,
-                "response_format": {
-                    "type": "json_schema",
-                    "json_schema": {
-                        "name": "evaluation_response",
-                        "strict": True,
-                        "schema": response_schema
-                    }
+        }
+    else:
+        messages = [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": prompt}
+        ]
+        create_kwargs = {
+            "model": model,
+            "messages": messages,
+            "temperature": 0,
+            "max_tokens": 4096
+        }
+        
+        if use_schema:
+            create_kwargs["response_format"] = {
+                "type": "json_schema",
+                "json_schema": {
+                    "name": "evaluation_response",
+                    "strict": True,
+                    "schema": response_schema
                 }
             }
-            response = openai_client.chat.completions.create(**create_kwargs)
         else:
-            messages = [
-                {"role": "system", "content": SYSTEM_PROMPT},
-                {"role": "user", "content": prompt}
-            ]
-            create_kwargs = {
-                "model": model,
-                "messages": messages,
-                "temperature": 0,
-                "max_tokens": 4096
-            }
-            
-            if use_schema:
-                create_kwargs["response_format"] = {
-                    "type": "json_schema",
-                    "json_schema": {
-                        "name": "evaluation_response",
-                        "strict": True,
-                        "schema": response_schema
-                    }
-                }
-            else:
-                json_instruction = get_json_structure_instruction()
-                create_kwargs["response_format"] = {"type": "json_object"}
-                messages[-1]["content"] = messages[-1]["content"] + json_instruction
-            
-            response = openai_client.chat.completions.create(**create_kwargs)
+            json_instruction = get_json_structure_instruction()
+            create_kwargs["response_format"] = {"type": "json_object"}
+            messages[-1]["content"] = messages[-1]["content"] + json_instruction
+    
+    return create_kwargs
+
+
+async def get_openai_score(prompt: str, model: str, iteration: int = 0, refresh: bool = False,
+                           on_attempt=None) -> str:
+    """Get score from OpenAI API (served from the response cache when possible)."""
+    try:
+        create_kwargs = build_openai_request(prompt, model)
         
-        result = response.choices[0].message.content
+        async def send_request():
+            # The key pool picks the OpenAI key with the most rate-limit headroom
+            response = await adaptive_call('openai', model, lambda slot: pooled_call(
+                'openai', SYSTEM_PROMPT + prompt,
+                lambda api_key: get_client('openai', api_key).chat.completions.with_raw_response.create(**create_kwargs),
+                slot
+            ), classify_error, on_attempt)
+            record_token_usage(model, extract_usage('openai', response))
+            return response.choices[0].message.content
+        
+        result = await cached_call('openai', create_kwargs, iteration, send_request, refresh)
         logger.debug(f"OpenAI API call successful for model {model}")
         return result
         
     except OpenAIError as e:
-        error_str = str(e).lower()
-        if "insufficient_quota" in error_str or "billing_hard_limit_reached" in error_str:
-            with openai_key_lock:
-                key_index = current_key_index
-            if key_index < len(OPENAI_API_KEYS) - 1:
-                logger.warning(f"API key {key_index + 1} exhausted, switching to next key...")
-                switch_openai_key()
-                return get_openai_score(prompt, model)
-            else:
-                logger.error("All OpenAI API keys exhausted!")
-                raise
         logger.error(f"OpenAI API error for model {model}: {e}")
         raise
 
 
-def get_claude_score(prompt: str, model: str) -> str:
-    """Get score from Claude API."""
-    client = anthropic.Anthropic(api_key=ANTHROPIC_API_KEY)
+CLAUDE_STRUCTURED_OUTPUT_MODELS = [
+    "claude-opus-4-1-20250805"     # Claude Opus 4.1 (supports structured outputs)
+]
+CLAUDE_STRUCTURED_OUTPUT_BETA = "structured-outputs-2025-11-13"
+
+
+def build_claude_request(prompt: str, model: str) -> dict:
+    """Messages API parameters for a Claude model (shared by live and batch requests).
     
-    structured_output_models = [
-        "claude-opus-4-1-20250805"     # Claude Opus 4.1 (supports structured outputs)
-    ]
+    Structured-output models carry a "betas" entry; callers using the beta
+    endpoints pass it through, others pop it.
+    """
+    create_kwargs = {
+        "model": model,
+        "temperature": 0.0,
+        "max_tokens": 8192,
+        "system": SYSTEM_PROMPT,
+        "messages": [
+            {
+                "role": "user",
+                "content": prompt,
+            },
+        ]
+    }
     
-    use_structured_output = model in structured_output_models
+    shared_prefix, resume_part = split_prompt_prefix(prompt)
+    if shared_prefix:
+        # Mark the system prompt + question block as a cacheable prefix; only the resume varies
+        create_kwargs["system"] = [{"type": "text", "text": SYSTEM_PROMPT}]
+        create_kwargs["messages"][0]["content"] = [
+            {"type": "text", "text": shared_prefix, "cache_control": {"type": "ephemeral"}},
+            {"type": "text", "text": resume_part}
+        ]
     
-    try:
-        create_kwargs = {
-            "model": model,
-            "temperature": 0.0,
-            "max_tokens": 8192,
-            "system": SYSTEM_PROMPT,
-            "messages": [
-                {
-                    "role": "user",
-                    "content": prompt,
-                },
-            ]
+    if model in CLAUDE_STRUCTURED_OUTPUT_MODELS:
+        # Use Claude-compatible schema (without minItems/maxItems for arrays)
+        create_kwargs["betas"] = [CLAUDE_STRUCTURED_OUTPUT_BETA]
+        create_kwargs["output_format"] = {
+            "type": "json_schema",
+            "schema": get_claude_response_schema()
         }
+    else:
+        # For older Claude 3.x models: use GPT-3.5 style JSON instruction approach
+        # Add JSON format instructions to prompt (same approach as GPT-3.5)
+        # The parser will extract structured data from the JSON response
+        json_instruction = get_json_structure_instruction()
+        if shared_prefix:
+            create_kwargs["messages"][0]["content"][-1]["text"] += json_instruction
+        else:
+            create_kwargs["messages"][0]["content"] = create_kwargs["messages"][0]["content"] + json_instruction
+    
+    return create_kwargs
+
+
+async def get_claude_score(prompt: str, model: str, iteration: int = 0, refresh: bool = False,
+                           on_attempt=None) -> str:
+    """Get score from Claude API (served from the response cache when possible)."""
+    try:
+        create_kwargs = build_claude_request(prompt, model)
+        use_structured_output = "betas" in create_kwargs
         
-        if use_structured_output:
-            # Use Claude-compatible schema (without minItems/maxItems for arrays)
-            claude_schema = get_claude_response_schema()
-            response = client.beta.messages.create(
-                betas=["structured-outputs-2025-11-13"],
-                model=model,
-                temperature=0.0,
-                max_tokens=8192,
-                system=SYSTEM_PROMPT,
-                messages=[
-                    {
-                        "role": "user",
-                        "content": prompt,
-                    },
-                ],
-                output_format={
-                    "type": "json_schema",
-                    "schema": claude_schema
-                }
+        def send_with_key(api_key: str):
+            client = get_client('anthropic', api_key)
+            messages_api = client.beta.messages if use_structured_output else client.messages
+            return messages_api.with_raw_response.create(**create_kwargs)
+        
+        async def send_request():
+            response = await adaptive_call(
+                'anthropic', model, lambda slot: pooled_call('anthropic', SYSTEM_PROMPT + prompt, send_with_key, slot),
+                classify_error, on_attempt
             )
-            result = response.content[0].text
+            record_token_usage(model, extract_usage('anthropic', response))
+            return response.content[0].text
+        
+        result = await cached_call('anthropic', create_kwargs, iteration, send_request, refresh)
+        if use_structured_output:
             logger.debug(f"Claude structured output API call successful for model {model}")
-            return result
         else:
-            # For older Claude 3.x models: use GPT-3.5 style JSON instruction approach
-            # Add JSON format instructions to prompt (same approach as GPT-3.5)
-            # The parser will extract structured data from the JSON response
-            json_instruction = get_json_structure_instruction()
-            create_kwargs["messages"][0]["content"] = create_kwargs["messages"][0]["content"] + json_instruction
-            response = client.messages.create(**create_kwargs)
-            result = response.content[0].text
             logger.debug(f"Claude API call successful for model {model} (using GPT-3.5 style JSON instruction fallback)")
-            return result
-    except anthropic.InternalServerError as e:
-        error_msg = str(e).lower()
-        if 'overloaded' in error_msg:
-            logger.warning(f"Claude server overloaded for model {model}")
-            raise anthropic.InternalServerError("Server overloaded") from e
-        else:
-            logger.error(f"Claude internal server error for model {model}: {e}")
-            raise
+        return result
+    except CacheMissError:
+        raise
     except Exception as e:
-        logger.error(f"Unexpected error in Claude API call for model {model}: {e}")
+        logger.error(f"Claude API call failed for model {model}: {e}")
         raise
 
 
-def get_mistral_score(prompt: str, model: str) -> str:
-    """Get score from Mistral API."""
-    client = Mistral(api_key=MISTRAL_API_KEY)
+def build_mistral_request(prompt: str, model: str) -> dict:
+    """Chat completion parameters for a Mistral model."""
     mistral_schema = get_mistral_response_schema()
+    full_prompt = SYSTEM_PROMPT + "\n\n" + prompt
     
+    return {
+        "model": model,
+        "temperature": 0.0,
+        "max_tokens": 4096,
+        "response_format": {
+            "type": "json_schema",
+            "json_schema": {
+                "name": "evaluation_response",
+                "strict": True,
+                "schema": mistral_schema
+            }
+        },
+        "messages": [
+            {
+                "role": "user",
+                "content": full_prompt,
+            },
+        ]
+    }
+
+
+async def get_mistral_score(prompt: str, model: str, iteration: int = 0, refresh: bool = False,
+                            on_attempt=None) -> str:
+    """Get score from Mistral API (served from the response cache when possible)."""
     try:
-        full_prompt = SYSTEM_PROMPT + "\n\n" + prompt
+        create_kwargs = build_mistral_request(prompt, model)
+        full_prompt = create_kwargs["messages"][0]["content"]
         
-        response = client.chat.complete(
-            model=model,
-            temperature=0.0,
-            max_tokens=4096,
-            response_format={
-                "type": "json_schema",
-                "json_schema": {
-                    "name": "evaluation_response",
-                    "strict": True,
-                    "schema": mistral_schema
-                }
-            },
-            messages=[
-                {
-                    "role": "user",
-                    "content": full_prompt,
-                },
-            ]
-        )
-        result = response.choices[0].message.content
+        async def send_request():
+            # The Mistral SDK does not expose response headers; keys are balanced by load
+            response = await adaptive_call('mistral', model, lambda slot: pooled_call(
+                'mistral', full_prompt,
+                lambda api_key: get_client('mistral', api_key).chat.complete_async(**create_kwargs),
+                slot
+            ), classify_error, on_attempt)
+            record_token_usage(model, extract_usage('mistral', response))
+            return response.choices[0].message.content
+        
+        result = await cached_call('mistral', create_kwargs, iteration, send_request, refresh)
         logger.debug(f"Mistral structured output API call successful for model {model}")
         return result
     except Exception as e:
@@ -264,134 +308,10 @@ def get_mistral_score(prompt: str, model: str) -> str:
         raise
 
 
-def retry_request(prompt: str, model: str, max_retries: int, retry_delay: int) -> str:
-    """Retry OpenAI API request with exponential backoff."""
-    for attempt in range(max_retries):
-        try:
-            return get_openai_score(prompt, model)
-        except OpenAIError as e:
-            error_str = str(e).lower()
-            
-            if hasattr(e, 'http_status') and e.http_status == 429:
-                wait_time = min(
-                    retry_delay * (CONFIG['exponential_backoff_base'] ** attempt),
-                    CONFIG['exponential_backoff_max']
-                )
-                logger.warning(f"OpenAI rate limit hit (attempt {attempt + 1}/{max_retries}), waiting {wait_time}s...")
-                time.sleep(wait_time)
-                continue
-            elif "insufficient_quota" in error_str or "billing_hard_limit_reached" in error_str:
-                with openai_key_lock:
-                    key_index = current_key_index
-                if key_index < len(OPENAI_API_KEYS) - 1:
-                    switch_openai_key()
-                    logger.info(f"Switched to backup API key, retrying...")
-                    continue
-                else:
-                    logger.error("All OpenAI API keys exhausted!")
-                    raise
-            else:
-                logger.error(f"Non-retryable OpenAI error: {e}")
-                raise
-        
-        except Exception as e:
-            logger.error(f"Unexpected error in OpenAI retry (attempt {attempt + 1}/{max_retries}): {e}")
-            if attempt == max_retries - 1:
-                raise
-            wait_time = min(
-                retry_delay * (CONFIG['exponential_backoff_base'] ** attempt),
-                CONFIG['exponential_backoff_max']
-            )
-            time.sleep(wait_time)
-    
-    raise Exception(f"Max retries ({max_retries}) exceeded for OpenAI model {model}")
-
-
-def retry_request_claude(prompt: str, model: str, max_retries: int, retry_delay: int) -> str:
-    """Retry Claude API request with exponential backoff."""
-    for attempt in range(max_retries):
-        try:
-            return get_claude_score(prompt, model)
-        except anthropic.RateLimitError as e:
-            # 429 rate limit error - always retry with backoff
-            wait_time = min(
-                retry_delay * (CONFIG['exponential_backoff_base'] ** attempt),
-                CONFIG['exponential_backoff_max']
-            )
-            logger.warning(f"Claude rate limit 429 (attempt {attempt + 1}/{max_retries}), waiting {wait_time}s...")
-            time.sleep(wait_time)
-            continue
-        except anthropic.InternalServerError as e:
-            error_str = str(e).lower()
-            if 'rate_limit' in error_str or 'overloaded' in error_str:
-                # Exponential backoff with jitter
-                wait_time = min(
-                    retry_delay * (CONFIG['exponential_backoff_base'] ** attempt),
-                    CONFIG['exponential_backoff_max']
-                )
-                logger.warning(f"Claude rate limit/overload (attempt {attempt + 1}/{max_retries}), waiting {wait_time}s...")
-                time.sleep(wait_time)
-                continue
-            logger.error(f"Non-retryable Claude error: {e}")
-            raise
-        except Exception as e:
-            error_str = str(e).lower()
-            # Check if it's a rate limit error in disguise
-            if '429' in str(e) or 'rate_limit' in error_str:
-                wait_time = min(
-                    retry_delay * (CONFIG['exponential_backoff_base'] ** attempt),
-                    CONFIG['exponential_backoff_max']
-                )
-                logger.warning(f"Claude rate limit (attempt {attempt + 1}/{max_retries}), waiting {wait_time}s...")
-                time.sleep(wait_time)
-                continue
-            logger.error(f"Unexpected error in Claude retry (attempt {attempt + 1}/{max_retries}): {e}")
-            if attempt == max_retries - 1:
-                raise
-            wait_time = min(
-                retry_delay * (CONFIG['exponential_backoff_base'] ** attempt),
-                CONFIG['exponential_backoff_max']
-            )
-            time.sleep(wait_time)
-    
-    raise Exception(f"Max retries ({max_retries}) exceeded for Claude model {model}")
-
-
-def retry_request_mistral(prompt: str, model: str, max_retries: int, retry_delay: int) -> str:
-    """Retry Mistral API request with exponential backoff."""
-    for attempt in range(max_retries):
-        try:
-            return get_mistral_score(prompt, model)
-        except requests.exceptions.HTTPError as e:
-            if e.response and e.response.status_code in [429, 500, 502, 503, 504]:
-                wait_time = min(
-                    retry_delay * (CONFIG['exponential_backoff_base'] ** attempt),
-                    CONFIG['exponential_backoff_max']
-                )
-                logger.warning(f"Mistral HTTP error {e.response.status_code} (attempt {attempt + 1}/{max_retries}), waiting {wait_time}s...")
-                time.sleep(wait_time)
-                continue
-            logger.error(f"Non-retryable Mistral HTTP error: {e}")
-            raise
-        except Exception as e:
-            error_str = str(e).lower()
-            # Check for rate limit errors (429, rate_limit, too many requests)
-            if '429' in str(e) or 'rate_limit' in error_str or 'too many requests' in error_str or 'rate limit' in error_str:
-                wait_time = min(
-                    retry_delay * (CONFIG['exponential_backoff_base'] ** attempt),
-                    CONFIG['exponential_backoff_max']
-                )
-                logger.warning(f"Mistral rate limit (attempt {attempt + 1}/{max_retries}), waiting {wait_time}s...")
-                time.sleep(wait_time)
-                continue
-            logger.error(f"Unexpected error in Mistral retry (attempt {attempt + 1}/{max_retries}): {e}")
-            if attempt == max_retries - 1:
-                raise
-            wait_time = min(
-                retry_delay * (CONFIG['exponential_backoff_base'] ** attempt),
-                CONFIG['exponential_backoff_max']
-            )
-            time.sleep(wait_time)
-    
-    raise Exception(f"Max retries ({max_retries}) exceeded for Mistral model {model}")
-
+async def probe_model(provider: str, model: str):
+    """Cheap availability check: look the model up without generating any tokens."""
+    client = get_client(provider, PROVIDER_KEYS[provider][0])
+    if provider == 'mistral':
+        await client.models.retrieve_async(model_id=model)
+    else:
+        await client.models.retrieve(model)
@@ -0,0 +1,450 @@
+"""
+Offline batch submission through the OpenAI Batch and Anthropic Message Batches APIs.
+
+The task matrix is turned into provider batch JSONL files built from the same
+request parameters as the live calls (build_openai_request, build_claude_request),
+submitted, polled until they end, and the returned responses go through the
+usual parse/validate path into the journal and results CSVs. Requests that
+fail, expire or never come back are dead-lettered like failed live iterations,
+so the end-of-run report and the next run see them.
+
+LocalBatchBackend is a file-based stand-in for both endpoints so the whole flow
+can run without network access.
+"""
+import os
+import json
+import time
+import random
+import logging
+
+from config import CONFIG, QUESTION_RANGES, OPENAI_API_KEYS, ANTHROPIC_API_KEY
+from prompts import GLOBAL_PROMPT_TEMPLATE
+from utils import attach_resume_to_prompt
+from journal import CompletionJournal, prompt_hash
+from dead_letter import DeadLetterStore, report_incomplete_cells
+from parsers import build_result_row
+from result_writer import ResultWriter, open_sinks
+from api_clients import build_openai_request, build_claude_request, CLAUDE_STRUCTURED_OUTPUT_BETA
+from response_cache import get_response_cache, request_cache_key
+from response_archive import get_response_archive
+from client_registry import get_client
+
+logger = logging.getLogger(__name__)
+
+BATCH_PROVIDERS = ('openai', 'anthropic')
+
+
+def openai_batch_line(custom_id: str, create_kwargs: dict) -> dict:
+    """One request line of an OpenAI Batch input file."""
+    return {
+        "custom_id": custom_id,
+        "method": "POST",
+        "url": "/v1/chat/completions",
+        "body": create_kwargs
+    }
+
+
+def anthropic_batch_line(custom_id: str, create_kwargs: dict) -> dict:
+    """One request of an Anthropic Message Batch (betas travel with the batch, not the params)."""
+    params = dict(create_kwargs)
+    params.pop("betas", None)
+    return {"custom_id": custom_id, "params": params}
+
+
+def parse_openai_result(record: dict):
+    """(custom_id, response text or None, error or None) from an OpenAI Batch output line."""
+    custom_id = record.get("custom_id")
+    response = record.get("response") or {}
+    if record.get("error") or response.get("status_code") != 200:
+        return custom_id, None, str(record.get("error") or response.get("body"))
+    try:
+        return custom_id, response["body"]["choices"][0]["message"]["content"], None
+    except (KeyError, IndexError, TypeError) as e:
+        return custom_id, None, f"Malformed batch result: {e}"
+
+
+def parse_anthropic_result(record: dict):
+    """(custom_id, response text or None, error or None) from a Message Batch result."""
+    custom_id = record.get("custom_id")
+    result = record.get("result") or {}
+    if result.get("type") != "succeeded":
+        return custom_id, None, str(result.get("error") or result.get("type"))
+    try:
+        return custom_id, result["message"]["content"][0]["text"], None
+    except (KeyError, IndexError, TypeError) as e:
+        return custom_id, None, f"Malformed batch result: {e}"
+
+
+class OpenAIBatchBackend:
+    """OpenAI Batch API: upload a JSONL file, create a batch, download the output file."""
+
+    provider = 'openai'
+
+    def __init__(self):
+        self.client = get_client('openai', OPENAI_API_KEYS[0], asynchronous=False)
+
+    def submit(self, jsonl_path: str) -> str:
+        with open(jsonl_path, 'rb') as f:
+            input_file = self.client.files.create(file=f, purpose="batch")
+        batch = self.client.batches.create(
+            input_file_id=input_file.id,
+            endpoint="/v1/chat/completions",
+            completion_window="24h"
+        )
+        return batch.id
+
+    def is_done(self, batch_id: str) -> bool:
+        batch = self.client.batches.retrieve(batch_id)
+        logger.info(f"OpenAI batch {batch_id}: {batch.status} ({batch.request_counts})")
+        return batch.status in ("completed", "failed", "expired", "cancelled")
+
+    def results(self, batch_id: str):
+        batch = self.client.batches.retrieve(batch_id)
+        for file_id in (batch.output_file_id, batch.error_file_id):
+            if not file_id:
+                continue
+            for line in self.client.files.content(file_id).text.splitlines():
+                if line.strip():
+                    yield parse_openai_result(json.loads(line))
+
+
+class AnthropicBatchBackend:
+    """Anthropic Message Batches API (beta endpoint when structured outputs are requested)."""
+
+    provider = 'anthropic'
+
+    def __init__(self):
+        self.client = get_client('anthropic', ANTHROPIC_API_KEY, asynchronous=False)
+
+    def submit(self, jsonl_path: str) -> str:
+        with open(jsonl_path, 'r', encoding='utf-8') as f:
+            requests = [json.loads(line) for line in f if line.strip()]
+        if any("output_format" in r["params"] for r in requests):
+            batch = self.client.beta.messages.batches.create(
+                requests=requests, betas=[CLAUDE_STRUCTURED_OUTPUT_BETA]
+            )
+        else:
+            batch = self.client.messages.batches.create(requests=requests)
+        return batch.id
+
+    def is_done(self, batch_id: str) -> bool:
+        batch = self.client.messages.batches.retrieve(batch_id)
+        logger.info(f"Anthropic batch {batch_id}: {batch.processing_status} ({batch.request_counts})")
+        return batch.processing_status == "ended"
+
+    def results(self, batch_id: str):
+        for entry in self.client.messages.batches.results(batch_id):
+            yield parse_anthropic_result(entry.model_dump())
+
+
+def local_response(custom_id: str) -> str:
+    """Deterministic, schema-valid response used by the local stand-in."""
+    rng = random.Random(custom_id)
+    scores = [rng.randint(low, high) for _, (low, high) in sorted(QUESTION_RANGES.items())]
+    return json.dumps({
+        "scores": scores,
+        "manipulation_check": rng.choice(["YES", "NO"]),
+        "thought_process": "Local batch stand-in response."
+    })
+
+
+class LocalBatchBackend:
+    """File-based stand-in for the provider batch endpoints.
+
+    A submitted batch is copied into `directory/<batch_id>/input.jsonl`; the
+    first poll writes `output.jsonl` in the provider's own result format
+    using `responder(custom_id, request_line)`, so result handling is the
+    same code path as for real batches.
+    """
+
+    def __init__(self, provider: str, directory: str, responder=None):
+        self.provider = provider
+        self.directory = directory
+        self.responder = responder or (lambda custom_id, request_line: local_response(custom_id))
+        os.makedirs(directory, exist_ok=True)
+
+    def submit(self, jsonl_path: str) -> str:
+        batch_id = f"local_{self.provider}_{int(time.time())}_{len(os.listdir(self.directory)):04d}"
+        batch_dir = os.path.join(self.directory, batch_id)
+        os.makedirs(batch_dir)
+        with open(jsonl_path, 'r', encoding='utf-8') as src, \
+                open(os.path.join(batch_dir, 'input.jsonl'), 'w', encoding='utf-8') as dst:
+            dst.write(src.read())
+        return batch_id
+
+    def is_done(self, batch_id: str) -> bool:
+        batch_dir = os.path.join(self.directory, batch_id)
+        output_path = os.path.join(batch_dir, 'output.jsonl')
+        if os.path.exists(output_path):
+            return True
+
+        with open(os.path.join(batch_dir, 'input.jsonl'), 'r', encoding='utf-8') as f:
+            request_lines = [json.loads(line) for line in f if line.strip()]
+
+        with open(output_path + '.tmp', 'w', encoding='utf-8') as out:
+            for request_line in request_lines:
+                custom_id = request_line["custom_id"]
+                text = self.responder(custom_id, request_line)
+                if self.provider == 'openai':
+                    record = {
+                        "id": f"batch_req_{custom_id}",
+                        "custom_id": custom_id,
+                        "response": {
+                            "status_code": 200,
+                            "body": {"choices": [{"index": 0, "message": {"role": "assistant", "content": text}}]}
+                        },
+                        "error": None
+                    }
+                else:
+                    record = {
+                        "custom_id": custom_id,
+                        "result": {
+                            "type": "succeeded",
+                            "message": {"role": "assistant", "content": [{"type": "text", "text": text}]}
+                        }
+                    }
+                out.write(json.dumps(record) + '\n')
+        os.replace(output_path + '.tmp', output_path)
+        return True
+
+    def results(self, batch_id: str):
+        parse = parse_openai_result if self.provider == 'openai' else parse_anthropic_result
+        with open(os.path.join(self.directory, batch_id, 'output.jsonl'), 'r', encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    yield parse(json.loads(line))
+
+
+def make_backend(provider: str, backend_kind: str, batch_dir: str):
+    if backend_kind == 'local':
+        return LocalBatchBackend(provider, os.path.join(batch_dir, 'local_endpoint'))
+    if provider == 'openai':
+        return OpenAIBatchBackend()
+    return AnthropicBatchBackend()
+
+
+def build_batch_requests(tasks, journal: CompletionJournal):
+    """Batch request lines per provider for every iteration the journal is missing.
+
+    Returns ({provider: [request line, ...]}, {custom_id: request metadata}).
+    """
+    requests_by_provider = {provider: [] for provider in BATCH_PROVIDERS}
+    request_index = {}
+    prompts = {}
+
+    for task in tasks:
+        provider = task['provider']
+        if provider not in BATCH_PROVIDERS:
+            continue
+
+        if task['file_name'] not in prompts:
+            prompts[task['file_name']] = attach_resume_to_prompt(task['resume_text'], GLOBAL_PROMPT_TEMPLATE)
+        prompt = prompts[task['file_name']]
+        digest = prompt_hash(prompt)
+
+        if provider == 'openai':
+            create_kwargs = build_openai_request(prompt, task['model'])
+        else:
+            create_kwargs = build_claude_request(prompt, task['model'])
+
+        done = journal.completed_iterations(task['file_name'], task['model'], digest)
+        for iteration in range(CONFIG['iterations_per_file']):
+            if iteration in done:
+                continue
+            # Anthropic custom_ids allow only [a-zA-Z0-9_-]{1,64}, so the task lives in the index
+            custom_id = f"req-{len(request_index)}"
+            request_index[custom_id] = {
+                'provider': provider,
+                'file_name': task['file_name'],
+                'model': task['model'],
+                'iteration': iteration,
+                'prompt_hash': digest,
+                'output_directory': task['output_directory'],
+                'cache_key': request_cache_key(provider, create_kwargs, iteration)
+            }
+            if provider == 'openai':
+                requests_by_provider[provider].append(openai_batch_line(custom_id, create_kwargs))
+            else:
+                requests_by_provider[provider].append(anthropic_batch_line(custom_id, create_kwargs))
+
+    return requests_by_provider, request_index
+
+
+def write_batch_files(provider: str, request_lines, batch_dir: str):
+    """Split a provider's requests into JSONL files of at most CONFIG['batch_max_requests'] lines.
+
+    Returns [(path, custom_ids in the file), ...].
+    """
+    files = []
+    chunk_size = CONFIG['batch_max_requests']
+    stamp = time.strftime('%Y%m%d_%H%M%S')
+    for chunk_number, start in enumerate(range(0, len(request_lines), chunk_size)):
+        path = os.path.join(batch_dir, f"{provider}_{stamp}_{chunk_number:03d}.jsonl")
+        with open(path, 'w', encoding='utf-8') as f:
+            for line in request_lines[start:start + chunk_size]:
+                f.write(json.dumps(line, ensure_ascii=False) + '\n')
+        files.append((path, [line['custom_id'] for line in request_lines[start:start + chunk_size]]))
+    return files
+
+
+def write_request_index(index_path: str, submitted, request_index: dict):
+    """Atomically (re)write the batches submitted so far and the custom_id mapping."""
+    with open(index_path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump({
+            'batches': [[backend.provider, batch_id] for backend, batch_id in submitted],
+            'requests': request_index
+        }, f)
+    os.replace(index_path + '.tmp', index_path)
+
+
+def batch_error_class(error: str) -> str:
+    """Dead-letter error class of a failed batch request."""
+    return 'batch_expired' if 'expired' in str(error).lower() else 'batch_failed'
+
+
+def collect_results(backend, batch_id: str, request_index: dict, journal: CompletionJournal,
+                    dead_letters: DeadLetterStore):
+    """Parse a finished batch's responses into journal rows; returns (ok, failed) counts.
+
+    Failed, expired and unparseable requests, and requests of this batch that
+    have no result at all, are recorded in the dead-letter store.
+    """
+    cache = get_response_cache()
+    archive = get_response_archive()
+    succeeded = 0
+    failed = 0
+
+    def dead_letter(meta: dict, error_class: str, error, raw_response: str = None):
+        dead_letters.record_failure(meta['file_name'], meta['model'], meta['prompt_hash'], meta['iteration'],
+                                    error_class, str(error), raw_response)
+
+    unanswered = {custom_id for custom_id, meta in request_index.items() if meta.get('batch_id') == batch_id}
+    for custom_id, text, error in backend.results(batch_id):
+        meta = request_index.get(custom_id)
+        if meta is None:
+            logger.warning(f"Batch {batch_id} returned unknown custom_id {custom_id}")
+            continue
+        unanswered.discard(custom_id)
+        if meta['iteration'] in journal.completed_iterations(meta['file_name'], meta['model'], meta['prompt_hash']):
+            continue
+        if text is None:
+            logger.error(f"Batch request {custom_id} ({meta['model']}, {meta['file_name']}, iteration {meta['iteration']}) failed: {error}")
+            dead_letter(meta, batch_error_class(error), error)
+            failed += 1
+            continue
+
+        if cache is not None:
+            cache.put(meta['cache_key'], text)
+        if archive is not None:
+            archive.record(meta['file_name'], meta['model'], meta['prompt_hash'], meta['iteration'], text)
+
+        try:
+            result = build_result_row(meta['model'], meta['iteration'], text)
+        except ValueError as ve:
+            logger.error(f"Validation error for iteration {meta['iteration']}, model {meta['model']}: {ve}")
+            logger.debug(f"Raw response: {text[:200]}...")
+            dead_letter(meta, 'validation', ve, text)
+            failed += 1
+            continue
+
+        journal.record_result(meta['file_name'], meta['model'], meta['prompt_hash'], result)
+        dead_letters.resolve(meta['file_name'], meta['model'], meta['prompt_hash'], meta['iteration'])
+        succeeded += 1
+
+    for custom_id in sorted(unanswered):
+        meta = request_index[custom_id]
+        if meta['iteration'] in journal.completed_iterations(meta['file_name'], meta['model'], meta['prompt_hash']):
+            continue
+        dead_letter(meta, 'batch_failed', f"No result for {custom_id} in batch {batch_id}")
+        failed += 1
+    if unanswered:
+        logger.error(f"Batch {batch_id} ended without a result for {len(unanswered)} requests")
+
+    return succeeded, failed
+
+
+def poll_and_collect(submitted, request_index: dict, journal: CompletionJournal, dead_letters: DeadLetterStore):
+    """Poll submitted (backend, batch_id) pairs until all end, collecting each as it finishes."""
+    pending = list(submitted)
+    total_ok = 0
+    total_failed = 0
+    while pending:
+        still_running = []
+        for backend, batch_id in pending:
+            if backend.is_done(batch_id):
+                ok, failed = collect_results(backend, batch_id, request_index, journal, dead_letters)
+                total_ok += ok
+                total_failed += failed
+                logger.info(f"Collected {backend.provider} batch {batch_id}: {ok} results, {failed} failed")
+            else:
+                still_running.append((backend, batch_id))
+        pending = still_running
+        if pending:
+            time.sleep(CONFIG['batch_poll_interval'])
+    return total_ok, total_failed
+
+
+def batch_tasks(tasks) -> list:
+    return [task for task in tasks if task['provider'] in BATCH_PROVIDERS]
+
+
+def write_batch_csvs(tasks, journal: CompletionJournal, output_base: str):
+    """Write journaled batch results to the per-resume CSVs (and any enabled sinks)."""
+    writer = ResultWriter(journal, open_sinks(output_base))
+    try:
+        for task in batch_tasks(tasks):
+            digest = prompt_hash(attach_resume_to_prompt(task['resume_text'], GLOBAL_PROMPT_TEMPLATE))
+            writer.submit_journaled(task['output_directory'], task['file_name'], task['model'], digest)
+    finally:
+        writer.close()
+
+
+def run_batch_mode(tasks, journal: CompletionJournal, dead_letters: DeadLetterStore, output_base: str,
+                   backend_kind: str = 'provider', resume_index: str = None):
+    """Submit the missing iterations as provider batches, wait for them, and write the results.
+    
+    The request index (batches/request_index_*.json) is rewritten after every
+    submit, so a run interrupted at any point can be collected. With
+    `resume_index` (an index written by an earlier run), nothing is submitted;
+    the batches recorded there are polled and collected instead.
+    """
+    batch_dir = os.path.join(output_base, 'batches')
+    os.makedirs(batch_dir, exist_ok=True)
+
+    if resume_index:
+        with open(resume_index, 'r', encoding='utf-8') as f:
+            saved = json.load(f)
+        request_index = saved['requests']
+        submitted = [(make_backend(provider, backend_kind, batch_dir), batch_id) for provider, batch_id in saved['batches']]
+        logger.info(f"Resuming {len(submitted)} batches from {resume_index}")
+        total_ok, total_failed = poll_and_collect(submitted, request_index, journal, dead_letters)
+        write_batch_csvs(tasks, journal, output_base)
+        logger.info(f"Batch mode finished: {total_ok} results, {total_failed} failed")
+        report_incomplete_cells(batch_tasks(tasks), journal, dead_letters)
+        return
+
+    skipped = [task for task in tasks if task['provider'] not in BATCH_PROVIDERS]
+    if skipped:
+        logger.info(f"Batch mode skips {len(skipped)} tasks for providers without batch support; run them interactively")
+
+    requests_by_provider, request_index = build_batch_requests(tasks, journal)
+
+    # Persisted after every submit so an interrupted run can collect with --resume-batch
+    index_path = os.path.join(batch_dir, f"request_index_{time.strftime('%Y%m%d_%H%M%S')}.json")
+    submitted = []
+    for provider, request_lines in requests_by_provider.items():
+        if not request_lines:
+            continue
+        backend = make_backend(provider, backend_kind, batch_dir)
+        for path, custom_ids in write_batch_files(provider, request_lines, batch_dir):
+            batch_id = backend.submit(path)
+            logger.info(f"Submitted {provider} batch {batch_id} from {path}")
+            submitted.append((backend, batch_id))
+            for custom_id in custom_ids:
+                request_index[custom_id]['batch_id'] = batch_id
+            write_request_index(index_path, submitted, request_index)
+
+    total_ok, total_failed = poll_and_collect(submitted, request_index, journal, dead_letters)
+    write_batch_csvs(tasks, journal, output_base)
+    logger.info(f"Batch mode finished: {total_ok} results, {total_failed} failed, index at {index_path}")
+    report_incomplete_cells(batch_tasks(tasks), journal, dead_letters)
@@ -0,0 +1,114 @@
+"""
+Microbenchmark: per-request overhead of a new SDK client per call vs the pooled registry client.
+
+Runs a local keep-alive HTTP server that answers chat-completion / messages
+requests instantly, then sends the same requests two ways:
+
+- fresh: build a new client for every request (what get_claude_score and
+  get_mistral_score used to do), close it afterwards
+- pooled: one client from client_registry.build_client reused for every request
+
+Plain HTTP on localhost has no TLS handshake or network round trip, so the
+saving measured here is a lower bound on what a real endpoint gives.
+
+Usage:
+    python benchmarks/bench_client_pool.py [--provider openai|anthropic|mistral] [--requests 200]
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from client_registry import build_client  # noqa: E402
+
+CHAT_COMPLETION = {
+    "id": "chatcmpl-bench", "object": "chat.completion", "created": 0, "model": "bench",
+    "choices": [{"index": 0, "finish_reason": "stop",
+                 "message": {"role": "assistant", "content": "{\"scores\": []}"}}],
+    "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2}
+}
+ANTHROPIC_MESSAGE = {
+    "id": "msg_bench", "type": "message", "role": "assistant", "model": "bench",
+    "content": [{"type": "text", "text": "{\"scores\": []}"}],
+    "stop_reason": "end_turn", "stop_sequence": None,
+    "usage": {"input_tokens": 1, "output_tokens": 1}
+}
+
+
+class BenchHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep connections alive between requests
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        payload = ANTHROPIC_MESSAGE if self.path.endswith('/messages') else CHAT_COMPLETION
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+async def send(provider: str, client):
+    messages = [{"role": "user", "content": "ping"}]
+    if provider == 'openai':
+        await client.chat.completions.create(model="bench", messages=messages)
+    elif provider == 'anthropic':
+        await client.messages.create(model="bench", max_tokens=1, messages=messages)
+    else:
+        await client.chat.complete_async(model="bench", messages=messages)
+
+
+async def run_fresh(provider: str, base_url: str, n: int) -> float:
+    start = time.perf_counter()
+    for _ in range(n):
+        client, http_client = build_client(provider, "bench-key", True, base_url)
+        await send(provider, client)
+        await http_client.aclose()
+    return (time.perf_counter() - start) / n
+
+
+async def run_pooled(provider: str, base_url: str, n: int) -> float:
+    client, http_client = build_client(provider, "bench-key", True, base_url)
+    await send(provider, client)  # warm the connection like a long-running pipeline would
+    start = time.perf_counter()
+    for _ in range(n):
+        await send(provider, client)
+    elapsed = (time.perf_counter() - start) / n
+    await http_client.aclose()
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--provider', choices=['openai', 'anthropic', 'mistral'], default='openai')
+    parser.add_argument('--requests', type=int, default=200)
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), BenchHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    root = f"http://127.0.0.1:{server.server_address[1]}"
+    base_url = root if args.provider != 'openai' else root + "/v1"
+
+    fresh = asyncio.run(run_fresh(args.provider, base_url, args.requests))
+    pooled = asyncio.run(run_pooled(args.provider, base_url, args.requests))
+    server.shutdown()
+
+    print(f"{args.provider}: {args.requests} requests against {root}")
+    print(f"  new client per request: {fresh * 1000:8.2f} ms/request")
+    print(f"  pooled client:          {pooled * 1000:8.2f} ms/request")
+    print(f"  overhead saved:         {(fresh - pooled) * 1000:8.2f} ms/request "
+          f"({(fresh - pooled) * 16800:.0f} s over a 16,800-request run, before TLS savings)")
+
+
+if __name__ == "__main__":
+    main()
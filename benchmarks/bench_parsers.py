@@ -0,0 +1,169 @@
+"""
+Microbenchmark: response parser throughput, fallback paths and allocations.
+
+Runs the parsers over a fixture corpus of OpenAI (structured outputs), Claude
+(schema and plain text) and Mistral (q1..q17, nested resume_evaluation)
+responses, plus malformed and adversarial cases. The corpus lives in
+benchmarks/fixtures/parser_corpus.jsonl. Raw responses from a run's
+response archive can be added with --archive. Reports:
+
+- throughput of decode_response, build_result_row and the per-field wrappers
+- a histogram of which branch produced each field (decoder *_path fields)
+- peak traced memory and blocks still held after each parser (tracemalloc)
+- fixtures whose decoded result no longer matches the recorded expectation
+
+Exits non-zero on a fixture mismatch, so it can gate a parser change.
+
+Usage:
+    python benchmarks/bench_parsers.py [--repeat 200] [--archive OUTPUT_DIR/response_archive] [--archive-limit 20000]
+"""
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import tracemalloc
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from decoder import decode_response  # noqa: E402
+from parsers import parse_scores, parse_manipulation_check, parse_thought_process, build_result_row  # noqa: E402
+from response_archive import ResponseArchive  # noqa: E402
+
+CORPUS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'parser_corpus.jsonl')
+
+
+def load_corpus(path: str) -> list:
+    with open(path, 'r', encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def load_archive(directory: str, limit: int) -> list:
+    """Raw responses from a response archive, as corpus entries without expectations."""
+    archive = ResponseArchive(directory)
+    try:
+        return [
+            {'name': f"{entry['file']}/{entry['model']}/{entry['iteration']}", 'kind': 'archive',
+             'provider': entry['model'], 'response': archive.read(entry)['response']}
+            for entry in archive.entries[:limit]
+        ]
+    finally:
+        archive.close()
+
+
+def build_row(text: str):
+    return build_result_row('bench', 0, text)
+
+
+PARSERS = {
+    'decode_response': decode_response,
+    'build_result_row': build_row,
+    'parse_scores': parse_scores,
+    'parse_manipulation_check': parse_manipulation_check,
+    'parse_thought_process': parse_thought_process,
+}
+
+
+def run_parser(parse, texts):
+    for text in texts:
+        try:
+            parse(text)
+        except ValueError:
+            pass
+
+
+def throughput(parse, texts, repeat: int) -> float:
+    """Seconds per call, best of `repeat` passes over the corpus."""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run_parser(parse, texts)
+        best = min(best, time.perf_counter() - start)
+    return best / len(texts)
+
+
+def allocations(parse, texts):
+    """(peak KiB, blocks still held) for one pass over the corpus."""
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    tracemalloc.reset_peak()
+    run_parser(parse, texts)
+    _, peak = tracemalloc.get_traced_memory()
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    held = sum(stat.count_diff for stat in after.compare_to(before, 'filename') if stat.count_diff > 0)
+    return peak / 1024, held
+
+
+def check_expectations(corpus: list) -> list:
+    mismatches = []
+    for entry in corpus:
+        expected = entry.get('expected')
+        if expected is None:
+            continue
+        decoded = decode_response(entry['response'])
+        actual = {'scores': decoded.scores, 'manipulation_check': decoded.manipulation_check,
+                  'thought_process_chars': len(decoded.thought_process)}
+        if actual != expected:
+            mismatches.append((entry['name'], expected, actual))
+    return mismatches
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--corpus', default=CORPUS_PATH)
+    parser.add_argument('--archive', help="response archive directory to add real responses from")
+    parser.add_argument('--archive-limit', type=int, default=20000)
+    parser.add_argument('--repeat', type=int, default=200, help="timed passes per parser (best is reported)")
+    args = parser.parse_args()
+    # The wrappers log every missing field; that would dominate the timings
+    logging.disable(logging.WARNING)
+
+    corpus = load_corpus(args.corpus)
+    if args.archive:
+        corpus += load_archive(args.archive, args.archive_limit)
+    texts = [entry['response'] for entry in corpus]
+    total_bytes = sum(len(text.encode('utf-8')) for text in texts)
+    kinds = Counter(entry['kind'] for entry in corpus)
+    print(f"Corpus: {len(corpus)} responses, {total_bytes / 1024:.0f} KiB ({dict(kinds)})")
+
+    print(f"\n{'parser':26} {'us/call':>9} {'calls/s':>10} {'MB/s':>7} {'peak KiB':>9} {'held blocks':>12}")
+    repeat = max(1, args.repeat if len(corpus) < 1000 else args.repeat // 50)
+    for name, parse in PARSERS.items():
+        per_call = throughput(parse, texts, repeat)
+        peak_kib, held = allocations(parse, texts)
+        mb_per_s = total_bytes / (per_call * len(texts)) / 1e6
+        print(f"{name:26} {per_call * 1e6:9.1f} {1 / per_call:10.0f} {mb_per_s:7.1f} {peak_kib:9.1f} {held:12d}")
+
+    histograms = {'scores': Counter(), 'manipulation_check': Counter(), 'thought_process': Counter()}
+    for text in texts:
+        decoded = decode_response(text)
+        histograms['scores'][decoded.scores_path] += 1
+        histograms['manipulation_check'][decoded.manipulation_check_path] += 1
+        histograms['thought_process'][decoded.thought_process_path] += 1
+    for field, histogram in histograms.items():
+        print(f"\n{field} paths:")
+        for path, count in histogram.most_common():
+            print(f"  {path:24} {count:7d}  {'#' * max(1, round(40 * count / len(texts)))}")
+
+    slowest = sorted(
+        ((throughput(decode_response, [entry['response']], 20), entry['name']) for entry in corpus[:1000]),
+        reverse=True
+    )[:5]
+    print("\nslowest responses (decode_response):")
+    for per_call, name in slowest:
+        print(f"  {name:40} {per_call * 1e6:9.1f} us")
+
+    mismatches = check_expectations(corpus)
+    if mismatches:
+        print(f"\n{len(mismatches)} fixtures no longer decode as recorded:")
+        for name, expected, actual in mismatches:
+            print(f"  {name}: expected {expected}, got {actual}")
+        sys.exit(1)
+    print(f"\nAll {sum('expected' in entry for entry in corpus)} fixtures decode as recorded")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""
+Per-model circuit breakers.
+
+A model whose requests keep failing for reasons other than load
+(retired or misconfigured model ID, auth errors, connection failures)
+trips its breaker after CONFIG['circuit_breaker_threshold'] consecutive
+failed attempts. While open, its requests fail immediately with
+CircuitOpenError instead of sitting in retry backoff; every
+CONFIG['circuit_breaker_reset_seconds'] one trial request is let through
+(half-open) and a success closes the breaker again. Rate limits and
+overload errors (429, 5xx/529) are left to the adaptive concurrency limit
+and the retry engine: a few 529s during one request's retries say the model
+is busy, not broken. Models that fail the preflight probe in main.py are
+disabled for the whole run.
+"""
+import time
+import threading
+import logging
+
+from config import CONFIG
+
+logger = logging.getLogger(__name__)
+
+# Outcomes that say nothing about the model itself: error classes from retry.classify_error
+# (load is handled by AIMD and retries), and 'not_sent' for attempts that never reached it
+# (cancelled, replay cache miss, no usable key)
+IGNORED_ERRORS = ('rate_limit', 'overload', 'quota', 'not_sent')
+# How often a parked caller checks back while another caller's half-open trial is in flight
+TRIAL_POLL_SECONDS = 1.0
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of sending a request to a model whose breaker is open."""
+
+
+class CircuitBreaker:
+    """Closed / open / half-open state for one model."""
+
+    def __init__(self, model: str):
+        self.model = model
+        self.state = 'closed'
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.trial_in_flight = False
+        self.disabled_reason = None
+        self.lock = threading.Lock()
+
+    def before_request(self):
+        """Let a request through, or raise CircuitOpenError."""
+        with self.lock:
+            if self.disabled_reason:
+                raise CircuitOpenError(f"{self.model} disabled: {self.disabled_reason}")
+            if self.state == 'closed':
+                return
+            if self.state == 'open' and time.monotonic() - self.opened_at >= CONFIG['circuit_breaker_reset_seconds']:
+                self.state = 'half_open'
+            if self.state == 'half_open' and not self.trial_in_flight:
+                self.trial_in_flight = True
+                logger.info(f"Circuit for {self.model} half-open, sending a trial request")
+                return
+            raise CircuitOpenError(f"Circuit for {self.model} is open after {self.consecutive_failures} consecutive failures")
+
+    def seconds_until_trial(self):
+        """Seconds until a request may be let through (0 if now), or None if the model is disabled."""
+        with self.lock:
+            if self.disabled_reason:
+                return None
+            if self.state == 'closed':
+                return 0.0
+            if self.state == 'open':
+                return max(0.0, self.opened_at + CONFIG['circuit_breaker_reset_seconds'] - time.monotonic())
+            return min(TRIAL_POLL_SECONDS, CONFIG['circuit_breaker_reset_seconds']) if self.trial_in_flight else 0.0
+
+    def is_closed(self) -> bool:
+        with self.lock:
+            return self.state == 'closed'
+
+    def record_success(self):
+        with self.lock:
+            if self.state != 'closed':
+                logger.info(f"Circuit for {self.model} closed, model is responding again")
+            self.state = 'closed'
+            self.consecutive_failures = 0
+            self.trial_in_flight = False
+
+    def record_failure(self, error_class: str):
+        with self.lock:
+            if error_class in IGNORED_ERRORS:
+                self.trial_in_flight = False
+                return
+            self.consecutive_failures += 1
+            reopen = self.state == 'half_open'
+            self.trial_in_flight = False
+            if reopen or (self.state == 'closed' and self.consecutive_failures >= CONFIG['circuit_breaker_threshold']):
+                self.state = 'open'
+                self.opened_at = time.monotonic()
+                logger.error(
+                    f"Circuit for {self.model} opened after {self.consecutive_failures} consecutive failures "
+                    f"({error_class}); failing its requests for {CONFIG['circuit_breaker_reset_seconds']}s"
+                )
+
+    def disable(self, reason: str):
+        """Open the breaker for the rest of the run (no half-open trials)."""
+        with self.lock:
+            self.disabled_reason = reason
+            self.state = 'open'
+
+
+breakers = {}
+breakers_lock = threading.Lock()
+
+
+def get_circuit_breaker(model: str) -> CircuitBreaker:
+    with breakers_lock:
+        if model not in breakers:
+            breakers[model] = CircuitBreaker(model)
+        return breakers[model]
@@ -0,0 +1,88 @@
+"""
+Pooled, long-lived API clients, one per (provider, API key).
+
+Clients are created once and reused, so every request after the first rides
+an existing keep-alive connection instead of paying for a new connection
+pool, TLS handshake and SDK setup. Lookups are thread-safe; async clients
+serve the asyncio engine and sync clients serve batch mode.
+"""
+import threading
+import logging
+import httpx
+import anthropic
+import openai
+from mistralai import Mistral
+
+from config import CONFIG
+from utils import key_fingerprint
+
+logger = logging.getLogger(__name__)
+
+# (provider, key fingerprint, 'async' | 'sync') -> (SDK client, underlying httpx client)
+clients = {}
+clients_lock = threading.Lock()
+
+
+def http_limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=CONFIG['http_max_connections'],
+        max_keepalive_connections=CONFIG['http_max_keepalive_connections'],
+        keepalive_expiry=CONFIG['http_keepalive_expiry']
+    )
+
+
+def http_timeout() -> httpx.Timeout:
+    return httpx.Timeout(CONFIG['http_timeout'], connect=CONFIG['http_connect_timeout'])
+
+
+def build_client(provider: str, api_key: str, asynchronous: bool, base_url: str = None):
+    """Create an SDK client backed by a pooled httpx client; returns (client, http_client).
+    
+    `base_url` overrides the provider endpoint (used by the benchmarks' local server).
+    """
+    if provider == 'openai':
+        if asynchronous:
+            http_client = openai.DefaultAsyncHttpxClient(limits=http_limits(), timeout=http_timeout())
+            return openai.AsyncOpenAI(api_key=api_key, base_url=base_url, http_client=http_client), http_client
+        http_client = openai.DefaultHttpxClient(limits=http_limits(), timeout=http_timeout())
+        return openai.OpenAI(api_key=api_key, base_url=base_url, http_client=http_client), http_client
+
+    if provider == 'anthropic':
+        if asynchronous:
+            http_client = anthropic.DefaultAsyncHttpxClient(limits=http_limits(), timeout=http_timeout())
+            return anthropic.AsyncAnthropic(api_key=api_key, base_url=base_url, http_client=http_client), http_client
+        http_client = anthropic.DefaultHttpxClient(limits=http_limits(), timeout=http_timeout())
+        return anthropic.Anthropic(api_key=api_key, base_url=base_url, http_client=http_client), http_client
+
+    if provider == 'mistral':
+        if asynchronous:
+            http_client = httpx.AsyncClient(limits=http_limits(), timeout=http_timeout(), follow_redirects=True)
+            return Mistral(api_key=api_key, server_url=base_url, async_client=http_client), http_client
+        http_client = httpx.Client(limits=http_limits(), timeout=http_timeout(), follow_redirects=True)
+        return Mistral(api_key=api_key, server_url=base_url, client=http_client), http_client
+
+    raise ValueError(f"Unknown provider: {provider}")
+
+
+def get_client(provider: str, api_key: str, asynchronous: bool = True):
+    """Return the shared client for a provider and key, creating it on first use."""
+    registry_key = (provider, key_fingerprint(api_key), 'async' if asynchronous else 'sync')
+    with clients_lock:
+        entry = clients.get(registry_key)
+        if entry is None:
+            entry = build_client(provider, api_key, asynchronous)
+            clients[registry_key] = entry
+            logger.info(f"Created pooled {registry_key[2]} {provider} client for key {registry_key[1]}")
+    return entry[0]
+
+
+async def close_clients():
+    """Close every pooled connection (async and sync) at the end of a run."""
+    with clients_lock:
+        entries = list(clients.values())
+        clients.clear()
+    for _, http_client in entries:
+        if isinstance(http_client, httpx.AsyncClient):
+            await http_client.aclose()
+        else:
+            http_client.close()
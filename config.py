@@ -6,13 +6,84 @@ load_dotenv()
 
 CONFIG = {
     'iterations_per_file': 100,
-    'batch_size': 15,
-    'max_workers': 5,
+    # 'resume_first' (original layout) or 'prefix_first' (question block first, for provider prompt caching)
+    'prompt_layout': 'resume_first',
+    # Requests kept in flight per (file, model) task; refilled as each one finishes
+    'window_size': 15,
+    # Upper bound on requests in flight per provider across every (file, model) task
+    'provider_concurrency': {
+        'openai': 64,
+        'anthropic': 32,
+        'mistral': 32
+    },
     'num_questions': 17,
-    'retry_delay': 60,
+    # Attempts per request; transient errors back off with decorrelated jitter between these delays
+    # unless the server says how long to wait (Retry-After / rate-limit reset headers)
     'max_retries': 10,
-    'exponential_backoff_base': 2,
-    'exponential_backoff_max': 300
+    'retry_base_delay': 1,
+    'retry_max_delay': 60,
+    # Per-model circuit breaker: consecutive non-rate-limit failures before it opens, seconds until a
+    # half-open trial request; and the timeout for each model's preflight probe in main.py
+    'circuit_breaker_threshold': 5,
+    'circuit_breaker_reset_seconds': 120,
+    # Seconds a (file, model) task may spend parked on an open circuit, in total, before its
+    # remaining iterations are dead-lettered for a later run
+    'circuit_breaker_max_park_seconds': 1800,
+    'preflight_timeout': 30,
+    # Dead-lettered iterations of a cell are retried after its main pass: number of passes,
+    # seconds to wait before each pass, and requests in flight during a pass
+    'dead_letter_retry_passes': 2,
+    'dead_letter_retry_delay': 30,
+    'dead_letter_retry_window': 2,
+    # Fraction of each RATE_LIMITS budget the limiter allows, to stay just under quota
+    'rate_limit_headroom': 0.9,
+    # fsync the completion journal after every record so a crash loses no paid responses
+    'journal_fsync': True,
+    # Streaming CSV writer: flush after this many queued rows or seconds, whichever comes first
+    'result_flush_rows': 20,
+    'result_flush_seconds': 2,
+    # Optional Parquet store (needs pyarrow) next to the CSVs, partitioned by provider/model/resume;
+    # a partition's buffered rows are written as one file once it holds parquet_max_rows_per_file rows
+    'parquet_sink': False,
+    'parquet_dir': 'results_parquet',
+    'parquet_max_rows_per_file': 100,
+    'parquet_row_group_size': 10000,
+    # SQLite run database (WAL) in the output directory, queried live by `python results_db.py`; None disables it
+    'results_db': 'results.sqlite',
+    'results_db_commit_rows': 200,
+    'results_db_commit_seconds': 1,
+    # Archive of every raw response (gzip segments + offset index) for offline re-parsing
+    'response_archive': True,
+    'response_archive_dir': 'response_archive',
+    'response_archive_segment_bytes': 64 * 1024 ** 2,
+    # Raw response cache: 'readwrite', 'replay' (no network, misses fail) or 'off'
+    'response_cache_mode': 'readwrite',
+    'response_cache_dir': 'response_cache',
+    'response_cache_max_bytes': 2 * 1024 ** 3,
+    # Batch mode (python main.py --mode batch): requests per submitted batch file, seconds between polls
+    'batch_max_requests': 5000,
+    'batch_poll_interval': 60,
+    # Connection pool per (provider, key) client in client_registry.py
+    'http_max_connections': 200,
+    'http_max_keepalive_connections': 100,
+    'http_keepalive_expiry': 60,
+    'http_timeout': 600,
+    'http_connect_timeout': 10,
+    # Key pool: default bench time for a throttled key without reset headers, and for a key out of quota
+    'key_throttle_seconds': 10,
+    'key_exhausted_cooldown': 3600,
+    # AIMD concurrency per (provider, model), inside provider_concurrency: starting limit, bounds,
+    # additive step per healthy window, cut on 429/overload, and how far p95 latency may rise
+    # above the best seen (or the window error rate may reach) before growth stops
+    'adaptive_concurrency': {
+        'initial': 8,
+        'min': 1,
+        'max': 64,
+        'increase': 1,
+        'decrease_factor': 0.5,
+        'latency_tolerance': 2.0,
+        'max_error_rate': 0.05
+    }
 }
 
 QUESTION_RANGES = {
@@ -43,10 +114,24 @@ CLAUDE_MODELS = [
     "claude-sonnet-4-20250514",        # Mapped from claude-3-sonnet (uses GPT-3.5 style JSON instructions - Sonnet 4, not 4.5)
     "claude-3-5-haiku-20241022"        # Mapped from claude-3-haiku (uses GPT-3.5 style JSON instructions)
 ]
-OPENAI_API_KEYS = [
-    os.getenv("OPENAI_API_KEY"),
-    os.getenv("OPENAI_BACKUP_KEY")
-]
-ANTHROPIC_API_KEY = os.getenv("CLAUDE_API_KEY")
-MISTRAL_API_KEY = os.getenv("MISTRAL_API_KEY")
+# Per-key quotas enforced client-side by rate_limiter.py; omit a provider to disable limiting
+RATE_LIMITS = {
+    'openai': {'requests_per_minute': 5000, 'tokens_per_minute': 2000000},
+    'anthropic': {'requests_per_minute': 1000, 'tokens_per_minute': 400000},
+    'mistral': {'requests_per_minute': 300, 'tokens_per_minute': 500000}
+}
+
+
+def collect_api_keys(*env_names):
+    """Non-empty keys from the given environment variables (or [None] to let the SDK read its default)."""
+    keys = [os.getenv(name) for name in env_names]
+    return [key for key in keys if key] or [None]
+
+
+# Every key listed here is load-balanced by key_pool.py
+OPENAI_API_KEYS = collect_api_keys("OPENAI_API_KEY", "OPENAI_BACKUP_KEY", "OPENAI_API_KEY_3", "OPENAI_API_KEY_4")
+ANTHROPIC_API_KEYS = collect_api_keys("CLAUDE_API_KEY", "CLAUDE_API_KEY_2", "CLAUDE_API_KEY_3", "CLAUDE_API_KEY_4")
+MISTRAL_API_KEYS = collect_api_keys("MISTRAL_API_KEY", "MISTRAL_API_KEY_2", "MISTRAL_API_KEY_3", "MISTRAL_API_KEY_4")
+ANTHROPIC_API_KEY = ANTHROPIC_API_KEYS[0]
+MISTRAL_API_KEY = MISTRAL_API_KEYS[0]
 
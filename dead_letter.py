@@ -0,0 +1,144 @@
+"""Dead-letter store for iterations that failed to produce a usable result.
+
+A failed iteration (exception, null response, or a response that does not
+parse or validate) is appended here with its error class, error message and
+raw response, instead of silently disappearing from the CSV. process_file
+retries a cell's dead letters in a throttled pass once its main pass has
+drained, and a later run retries whatever is still pending. An iteration
+that eventually succeeds gets a 'resolved' record. Like the journal, the
+store is written from a worker thread during a run, off the event loop.
+"""
+import os
+import json
+import time
+import threading
+import logging
+from collections import defaultdict
+
+from config import CONFIG
+
+logger = logging.getLogger(__name__)
+
+DEAD_LETTER_FILE_NAME = 'dead_letters.jsonl'
+
+
+class DeadLetterStore:
+    """Append-only record of failed iterations, loaded back on startup."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.lock = threading.Lock()
+        # (file_name, model, prompt_hash) -> {iteration: latest failure record}
+        self.pending_failures = defaultdict(dict)
+        self.load()
+        self.handle = open(path, 'a', encoding='utf-8')
+
+    def load(self):
+        """Replay the file, ignoring a torn final line from a crash."""
+        if not os.path.exists(self.path):
+            return
+
+        with open(self.path, 'r', encoding='utf-8') as f:
+            content = f.read()
+
+        for line in content.splitlines():
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                logger.warning(f"Skipping unreadable dead-letter line in {self.path}")
+                continue
+            key = (record['file'], record['model'], record['prompt_hash'])
+            if record['type'] == 'failure':
+                self.pending_failures[key][record['iteration']] = record
+            elif record['type'] == 'resolved':
+                self.pending_failures[key].pop(record['iteration'], None)
+
+        if content and not content.endswith('\n'):
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write('\n')
+
+        pending = sum(len(failures) for failures in self.pending_failures.values())
+        logger.info(f"Loaded {pending} pending dead letters from {self.path}")
+
+    def append(self, record: dict):
+        with self.lock:
+            self.handle.write(json.dumps(record, ensure_ascii=False) + '\n')
+            self.handle.flush()
+            fileno = self.handle.fileno()
+        # Outside the lock, so pending() never waits for the disk
+        if CONFIG['journal_fsync']:
+            os.fsync(fileno)
+
+    def record_failure(self, file_name: str, model: str, prompt_digest: str, iteration: int,
+                       error_class: str, error: str, raw_response: str = None):
+        """Persist one failed iteration with what went wrong and what the model returned."""
+        with self.lock:
+            previous = self.pending_failures[(file_name, model, prompt_digest)].get(iteration)
+        record = {
+            'type': 'failure',
+            'file': file_name,
+            'model': model,
+            'prompt_hash': prompt_digest,
+            'iteration': iteration,
+            'error_class': error_class,
+            'error': error,
+            'raw_response': raw_response,
+            'failures': (previous['failures'] if previous else 0) + 1,
+            'time': time.time()
+        }
+        self.append(record)
+        with self.lock:
+            self.pending_failures[(file_name, model, prompt_digest)][iteration] = record
+
+    def resolve(self, file_name: str, model: str, prompt_digest: str, iteration: int):
+        """Mark a dead-lettered iteration as recovered (no-op if it was never dead-lettered)."""
+        key = (file_name, model, prompt_digest)
+        with self.lock:
+            if iteration not in self.pending_failures.get(key, {}):
+                return
+        self.append({
+            'type': 'resolved',
+            'file': file_name,
+            'model': model,
+            'prompt_hash': prompt_digest,
+            'iteration': iteration
+        })
+        with self.lock:
+            self.pending_failures[key].pop(iteration, None)
+
+    def pending(self, file_name: str, model: str, prompt_digest: str) -> dict:
+        """Unresolved failures of a cell, by iteration."""
+        with self.lock:
+            return dict(self.pending_failures.get((file_name, model, prompt_digest), {}))
+
+    def close(self):
+        with self.lock:
+            self.handle.close()
+
+
+def open_dead_letters(output_base: str) -> DeadLetterStore:
+    """Open (or create) the dead-letter store in the output directory."""
+    return DeadLetterStore(os.path.join(output_base, DEAD_LETTER_FILE_NAME))
+
+
+def report_incomplete_cells(tasks, journal, dead_letters: DeadLetterStore):
+    """Log every (resume, model) cell still short of CONFIG['iterations_per_file'] results."""
+    target = CONFIG['iterations_per_file']
+    incomplete = 0
+    for task in sorted(tasks, key=lambda t: (t['file_name'], t['model'])):
+        done = len(journal.completed_iterations(task['file_name'], task['model'], task['prompt_digest']))
+        if done >= target:
+            continue
+        incomplete += 1
+        failures = dead_letters.pending(task['file_name'], task['model'], task['prompt_digest'])
+        error_classes = defaultdict(int)
+        for record in failures.values():
+            error_classes[record['error_class']] += 1
+        logger.warning(
+            f"Incomplete cell {task['file_name']} / {task['model']}: {done}/{target} iterations "
+            f"({len(failures)} dead-lettered: {dict(error_classes)})"
+        )
+    if incomplete:
+        logger.warning(f"{incomplete} cells below {target} iterations; rerun main.py to retry them")
+    else:
+        logger.info(f"All {len(tasks)} cells have {target} iterations")
@@ -0,0 +1,286 @@
+"""
+Single-pass decoder for model responses.
+
+Each response is JSON-decoded once and the scores, manipulation check and
+thought process are read from the same object. Three shapes are understood:
+- the OpenAI / Claude schema (`scores` array)
+- Mistral's `q1`..`q17` properties
+- Mistral JSON mode's nested `resume_evaluation`
+
+Responses that are not JSON fall back to text scans with precompiled regexes.
+The result is identical to the per-field functions in parsers.py, which are
+now thin wrappers around decode_response. decode_response itself does not log
+missing fields, so bulk re-parsing stays quiet. orjson is used when installed,
+and the standard json module otherwise.
+"""
+import json
+import re
+import logging
+from typing import List, NamedTuple, Optional
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+from config import CONFIG
+
+logger = logging.getLogger(__name__)
+
+QUESTION_PREFIX = re.compile(r'^[Qq]\d+[:\-\.]?\s*')
+NUMBER_PREFIX = re.compile(r'^\d+[\.\)]\s*')
+SCORE_DIGIT = re.compile(r'\b([1-7])\b')
+YES_WORD = re.compile(r'\bYES\b')
+NO_WORD = re.compile(r'\bNO\b')
+TRAILING_YES_NO = re.compile(r'\s+(YES|NO)\s*$', re.IGNORECASE)
+SECTION_BREAK = re.compile(r'\n\s*---\s*\n|\n\s*\n\s*\n')
+
+THOUGHT_MARKERS = ('19.', 'q19', 'thought process', 'explain your thought', 'step-by-step', 'reasoning')
+
+# Sentinel for "not JSON", distinct from a JSON document that is `null`
+NOT_JSON = object()
+
+
+class DecodedResponse(NamedTuple):
+    """All fields of one response; `scores` is None when they could not be extracted (see `scores_error`).
+
+    The *_path fields name the branch that produced each field (e.g. 'json_scores',
+    'text_lines', 'json_analysis_search'), for the parser benchmarks and diagnostics.
+    """
+    scores: Optional[List[int]]
+    scores_error: Optional[str]
+    manipulation_check: str
+    thought_process: str
+    scores_path: str
+    manipulation_check_path: str
+    thought_process_path: str
+
+
+def loads(text: str):
+    """JSON-decode `text`, or return NOT_JSON."""
+    if orjson is not None:
+        try:
+            return orjson.loads(text)
+        except orjson.JSONDecodeError:
+            # orjson is stricter (NaN, huge integers); let json decide
+            pass
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError:
+        return NOT_JSON
+
+
+def find_score_array(obj):
+    """First list (depth-first) holding exactly num_questions integers."""
+    if isinstance(obj, list) and all(isinstance(x, (int, str)) for x in obj):
+        try:
+            nums = [int(x) for x in obj]
+            if len(nums) == CONFIG['num_questions']:
+                return nums
+        except (ValueError, TypeError):
+            pass
+    elif isinstance(obj, dict):
+        for v in obj.values():
+            result = find_score_array(v)
+            if result:
+                return result
+    return None
+
+
+def scores_from_json(data):
+    """(scores, path) from a decoded response; scores is None to fall back to the text scan."""
+    num_questions = CONFIG['num_questions']
+    try:
+        if isinstance(data, dict):
+            # Mistral-style individual q1-q17 properties
+            if 'q1' in data and f'q{num_questions}' in data:
+                numbers = []
+                for i in range(1, num_questions + 1):
+                    key = f'q{i}'
+                    if key not in data:
+                        break
+                    numbers.append(int(data[key]))
+                if len(numbers) == num_questions:
+                    return numbers, 'json_q_keys'
+
+            if 'scores' in data:
+                numbers = [int(x) for x in data['scores']]
+                if len(numbers) == num_questions:
+                    return numbers, 'json_scores'
+
+            # Mistral JSON mode nested format: resume_evaluation.questions
+            nested = data.get('resume_evaluation')
+            if isinstance(nested, dict) and isinstance(nested.get('questions'), list):
+                numbers = [int(x) for x in nested['questions']]
+                if len(numbers) == num_questions:
+                    return numbers, 'json_nested'
+
+            numbers = find_score_array(data)
+            if numbers:
+                return numbers, 'json_search'
+
+        elif isinstance(data, list):
+            numbers = [int(x) for x in data]
+            if len(numbers) == num_questions:
+                return numbers, 'json_list'
+    except (ValueError, KeyError, TypeError, OverflowError):
+        pass
+    return None, None
+
+
+def scores_from_text(text: str):
+    """Line-by-line scan for 1-7 scores; returns (scores or None, path, error message)."""
+    num_questions = CONFIG['num_questions']
+    numbers = []
+    for line in text.strip().split('\n'):
+        line = line.strip()
+        if not line:
+            continue
+        line = QUESTION_PREFIX.sub('', line, count=1)
+        line = NUMBER_PREFIX.sub('', line, count=1)
+        match = SCORE_DIGIT.search(line)
+        if match:
+            numbers.append(int(match.group(1)))
+
+    if len(numbers) == num_questions:
+        return numbers, 'text_lines', None
+
+    if len(numbers) > num_questions:
+        logger.warning(f"Found {len(numbers)} numbers, expected {num_questions}, taking first {num_questions}")
+        return numbers[:num_questions], 'text_lines_truncated', None
+
+    all_numbers = SCORE_DIGIT.findall(text)
+    if len(all_numbers) >= num_questions:
+        return [int(x) for x in all_numbers[:num_questions]], 'text_anywhere', None
+
+    return None, 'failed', f"Could not extract {num_questions} valid scores. Found {len(numbers)} numbers: {numbers}"
+
+
+def manipulation_check_from_json(data):
+    """(YES/NO, path) from a decoded response, or (None, None)."""
+    if not isinstance(data, dict):
+        return None, None
+    if 'manipulation_check' in data:
+        value = str(data['manipulation_check']).upper()
+        if value in ('YES', 'NO'):
+            return value, 'json'
+    # Mistral nested format: resume_evaluation.manipulation_check, a string or {"question_18": "YES"}
+    nested = data.get('resume_evaluation')
+    if isinstance(nested, dict) and 'manipulation_check' in nested:
+        mc = nested['manipulation_check']
+        if isinstance(mc, str):
+            value = mc.upper()
+            if value in ('YES', 'NO'):
+                return value, 'json_nested'
+        elif isinstance(mc, dict):
+            for v in mc.values():
+                value = str(v).upper()
+                if value in ('YES', 'NO'):
+                    return value, 'json_nested'
+    return None, None
+
+
+def manipulation_check_from_text(text: str):
+    text_upper = text.upper()
+    if YES_WORD.search(text_upper):
+        return "YES", 'text'
+    if NO_WORD.search(text_upper):
+        return "NO", 'text'
+    return "UNKNOWN", 'unknown'
+
+
+def extract_text(obj):
+    """Text of a {"question_19": {"response": {"text": "..."}}}-style value."""
+    if isinstance(obj, str):
+        return obj.strip()
+    if isinstance(obj, dict):
+        if 'text' in obj:
+            return str(obj['text']).strip()
+        if 'response' in obj:
+            return extract_text(obj['response'])
+        for v in obj.values():
+            result = extract_text(v)
+            if result:
+                return result
+    return None
+
+
+def thought_process_from_json(data):
+    """(thought process, path) from a decoded response, or (None, None)."""
+    if not isinstance(data, dict):
+        return None, None
+    if 'thought_process' in data:
+        return str(data['thought_process']).strip(), 'json'
+    # Mistral nested format: resume_evaluation.thought_process(_analysis)
+    nested = data.get('resume_evaluation')
+    if not isinstance(nested, dict):
+        return None, None
+    if 'thought_process' in nested:
+        return str(nested['thought_process']).strip(), 'json_nested'
+    tp = nested.get('thought_process_analysis')
+    if isinstance(tp, str):
+        return tp.strip(), 'json_analysis'
+    if isinstance(tp, dict):
+        if isinstance(tp.get('response'), str):
+            return tp['response'].strip(), 'json_analysis'
+        if isinstance(tp.get('formatted'), str):
+            return tp['formatted'].strip(), 'json_analysis'
+        text = extract_text(tp)
+        if text:
+            return text, 'json_analysis_search'
+    return None, None
+
+
+def thought_process_from_text(text: str):
+    lines = text.split('\n')
+    for i, line in enumerate(lines):
+        line_lower = line.lower()
+        if any(marker in line_lower for marker in THOUGHT_MARKERS):
+            thought_text = TRAILING_YES_NO.sub('', '\n'.join(lines[i + 1:]).strip())
+            if thought_text:
+                return thought_text, 'text_marker'
+            break
+
+    sections = SECTION_BREAK.split(text)
+    if len(sections) > 1:
+        for section in reversed(sections):
+            section = section.strip()
+            if len(section) > 100:
+                return TRAILING_YES_NO.sub('', section), 'text_section'
+    return "", 'empty'
+
+
+def decode_response(text: str) -> DecodedResponse:
+    """Decode every field of a raw response with a single JSON parse."""
+    if not text or not text.strip():
+        return DecodedResponse(None, "Empty response from model", "UNKNOWN", "", 'empty', 'unknown', 'empty')
+
+    data = loads(text)
+    scores = scores_path = scores_error = None
+    manipulation_check = manipulation_check_path = None
+    thought_process = thought_process_path = None
+    if data is not NOT_JSON:
+        scores, scores_path = scores_from_json(data)
+        manipulation_check, manipulation_check_path = manipulation_check_from_json(data)
+        thought_process, thought_process_path = thought_process_from_json(data)
+
+    if scores is None:
+        scores, scores_path, scores_error = scores_from_text(text)
+    if manipulation_check is None:
+        manipulation_check, manipulation_check_path = manipulation_check_from_text(text)
+    if thought_process is None:
+        thought_process, thought_process_path = thought_process_from_text(text)
+    return DecodedResponse(
+        scores, scores_error, manipulation_check, thought_process,
+        scores_path, manipulation_check_path, thought_process_path
+    )
+
+
+def warn_missing_manipulation_check(decoded: DecodedResponse):
+    if decoded.manipulation_check == "UNKNOWN":
+        logger.warning("Could not find YES/NO for manipulation check, defaulting to UNKNOWN")
+
+
+def warn_missing_thought_process(decoded: DecodedResponse):
+    if not decoded.thought_process:
+        logger.warning("Could not extract thought process, returning empty string")
@@ -0,0 +1,178 @@
+"""
+Factorial experimental design: resume conditions generated in memory.
+
+The source PDF (resumes/resume.pdf) holds one résumé page per applicant,
+each followed by four record pages:
+- +1: criminal background report showing a record
+- +2: web search results showing the record (mugshots, arrest listings)
+- +3: background report with no criminal history
+- +4: web search results with nothing criminal
+
+A condition crosses three factors:
+- applicant: identity of the applicant (résumé page)
+- record_type: where a criminal record shows up (none, report, web, both)
+- record_pages: how many record pages follow the résumé (1 or 2)
+
+With two record pages the applicant gets a background report and web
+results, each showing the record or not. With one page only the page
+carrying the record is shown, so 'none' and 'both' have no one-page
+version. Each condition's text is the applicant page followed by the
+report, then the web results, joined from pdf_utils' cached page text.
+Conditions the original study ran keep its page order instead, so their
+text is exactly the study's stimulus: black-web-2 is pages 1, 3, 4 (the web
+results before the clean report), as in resume_1_3_4.
+No files or split PDFs are written. The 12 conditions of the original study
+are the full crossing of the factors below. Adding an applicant or a factor
+level adds conditions without adding any files.
+
+Condition IDs (e.g. 'black-both-2') depend only on the factor levels, so
+they stay stable as the design grows. They are used as the resume name in
+tasks, the journal and the results, and `condition_labels()` maps them back
+to factor columns for analysis.
+
+Usage:
+    python design.py               # list conditions
+    python design.py --show ID     # print one condition's text
+"""
+import os
+import argparse
+import itertools
+import logging
+from collections import defaultdict
+from typing import NamedTuple, Optional
+
+import pdf_utils
+
+logger = logging.getLogger(__name__)
+
+# Résumé page of each applicant in resumes/resume.pdf (DeShawn Johnson, Kyle Johnson)
+APPLICANT_PAGES = {'black': 1, 'white': 6}
+RECORD_TYPES = ('none', 'report', 'web', 'both')
+RECORD_PAGE_COUNTS = (1, 2)
+# Record pages as offsets from the applicant's résumé page, by whether they show the record
+REPORT_PAGE_OFFSETS = {True: 1, False: 3}
+WEB_PAGE_OFFSETS = {True: 2, False: 4}
+
+
+class Condition(NamedTuple):
+    condition_id: str
+    applicant: str
+    record_type: str
+    record_pages: int
+    # Source pages in reading order (the study variant's order, if there is one)
+    pages: tuple
+    # Name of the matching pdf_utils variant (resume_1_2_3, ...), if there is one
+    variant: Optional[str]
+
+
+def condition_pages(applicant: str, record_type: str, record_pages: int):
+    """Source pages of a condition, or None if the combination does not exist."""
+    first = APPLICANT_PAGES[applicant]
+    in_report = record_type in ('report', 'both')
+    in_web = record_type in ('web', 'both')
+    if record_pages == 2:
+        return (first, first + REPORT_PAGE_OFFSETS[in_report], first + WEB_PAGE_OFFSETS[in_web])
+    if record_pages == 1 and in_report != in_web:
+        return (first, first + (REPORT_PAGE_OFFSETS[True] if in_report else WEB_PAGE_OFFSETS[True]))
+    return None
+
+
+def study_variant(pages):
+    """(variant name, its page order) of the pdf_utils variant with the same pages, or (None, pages)."""
+    for path, group in zip(pdf_utils.output_pdf_paths, pdf_utils.page_groups):
+        if sorted(group) == sorted(pages):
+            return os.path.splitext(os.path.basename(path))[0], tuple(group)
+    return None, pages
+
+
+def generate_conditions(applicants=None, record_types=RECORD_TYPES, record_page_counts=RECORD_PAGE_COUNTS) -> list:
+    """Every valid combination of the factor levels, in a stable order."""
+    conditions = []
+    for applicant, record_type, record_pages in itertools.product(
+        applicants or APPLICANT_PAGES, record_types, record_page_counts
+    ):
+        pages = condition_pages(applicant, record_type, record_pages)
+        if pages is None:
+            continue
+        variant, pages = study_variant(pages)
+        conditions.append(Condition(
+            f'{applicant}-{record_type}-{record_pages}', applicant, record_type, record_pages, pages, variant
+        ))
+    return conditions
+
+
+def page_fragments(page_numbers, workers=None) -> dict:
+    """{source page number: text}, from pdf_utils' page cache.
+
+    Pages come from resumes/resume.pdf when it exists; otherwise each page is
+    read from the first split PDF in resume_extracted/ that contains it.
+    """
+    if os.path.exists(pdf_utils.input_pdf_path):
+        return pdf_utils.cached_page_texts(pdf_utils.input_pdf_path, page_numbers, pdf_utils.page_cache_dir, workers)
+
+    wanted = set(page_numbers)
+    by_pdf = defaultdict(dict)
+    for path, group in zip(pdf_utils.output_pdf_paths, pdf_utils.page_groups):
+        if not os.path.exists(path):
+            continue
+        for index, page_num in enumerate(group, start=1):
+            if page_num in wanted:
+                wanted.discard(page_num)
+                by_pdf[path][index] = page_num
+    if wanted:
+        raise FileNotFoundError(f"Pages {sorted(wanted)} are in neither {pdf_utils.input_pdf_path} nor a split PDF")
+
+    fragments = {}
+    for path, pages in by_pdf.items():
+        texts = pdf_utils.cached_page_texts(path, pages, pdf_utils.page_cache_dir, workers)
+        fragments.update({page_num: texts[index] for index, page_num in pages.items()})
+    return fragments
+
+
+def condition_texts(conditions=None, workers=None) -> dict:
+    """{condition ID: resume text} for `conditions` (default: the full design), built in memory."""
+    conditions = generate_conditions() if conditions is None else conditions
+    fragments = page_fragments({page_num for condition in conditions for page_num in condition.pages}, workers)
+    return {
+        condition.condition_id: "\n\n".join(fragments[page_num] for page_num in condition.pages)
+        for condition in conditions
+    }
+
+
+def condition_labels(conditions=None) -> dict:
+    """{condition ID: {factor: level}} for labelling results."""
+    conditions = generate_conditions() if conditions is None else conditions
+    return {
+        condition.condition_id: {
+            'applicant': condition.applicant,
+            'record_type': condition.record_type,
+            'record_pages': condition.record_pages,
+            'variant': condition.variant,
+        }
+        for condition in conditions
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="List the factorial resume conditions.")
+    parser.add_argument('--show', metavar='CONDITION_ID', help="print the generated text of one condition")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    conditions = generate_conditions()
+    if args.show:
+        selected = [condition for condition in conditions if condition.condition_id == args.show]
+        if not selected:
+            parser.error(f"unknown condition {args.show}")
+        print(condition_texts(selected)[args.show])
+        return
+
+    print(f"{'condition':18} {'applicant':9} {'record':7} {'pages':5} {'source pages':12} variant")
+    for condition in conditions:
+        pages = ','.join(map(str, condition.pages))
+        print(f"{condition.condition_id:18} {condition.applicant:9} {condition.record_type:7} "
+              f"{condition.record_pages:5d} {pages:12} {condition.variant or '-'}")
+
+
+if __name__ == "__main__":
+    main()
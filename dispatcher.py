@@ -0,0 +1,86 @@
+"""Asyncio request dispatch: retries around attempts through each model's circuit breaker.
+
+Concurrency caps are applied per attempt: the model's adaptive limit in
+adaptive_concurrency.adaptive_call, the provider cap only around the API
+call itself (SendSlot), so no slot is held during a retry's backoff.
+"""
+import asyncio
+import logging
+
+from config import CONFIG
+from utils import get_provider
+from api_clients import get_openai_score, get_claude_score, get_mistral_score, probe_model
+from retry import call_with_retries, classify_error
+from circuit_breaker import get_circuit_breaker
+from response_cache import CacheMissError
+from key_pool import NoAvailableKeyError
+
+logger = logging.getLogger(__name__)
+
+SCORE_FUNCTIONS = {
+    'openai': get_openai_score,
+    'anthropic': get_claude_score,
+    'mistral': get_mistral_score
+}
+
+
+async def guarded_attempt(provider: str, model: str, prompt: str, iteration: int, refresh: bool = False,
+                          on_attempt=None) -> str:
+    """One attempt through the model's circuit breaker, reporting its outcome back to it."""
+    breaker = get_circuit_breaker(model)
+    breaker.before_request()
+    try:
+        result = await SCORE_FUNCTIONS[provider](prompt, model, iteration, refresh, on_attempt)
+    except (asyncio.CancelledError, CacheMissError, NoAvailableKeyError):
+        breaker.record_failure('not_sent')
+        raise
+    except Exception as e:
+        breaker.record_failure(classify_error(e))
+        raise
+    breaker.record_success()
+    return result
+
+
+async def dispatch_request(prompt: str, model: str, iteration: int, refresh: bool = False, on_attempt=None) -> str:
+    """Send one request for a model, with retries.
+    
+    Each attempt waits for a slot of the model's adaptive limit; the provider
+    cap is taken only around the API call. Both are released before any
+    backoff sleep. `refresh` skips the response cache read (used when retrying
+    a dead-lettered iteration). `on_attempt(outcome, seconds)` is called for
+    every attempt that reached the API (see adaptive_concurrency.adaptive_call).
+    """
+    provider = get_provider(model)
+    return await call_with_retries(
+        provider, model, lambda: guarded_attempt(provider, model, prompt, iteration, refresh, on_attempt),
+        CONFIG['max_retries']
+    )
+
+
+async def preflight_models(models) -> list:
+    """Probe every model once before scheduling; disable the ones that are definitely unusable.
+
+    Client errors (unknown or retired model ID, bad key) disable the model's
+    circuit breaker for the run. Transient failures only log a warning and
+    leave the model to the breaker. Returns the disabled models.
+    """
+    async def probe(model):
+        try:
+            await asyncio.wait_for(probe_model(get_provider(model), model), CONFIG['preflight_timeout'])
+            return model, None
+        except Exception as e:
+            return model, e
+    
+    disabled = []
+    for model, error in await asyncio.gather(*(probe(model) for model in models)):
+        if error is None:
+            logger.info(f"Preflight: {model} is available")
+            continue
+        error_class = classify_error(error)
+        if error_class == 'client':
+            get_circuit_breaker(model).disable(f"preflight failed: {error}")
+            disabled.append(model)
+            logger.error(f"Preflight: {model} is unavailable ({error}); skipping its requests this run")
+        else:
+            logger.warning(f"Preflight: {model} did not answer cleanly ({error_class}: {error}); leaving it to the circuit breaker")
+    return disabled
@@ -1,119 +1,250 @@
 """File processing for resume evaluation."""
-import os
-import csv
 import time
-import threading
+import asyncio
 import logging
-import concurrent.futures
+from collections import deque
+from functools import partial
 
-from config import CONFIG, OPENAI_MODELS_MAIN, MISTRAL_MODELS, CLAUDE_MODELS
-from parsers import parse_scores, validate_scores, parse_manipulation_check, parse_thought_process
-from utils import process_txt_files_and_attach_to_prompt
-from api_clients import retry_request, retry_request_claude, retry_request_mistral
+from config import CONFIG
+from parsers import build_result_row
+from utils import attach_resume_to_prompt
+from dispatcher import dispatch_request
+from metrics import record_slot_usage, record_retry_failure
+from journal import CompletionJournal, prompt_hash
+from circuit_breaker import CircuitOpenError, get_circuit_breaker
+from dead_letter import DeadLetterStore
+from result_writer import ResultWriter
+from results_db import ResultsDatabase
+from response_archive import get_response_archive
+from response_cache import CachedText
+from retry import classify_error
 
 logger = logging.getLogger(__name__)
 
-csv_write_lock = threading.Lock()
+async def timed_request(prompt: str, model: str, iteration: int, refresh: bool = False, on_attempt=None):
+    """Dispatch one request, returning (response or exception, seconds in flight including retries)."""
+    request_start = time.monotonic()
+    try:
+        response = await dispatch_request(prompt, model, iteration, refresh, on_attempt)
+    except Exception as e:
+        response = e
+    return response, time.monotonic() - request_start
 
 
-def process_file(file_name: str, model: str, directory: str, output_directory: str, global_prompt_template: str):
-    """Process a file with a model, running multiple iterations."""
+def log_progress(file_name: str, model: str, completed: int, total: int, start_time: float):
+    """Log iteration progress for a (file, model) task."""
+    elapsed_time = time.time() - start_time
+    elapsed_hours = int(elapsed_time // 3600)
+    elapsed_minutes = int((elapsed_time % 3600) // 60)
+    elapsed_seconds = int(elapsed_time % 60)
+    
+    logger.info(
+        f"Progress for {model} in {file_name}: "
+        f"{completed}/{total} iterations completed "
+        f"(Elapsed: {elapsed_hours:02d}:{elapsed_minutes:02d}:{elapsed_seconds:02d})"
+    )
+
+
+async def run_iterations(prompt: str, model: str, iterations, window_size: int, handle_response, refresh=frozenset(),
+                         record_attempt=None):
+    """Keep up to `window_size` of `iterations` in flight, awaiting `handle_response` with each outcome and its seconds in flight.
+    
+    A finished iteration's slot is refilled immediately instead of waiting for the
+    slowest request of a batch. Iterations in `refresh` bypass the response cache.
+    `record_attempt(iteration, outcome, seconds)` is called for every API attempt.
+    
+    Iterations turned away by the model's open circuit are parked, not dropped:
+    scheduling pauses until the breaker's next half-open trial, then resumes one
+    request at a time until the circuit closes. A task gives up after
+    CONFIG['circuit_breaker_max_park_seconds'] parked in total, or at once if the
+    model is disabled. Returns (busy seconds, slot seconds, the CircuitOpenError
+    that stopped it or None, iterations never answered).
+    """
+    pending_iterations = deque(sorted(iterations))
+    in_flight = {}
+    circuit_error = None
+    parked_seconds = 0.0
+    busy_seconds = 0.0
+    window_start = time.monotonic()
+    breaker = get_circuit_breaker(model)
+    
+    try:
+        while True:
+            if circuit_error and pending_iterations and not in_flight:
+                # Everything is parked: wait for the breaker's next half-open trial
+                wait = breaker.seconds_until_trial()
+                if wait is None or parked_seconds + wait > CONFIG['circuit_breaker_max_park_seconds']:
+                    break
+                wait = max(wait, 0.1)
+                logger.info(f"Circuit for {model} open; parking {len(pending_iterations)} iterations for {wait:.1f}s")
+                await asyncio.sleep(wait)
+                parked_seconds += wait
+            
+            # While the circuit is open, one request at a time (the half-open trial)
+            limit = 1 if circuit_error else window_size
+            while pending_iterations and len(in_flight) < limit:
+                iteration = pending_iterations.popleft()
+                on_attempt = partial(record_attempt, iteration) if record_attempt else None
+                task = asyncio.create_task(timed_request(prompt, model, iteration, iteration in refresh, on_attempt))
+                in_flight[task] = iteration
+            
+            if not in_flight:
+                circuit_error = None
+                break
+            
+            done, _ = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+            
+            for task in sorted(done, key=lambda t: in_flight[t]):
+                iteration = in_flight.pop(task)
+                scores, request_seconds = task.result()
+                busy_seconds += request_seconds
+                
+                if isinstance(scores, CircuitOpenError):
+                    circuit_error = scores
+                    pending_iterations.appendleft(iteration)
+                    continue
+                
+                if circuit_error and breaker.is_closed():
+                    logger.info(f"Circuit for {model} closed again; resuming {len(pending_iterations)} iterations")
+                    circuit_error = None
+                await handle_response(iteration, scores, request_seconds)
+    finally:
+        for task in in_flight:
+            task.cancel()
+    
+    unsent = sorted(set(pending_iterations) | set(in_flight.values()))
+    return busy_seconds, window_size * (time.monotonic() - window_start), circuit_error, unsent
+
+
+async def process_file(file_name: str, model: str, resume_text: str, output_directory: str,
+                       global_prompt_template: str, journal: CompletionJournal, dead_letters: DeadLetterStore,
+                       writer: ResultWriter, results_db: ResultsDatabase = None):
+    """Process a file with a model, running the iterations missing from the journal.
+    
+    Each result is journaled and handed to the streaming writer as it lands.
+    Failed iterations go to the dead-letter store and are retried in a throttled
+    pass once the main pass has drained. While the model's circuit is open its
+    iterations wait for the half-open trial (see run_iterations); the ones still
+    unsent when the task gives up are dead-lettered as 'circuit_open'. Every
+    API attempt (retries included) is recorded in the run database, if one is
+    open, with the seconds its call took and its outcome; responses served from
+    the response cache are recorded as 'cache_hit'.
+    """
     start_time = time.time()
     
-    file_path = os.path.join(directory, file_name)
-    prompt = process_txt_files_and_attach_to_prompt(file_path, global_prompt_template)
-    results = []
+    prompt = attach_resume_to_prompt(resume_text, global_prompt_template)
+    prompt_digest = prompt_hash(prompt)
 
-    batch_size = CONFIG['batch_size']
-    delay_between_batches = 0
-    max_retries = CONFIG['max_retries']
-    retry_delay = CONFIG['retry_delay']
+    window_size = CONFIG['window_size']
     iterations_per_file = CONFIG['iterations_per_file']
 
-    completed_iterations = set()
+    completed_iterations = journal.completed_iterations(file_name, model, prompt_digest)
+    missing_iterations = set(range(iterations_per_file)) - completed_iterations
+    finished = 0
     
-    logger.info(f"Starting processing: file={file_name}, model={model}, iterations={iterations_per_file}")
+    logger.info(
+        f"Starting processing: file={file_name}, model={model}, iterations={iterations_per_file} "
+        f"({len(completed_iterations)} already journaled)"
+    )
+    # Rows journaled by an earlier, interrupted run that never reached the CSV
+    writer.submit_journaled(output_directory, file_name, model, prompt_digest)
+    archive = get_response_archive()
     
-    while len(completed_iterations) < iterations_per_file:
-        missing_iterations = set(range(iterations_per_file)) - completed_iterations
-        current_iterations = sorted(list(missing_iterations))[:batch_size]
-        
-        logger.info(f"Processing file: {file_name}, Model: {model}, Iterations: {current_iterations}")
+    async def dead_letter(iteration: int, error_class: str, error, raw_response: str = None):
+        # The store fsyncs each record; keep that off the event loop
+        await asyncio.to_thread(
+            dead_letters.record_failure, file_name, model, prompt_digest, iteration, error_class, str(error), raw_response
+        )
+    
+    async def dead_letter_unsent(unsent, circuit_error):
+        # Turned away by the open circuit for good: keep them visible to the report and the next run
+        for iteration in unsent:
+            await dead_letter(iteration, 'circuit_open', circuit_error)
+            record_retry_failure(model, 'circuit_open')
+    
+    async def handle_response(iteration: int, scores, request_seconds: float):
+        nonlocal finished
+        finished += 1
         
-        with concurrent.futures.ThreadPoolExecutor(max_workers=CONFIG['max_workers']) as executor:
-            futures = []
-            for iteration in current_iterations:
-                if model in OPENAI_MODELS_MAIN:
-                    futures.append((iteration, executor.submit(retry_request, prompt, model, max_retries, retry_delay)))
-                elif model in MISTRAL_MODELS:
-                    futures.append((iteration, executor.submit(retry_request_mistral, prompt, model, max_retries, retry_delay)))
-                elif model in CLAUDE_MODELS:
-                    futures.append((iteration, executor.submit(retry_request_claude, prompt, model, max_retries, retry_delay)))
-
-            for iteration, future in futures:
-                try:
-                    scores = future.result()
-                    if scores is None:
-                        logger.warning(f"Null response for iteration {iteration}, model {model}")
-                        completed_iterations.add(iteration)
-                        continue
-                    
-                    try:
-                        score_list = parse_scores(scores)
-                        validated_scores = validate_scores(score_list)
-                        
-                        manipulation_check = parse_manipulation_check(scores)
-                        thought_process = parse_thought_process(scores)
-                        
-                        result = {'Model': model, 'Iteration': iteration}
-                        for i, score in enumerate(validated_scores, start=1):
-                            result[f'Q{i}'] = score
-                        
-                        result['ManipulationCheck'] = manipulation_check
-                        result['ThoughtProcess'] = thought_process
-                        
-                        results.append(result)
-                        completed_iterations.add(iteration)
-                        logger.info(f"Successfully processed iteration {iteration} for {model}")
-                        
-                    except ValueError as ve:
-                        logger.error(f"Validation error for iteration {iteration}, model {model}: {ve}")
-                        logger.debug(f"Raw response: {scores[:200]}...")
-                        completed_iterations.add(iteration)
-                        
-                except Exception as e:
-                    logger.error(f"Error in iteration {iteration}, model {model}: {e}", exc_info=True)
-                    completed_iterations.add(iteration)
+        if isinstance(scores, Exception):
+            logger.error(f"Error in iteration {iteration}, model {model}: {scores}", exc_info=scores)
+            await dead_letter(iteration, classify_error(scores), scores)
+        elif scores is None:
+            logger.warning(f"Null response for iteration {iteration}, model {model}")
+            await dead_letter(iteration, 'null_response', "Null response")
+        else:
+            # Cache hits were archived when they first came back from the API
+            if archive and not isinstance(scores, CachedText):
+                # Compressing and writing the record happen in a worker thread, off the event loop
+                await asyncio.to_thread(archive.record, file_name, model, prompt_digest, iteration, scores)
+            try:
+                result = build_result_row(model, iteration, scores)
+                # The journal fsyncs each record; keep that off the event loop
+                await asyncio.to_thread(journal.record_result, file_name, model, prompt_digest, result)
+                writer.submit(output_directory, file_name, model, prompt_digest, result)
+                await asyncio.to_thread(dead_letters.resolve, file_name, model, prompt_digest, iteration)
+                completed_iterations.add(iteration)
+                logger.info(f"Successfully processed iteration {iteration} for {model}")
+                
+            except ValueError as ve:
+                logger.error(f"Validation error for iteration {iteration}, model {model}: {ve}")
+                logger.debug(f"Raw response: {scores[:200]}...")
+                await dead_letter(iteration, 'validation', ve, scores)
+                
+            except Exception as e:
+                logger.error(f"Error in iteration {iteration}, model {model}: {e}", exc_info=True)
+                await dead_letter(iteration, 'parse', e, scores)
         
-        elapsed_time = time.time() - start_time
-        elapsed_hours = int(elapsed_time // 3600)
-        elapsed_minutes = int((elapsed_time % 3600) // 60)
-        elapsed_seconds = int(elapsed_time % 60)
+        if results_db and isinstance(scores, CachedText):
+            # No API call was made; kept apart from the per-attempt latencies
+            results_db.record_attempt(file_name, model, iteration, 'cache_hit', request_seconds)
         
+        if finished % window_size == 0:
+            log_progress(file_name, model, len(completed_iterations), iterations_per_file, start_time)
+    
+    # Dead letters from an earlier run may have a bad response in the cache; fetch those fresh
+    earlier_failures = set(dead_letters.pending(file_name, model, prompt_digest)) & missing_iterations
+    
+    record_attempt = partial(results_db.record_attempt, file_name, model) if results_db else None
+    busy_seconds, slot_seconds, circuit_error, unsent = await run_iterations(
+        prompt, model, missing_iterations, window_size, handle_response, refresh=earlier_failures,
+        record_attempt=record_attempt
+    )
+    if circuit_error:
+        await dead_letter_unsent(unsent, circuit_error)
+    
+    for retry_pass in range(1, CONFIG['dead_letter_retry_passes'] + 1):
+        retry_iterations = set(dead_letters.pending(file_name, model, prompt_digest)) - completed_iterations
+        if circuit_error or not retry_iterations:
+            break
         logger.info(
-            f"Progress for {model} in {file_name}: "
-            f"{len(completed_iterations)}/{iterations_per_file} iterations completed "
-            f"(Elapsed: {elapsed_hours:02d}:{elapsed_minutes:02d}:{elapsed_seconds:02d})"
+            f"Dead-letter retry pass {retry_pass} for {model} in {file_name}: {len(retry_iterations)} iterations "
+            f"in {CONFIG['dead_letter_retry_delay']}s"
         )
-        time.sleep(delay_between_batches)
-
-    sorted_results = sorted(results, key=lambda x: x['Iteration'])
-    csv_path = os.path.join(output_directory, file_name.replace('.txt', '') + '_results.csv')
+        await asyncio.sleep(CONFIG['dead_letter_retry_delay'])
+        retry_busy, retry_slots, circuit_error, unsent = await run_iterations(
+            prompt, model, retry_iterations, CONFIG['dead_letter_retry_window'], handle_response, refresh=retry_iterations,
+            record_attempt=record_attempt
+        )
+        if circuit_error:
+            await dead_letter_unsent(unsent, circuit_error)
+        busy_seconds += retry_busy
+        slot_seconds += retry_slots
     
-    with csv_write_lock:
-        file_exists = os.path.exists(csv_path)
-        
-        with open(csv_path, 'a', newline='', encoding='utf-8') as csvfile:
-            fieldnames = ['Model', 'Iteration'] + [f'Q{i}' for i in range(1, CONFIG['num_questions'] + 1)] + ['ManipulationCheck', 'ThoughtProcess']
-            writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-            
-            if not file_exists:
-                writer.writeheader()
-            
-            for result in sorted_results:
-                writer.writerow(result)
-        
-        logger.info(f"Wrote {len(sorted_results)} results to {csv_path}")
+    record_slot_usage(model, busy_seconds, slot_seconds)
+    
+    log_progress(file_name, model, len(completed_iterations), iterations_per_file, start_time)
+    logger.info(
+        f"Slot utilization for {model} in {file_name}: "
+        f"{busy_seconds / slot_seconds if slot_seconds else 0.0:.1%} of {window_size} slots"
+    )
+
+    if circuit_error:
+        logger.warning(
+            f"Stopped {model} in {file_name} early ({circuit_error}); "
+            f"{iterations_per_file - len(completed_iterations)} iterations dead-lettered for a later run"
+        )
+        return
     
     total_time = time.time() - start_time
     hours = int(total_time // 3600)
@@ -121,7 +252,6 @@ def process_file(file_name: str, model: str, directory: str, output_directory: s
     seconds = int(total_time % 60)
     
     logger.info(
-        f"Completed all {iterations_per_file} iterations for {model} in {file_name}. "
+        f"Completed {len(completed_iterations)}/{iterations_per_file} iterations for {model} in {file_name}. "
         f"Total processing time: {hours:02d}:{minutes:02d}:{seconds:02d}"
     )
-
@@ -0,0 +1,129 @@
+"""Append-only completion journal for crash-safe, resumable runs.
+
+Every parsed result is appended (and fsynced) as soon as its response lands,
+keyed by (resume file, model, iteration, prompt hash). A second record type
+notes which iterations have been written to the results CSV, so a restarted
+run neither repeats paid API calls nor appends duplicate rows.
+
+process_file appends from a worker thread, so the fsync never stalls the
+event loop, and the fsync runs outside the lock, so readers of the
+in-memory state never wait for the disk.
+"""
+import os
+import json
+import hashlib
+import threading
+import logging
+from collections import defaultdict
+
+from config import CONFIG
+from prompts import SYSTEM_PROMPT
+
+logger = logging.getLogger(__name__)
+
+JOURNAL_FILE_NAME = 'run_journal.jsonl'
+
+
+def prompt_hash(prompt: str) -> str:
+    """Short hash of the exact prompt text sent for a resume."""
+    return hashlib.sha256((SYSTEM_PROMPT + prompt).encode('utf-8')).hexdigest()[:16]
+
+
+class CompletionJournal:
+    """Durable record of completed iterations, loaded back on startup."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.lock = threading.Lock()
+        # (file_name, model, prompt_hash) -> {iteration: result row}
+        self.results = defaultdict(dict)
+        # (file_name, model, prompt_hash) -> iterations already written to CSV
+        self.flushed = defaultdict(set)
+        self.load()
+        self.handle = open(path, 'a', encoding='utf-8')
+
+    def load(self):
+        """Replay the journal file, ignoring a torn final line from a crash."""
+        if not os.path.exists(self.path):
+            return
+        
+        with open(self.path, 'r', encoding='utf-8') as f:
+            content = f.read()
+        
+        loaded = 0
+        for line in content.splitlines():
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                logger.warning(f"Skipping unreadable journal line in {self.path}")
+                continue
+            key = (record['file'], record['model'], record['prompt_hash'])
+            if record['type'] == 'result':
+                self.results[key][record['iteration']] = record['row']
+                loaded += 1
+            elif record['type'] == 'flushed':
+                self.flushed[key].update(record['iterations'])
+        
+        if content and not content.endswith('\n'):
+            # Terminate a partial line so the next record starts cleanly
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write('\n')
+        
+        logger.info(f"Loaded {loaded} journaled results from {self.path}")
+
+    def append(self, record: dict):
+        with self.lock:
+            self.handle.write(json.dumps(record, ensure_ascii=False) + '\n')
+            self.handle.flush()
+            fileno = self.handle.fileno()
+        if CONFIG['journal_fsync']:
+            os.fsync(fileno)
+
+    def record_result(self, file_name: str, model: str, prompt_digest: str, row: dict):
+        """Persist one parsed result before it is counted as done."""
+        self.append({
+            'type': 'result',
+            'file': file_name,
+            'model': model,
+            'prompt_hash': prompt_digest,
+            'iteration': row['Iteration'],
+            'row': row
+        })
+        with self.lock:
+            self.results[(file_name, model, prompt_digest)][row['Iteration']] = row
+
+    def record_flushed(self, file_name: str, model: str, prompt_digest: str, iterations):
+        """Note that these iterations are now in the results CSV."""
+        iterations = sorted(iterations)
+        if not iterations:
+            return
+        self.append({
+            'type': 'flushed',
+            'file': file_name,
+            'model': model,
+            'prompt_hash': prompt_digest,
+            'iterations': iterations
+        })
+        with self.lock:
+            self.flushed[(file_name, model, prompt_digest)].update(iterations)
+
+    def completed_iterations(self, file_name: str, model: str, prompt_digest: str) -> set:
+        with self.lock:
+            return set(self.results.get((file_name, model, prompt_digest), {}))
+
+    def unflushed_results(self, file_name: str, model: str, prompt_digest: str) -> list:
+        """Journaled rows not yet written to CSV, in iteration order."""
+        key = (file_name, model, prompt_digest)
+        with self.lock:
+            rows = self.results.get(key, {})
+            written = self.flushed.get(key, set())
+            return [rows[i] for i in sorted(rows) if i not in written]
+
+    def close(self):
+        with self.lock:
+            self.handle.close()
+
+
+def open_journal(output_base: str) -> CompletionJournal:
+    """Open (or create) the run journal in the output directory."""
+    return CompletionJournal(os.path.join(output_base, JOURNAL_FILE_NAME))
@@ -0,0 +1,245 @@
+"""
+Load balancing across every configured API key of a provider.
+
+Each request takes the key with the most rate-limit headroom left, judged
+from the x-ratelimit-* / anthropic-ratelimit-* response headers and the
+number of requests already in flight on it. A throttled key (429, or
+headers showing an empty budget) sits out until its reset time; a key out
+of quota sits out for CONFIG['key_exhausted_cooldown'] seconds. Both come
+back into rotation automatically.
+"""
+import re
+import time
+import asyncio
+import threading
+import logging
+from contextlib import nullcontext
+from datetime import datetime, timezone
+
+from config import CONFIG, OPENAI_API_KEYS, ANTHROPIC_API_KEYS, MISTRAL_API_KEYS
+from utils import key_fingerprint
+from rate_limiter import rate_limited_call
+
+logger = logging.getLogger(__name__)
+
+PROVIDER_KEYS = {
+    'openai': OPENAI_API_KEYS,
+    'anthropic': ANTHROPIC_API_KEYS,
+    'mistral': MISTRAL_API_KEYS
+}
+
+QUOTA_ERROR_MARKERS = ('insufficient_quota', 'billing_hard_limit_reached', 'credit balance is too low')
+
+DURATION_PART = re.compile(r'(\d+(?:\.\d+)?)(ms|h|m|s)')
+
+
+class NoAvailableKeyError(Exception):
+    """Raised when every key of a provider is out of quota."""
+
+
+def parse_reset_seconds(value: str):
+    """Seconds until a rate-limit reset given as seconds, a duration ("6m0s", "20ms") or an RFC 3339 time."""
+    if value is None:
+        return None
+    value = value.strip()
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    if 'T' in value and ':' in value:
+        try:
+            reset_at = datetime.fromisoformat(value.replace('Z', '+00:00'))
+            return max((reset_at - datetime.now(timezone.utc)).total_seconds(), 0.0)
+        except ValueError:
+            return None
+    parts = DURATION_PART.findall(value)
+    if not parts:
+        return None
+    scale = {'h': 3600.0, 'm': 60.0, 's': 1.0, 'ms': 0.001}
+    return sum(float(number) * scale[unit] for number, unit in parts)
+
+
+def parse_rate_limit_headers(headers) -> dict:
+    """Normalize provider rate-limit headers into limit/remaining/reset per requests and tokens.
+
+    Handles x-ratelimit-{limit,remaining,reset}-{requests,tokens} (OpenAI),
+    anthropic-ratelimit-{requests,tokens}-{limit,remaining,reset} (Anthropic)
+    and x-ratelimitbysize-*-minute (Mistral token budget).
+    """
+    info = {}
+    if not headers:
+        return info
+    for name, value in headers.items():
+        name = name.lower()
+        if 'ratelimit' not in name or 'input-tokens' in name or 'output-tokens' in name:
+            continue
+        suffix = name.split('ratelimit', 1)[1]
+        if 'request' in suffix or 'req-' in suffix:
+            kind = 'requests'
+        elif 'token' in suffix or 'bysize' in suffix:
+            kind = 'tokens'
+        else:
+            continue
+        if 'remaining' in suffix:
+            field = 'remaining'
+        elif 'reset' in suffix:
+            info[f'reset_{kind}'] = parse_reset_seconds(value)
+            continue
+        elif 'limit' in suffix:
+            field = 'limit'
+        else:
+            continue
+        try:
+            info[f'{field}_{kind}'] = float(value)
+        except ValueError:
+            pass
+    return info
+
+
+def error_headers(error):
+    """HTTP headers of the response behind an SDK exception, if any."""
+    response = getattr(error, 'response', None) or getattr(error, 'raw_response', None)
+    return getattr(response, 'headers', None)
+
+
+def error_status(error):
+    status = getattr(error, 'status_code', None)
+    if status is None:
+        status = getattr(getattr(error, 'response', None), 'status_code', None)
+    return status
+
+
+class KeyState:
+    """Rate-limit view of one API key."""
+
+    def __init__(self, api_key: str):
+        self.api_key = api_key
+        self.key_id = key_fingerprint(api_key)
+        self.in_flight = 0
+        self.available_at = 0.0
+        self.exhausted = False
+        self.limits = {}
+
+    def headroom(self) -> float:
+        """Smallest remaining fraction of the request and token budgets (1.0 if unknown)."""
+        fractions = []
+        for kind in ('requests', 'tokens'):
+            limit = self.limits.get(f'limit_{kind}')
+            remaining = self.limits.get(f'remaining_{kind}')
+            if limit and remaining is not None:
+                fractions.append(remaining / limit)
+        return min(fractions) if fractions else 1.0
+
+
+class KeyPool:
+    """Spreads one provider's requests over all of its keys."""
+
+    def __init__(self, provider: str, api_keys):
+        self.provider = provider
+        self.keys = [KeyState(api_key) for api_key in api_keys]
+        self.lock = threading.Lock()
+
+    def choose(self, now: float):
+        """Best available key right now, or None."""
+        candidates = [k for k in self.keys if k.available_at <= now]
+        for key in candidates:
+            if key.exhausted:
+                key.exhausted = False
+                logger.info(f"{self.provider} key {key.key_id} back in rotation after quota cooldown")
+        if not candidates:
+            return None
+        return max(candidates, key=lambda k: k.headroom() / (1 + k.in_flight))
+
+    async def acquire(self) -> str:
+        """Take a key for one request, waiting if every key is throttled."""
+        while True:
+            now = time.monotonic()
+            with self.lock:
+                key = self.choose(now)
+                if key is not None:
+                    key.in_flight += 1
+                    return key.api_key
+                if all(k.exhausted for k in self.keys):
+                    raise NoAvailableKeyError(f"All {self.provider} API keys are out of quota")
+                wait = min(k.available_at for k in self.keys) - now
+            logger.debug(f"All {self.provider} keys throttled, waiting {wait:.1f}s")
+            await asyncio.sleep(max(wait, 0.01))
+
+    def release(self, api_key: str):
+        with self.lock:
+            self.state(api_key).in_flight -= 1
+
+    def state(self, api_key: str) -> KeyState:
+        return next(k for k in self.keys if k.api_key == api_key)
+
+    def has_available_key(self) -> bool:
+        with self.lock:
+            return any(not k.exhausted for k in self.keys)
+
+    def update_from_headers(self, api_key: str, headers):
+        """Record the budget a response reports; an empty budget benches the key until reset."""
+        info = parse_rate_limit_headers(headers)
+        if not info:
+            return
+        with self.lock:
+            key = self.state(api_key)
+            key.limits.update(info)
+            for kind in ('requests', 'tokens'):
+                if info.get(f'remaining_{kind}') == 0:
+                    reset = info.get(f'reset_{kind}') or CONFIG['key_throttle_seconds']
+                    key.available_at = max(key.available_at, time.monotonic() + reset)
+
+    def report_error(self, api_key: str, error: Exception):
+        """Bench a key after a rate-limit or quota error."""
+        text = str(error).lower()
+        with self.lock:
+            key = self.state(api_key)
+            if any(marker in text for marker in QUOTA_ERROR_MARKERS):
+                key.exhausted = True
+                key.available_at = time.monotonic() + CONFIG['key_exhausted_cooldown']
+                logger.warning(f"{self.provider} key {key.key_id} out of quota; removed from rotation")
+            elif error_status(error) == 429 or 'rate limit' in text or 'rate_limit' in text:
+                headers = error_headers(error)
+                info = parse_rate_limit_headers(headers)
+                wait = parse_reset_seconds(headers.get('retry-after')) if headers else None
+                wait = wait or info.get('reset_requests') or info.get('reset_tokens') or CONFIG['key_throttle_seconds']
+                key.available_at = max(key.available_at, time.monotonic() + wait)
+                logger.info(f"{self.provider} key {key.key_id} throttled for {wait:.1f}s")
+
+
+key_pools = {}
+key_pools_lock = threading.Lock()
+
+
+def get_key_pool(provider: str) -> KeyPool:
+    with key_pools_lock:
+        if provider not in key_pools:
+            key_pools[provider] = KeyPool(provider, PROVIDER_KEYS[provider])
+            logger.info(f"{provider} key pool with {len(PROVIDER_KEYS[provider])} keys")
+        return key_pools[provider]
+
+
+async def pooled_call(provider: str, prompt_text: str, make_request, slot=None):
+    """Run `make_request(api_key)` on the best key, under that key's rate limiter.
+
+    `make_request` should return a raw response (SDK `with_raw_response`) so its
+    rate-limit headers can be read; plain parsed responses are accepted too.
+    `slot` (adaptive_concurrency.SendSlot) is entered only around the call itself,
+    once the key and its rate-limit budget are available. Returns the parsed response.
+    """
+    pool = get_key_pool(provider)
+    api_key = await pool.acquire()
+
+    async def send():
+        async with slot or nullcontext():
+            raw = await make_request(api_key)
+        pool.update_from_headers(api_key, getattr(raw, 'headers', None))
+        return raw.parse() if hasattr(raw, 'parse') else raw
+
+    try:
+        return await rate_limited_call(provider, api_key, prompt_text, send)
+    except Exception as e:
+        pool.report_error(api_key, e)
+        raise
+    finally:
+        pool.release(api_key)
@@ -1,12 +1,26 @@
 """Main entry point."""
 import os
 import sys
+import asyncio
+import argparse
 import logging
-import concurrent.futures
 
 from config import OPENAI_MODELS_MAIN, CLAUDE_MODELS, MISTRAL_MODELS, CONFIG
 from prompts import GLOBAL_PROMPT_TEMPLATE
 from file_processor import process_file
+from metrics import log_run_summary
+from adaptive_concurrency import log_concurrency_summary
+from journal import open_journal, prompt_hash
+from dead_letter import open_dead_letters, report_incomplete_cells
+from result_writer import ResultWriter, open_sinks
+from results_db import open_results_db
+from utils import attach_resume_to_prompt
+from design import condition_texts
+from batch_mode import run_batch_mode
+from client_registry import close_clients
+from dispatcher import preflight_models
+from response_cache import get_response_cache
+from response_archive import close_response_archive
 
 log_dir = os.getenv('OUTPUT_DIR', '.')
 logging.basicConfig(
@@ -20,9 +34,25 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
+def parse_args():
+    parser = argparse.ArgumentParser(description="Evaluate resumes with LLM models.")
+    parser.add_argument('--mode', choices=['interactive', 'batch'], default='interactive',
+                        help="interactive: live API calls; batch: OpenAI/Anthropic batch APIs")
+    parser.add_argument('--batch-backend', choices=['provider', 'local'], default='provider',
+                        help="'local' uses a file-based stand-in for the batch endpoints (no network)")
+    parser.add_argument('--resume-batch', metavar='INDEX_JSON',
+                        help="collect batches recorded in a batches/request_index_*.json instead of submitting")
+    parser.add_argument('--skip-preflight', action='store_true',
+                        help="do not probe each model's availability before scheduling interactive tasks")
+    parser.add_argument('--resumes', choices=['files', 'design'], default='files',
+                        help="files: resumes/md_extracted; design: conditions generated in memory by design.py")
+    return parser.parse_args()
+
+
 def main():
     """Orchestrate resume processing with LLM models."""
-    logger.info("Starting processing...")
+    args = parse_args()
+    logger.info(f"Starting processing ({args.mode} mode)...")
     logger.info(f"OpenAI models to process: {OPENAI_MODELS_MAIN}")
     logger.info(f"Claude models to process: {CLAUDE_MODELS}")
     logger.info(f"Mistral models to process: {MISTRAL_MODELS}")
@@ -37,16 +67,15 @@ def main():
     os.makedirs(anthropic_output_directory, exist_ok=True)
     os.makedirs(mistral_output_directory, exist_ok=True)
 
-    directory = 'resumes/md_extracted'
-    files = os.listdir(directory)
+    resumes = load_resumes(args.resumes)
 
     tasks = []
-    for file_name in files:
+    for file_name, resume_text in resumes.items():
         for i, model in enumerate(OPENAI_MODELS_MAIN):
             tasks.append({
                 'file_name': file_name,
                 'model': model,
-                'directory': directory,
+                'resume_text': resume_text,
                 'output_directory': openai_output_directory,
                 'provider': 'openai',
                 'group': i % 3
@@ -56,7 +85,7 @@ def main():
             tasks.append({
                 'file_name': file_name,
                 'model': model,
-                'directory': directory,
+                'resume_text': resume_text,
                 'output_directory': anthropic_output_directory,
                 'provider': 'anthropic',
                 'group': 0
@@ -66,7 +95,7 @@ def main():
             tasks.append({
                 'file_name': file_name,
                 'model': model,
-                'directory': directory,
+                'resume_text': resume_text,
                 'output_directory': mistral_output_directory,
                 'provider': 'mistral',
                 'group': 0
@@ -74,51 +103,158 @@ def main():
     
     logger.info(f"Created {len(tasks)} tasks for processing")
     
-    if not tasks:
-        logger.warning("No tasks to process. Exiting.")
-        return
+    journal = open_journal(output_base)
+    dead_letters = open_dead_letters(output_base)
+    results_db = open_results_db(output_base)
+    try:
+        all_tasks = tasks
+        tasks = filter_journaled_tasks(tasks, journal)
+        if results_db:
+            # Results journaled before the database existed (or by batch mode), and every cell's status
+            results_db.backfill(journal)
+            remaining = {id(task) for task in tasks}
+            for task in all_tasks:
+                status = 'pending' if id(task) in remaining else 'done'
+                results_db.record_task(task['file_name'], task['model'], task['prompt_digest'], status)
+        
+        if not tasks:
+            logger.warning("No tasks to process. Exiting.")
+            return
+        
+        if args.mode == 'batch':
+            run_batch_mode(tasks, journal, dead_letters, output_base, args.batch_backend, args.resume_batch)
+            if results_db:
+                results_db.backfill(journal)
+                record_task_statuses(tasks, journal, results_db)
+            return
+        
+        logger.info(
+            f"Starting execution of {len(tasks)} tasks with provider concurrency caps "
+            f"{CONFIG['provider_concurrency']}"
+        )
+        sinks = open_sinks(output_base) + ([results_db] if results_db else [])
+        writer = ResultWriter(journal, sinks)
+        try:
+            asyncio.run(run_tasks(tasks, journal, dead_letters, writer, results_db, preflight=not args.skip_preflight))
+        finally:
+            writer.close()
+    finally:
+        if results_db:
+            results_db.close()
+        close_response_archive()
+        journal.close()
+        dead_letters.close()
+
+
+def load_resumes(source: str) -> dict:
+    """{resume name: resume text}: the files in resumes/md_extracted, or the design's conditions by ID."""
+    if source == 'design':
+        resumes = condition_texts()
+        logger.info(f"Generated {len(resumes)} design conditions in memory")
+        return resumes
+    directory = 'resumes/md_extracted'
+    resumes = {}
+    # Skip dotfiles such as pdf_utils' extraction manifest
+    for file_name in sorted(f for f in os.listdir(directory) if not f.startswith('.')):
+        with open(os.path.join(directory, file_name), 'r', encoding='utf-8') as f:
+            resumes[file_name] = f.read()
+    return resumes
+
+
+def record_task_statuses(tasks, journal, results_db):
+    """Mark each task 'done' or 'incomplete' in the run database from its journaled iterations."""
+    for task in tasks:
+        done = len(journal.completed_iterations(task['file_name'], task['model'], task['prompt_digest']))
+        status = 'done' if done >= CONFIG['iterations_per_file'] else 'incomplete'
+        results_db.record_task(task['file_name'], task['model'], task['prompt_digest'], status)
+
+
+def filter_journaled_tasks(tasks, journal):
+    """Drop tasks the journal shows as complete and written; log what remains."""
+    prompt_digests = {}
+    remaining = []
+    journaled_iterations = 0
+    missing_iterations = 0
     
-    logger.info(f"Starting execution of {len(tasks)} tasks with max_workers={CONFIG['max_workers']}")
+    for task in tasks:
+        if task['file_name'] not in prompt_digests:
+            prompt = attach_resume_to_prompt(task['resume_text'], GLOBAL_PROMPT_TEMPLATE)
+            prompt_digests[task['file_name']] = prompt_hash(prompt)
+        digest = prompt_digests[task['file_name']]
+        task['prompt_digest'] = digest
+        
+        done = len(journal.completed_iterations(task['file_name'], task['model'], digest))
+        missing = CONFIG['iterations_per_file'] - done
+        unwritten = journal.unflushed_results(task['file_name'], task['model'], digest)
+        journaled_iterations += done
+        missing_iterations += max(missing, 0)
+        
+        if missing > 0 or unwritten:
+            remaining.append(task)
     
-    def execute_task(task):
+    logger.info(
+        f"Journal: {journaled_iterations} iterations already complete, {missing_iterations} to run; "
+        f"{len(tasks) - len(remaining)} tasks skipped"
+    )
+    return remaining
+
+
+async def run_tasks(tasks, journal, dead_letters, writer, results_db=None, preflight: bool = True):
+    """Run every (file, model) task concurrently on a single event loop."""
+    async def execute_task(task):
         """Execute a single processing task."""
+        if results_db:
+            results_db.record_task(task['file_name'], task['model'], task['prompt_digest'], 'running')
         try:
             logger.info(f"Starting task: {task['file_name']} with {task['model']} ({task['provider']})")
-            process_file(
+            await process_file(
                 task['file_name'],
                 task['model'],
-                task['directory'],
+                task['resume_text'],
                 task['output_directory'],
-                GLOBAL_PROMPT_TEMPLATE
+                GLOBAL_PROMPT_TEMPLATE,
+                journal,
+                dead_letters,
+                writer,
+                results_db
             )
             logger.info(f"Completed task: {task['file_name']} with {task['model']} ({task['provider']})")
+            if results_db:
+                record_task_statuses([task], journal, results_db)
             return True
         except Exception as e:
             logger.error(f"Error processing task {task['file_name']} with {task['model']}: {e}", exc_info=True)
+            if results_db:
+                results_db.record_task(task['file_name'], task['model'], task['prompt_digest'], 'failed')
             return False
     
-    # Execute tasks in parallel using ThreadPoolExecutor
-    with concurrent.futures.ThreadPoolExecutor(max_workers=CONFIG['max_workers']) as executor:
-        futures = {executor.submit(execute_task, task): task for task in tasks}
-        
-        completed = 0
-        failed = 0
+    # All tasks share one event loop; provider semaphores in the dispatcher bound requests in flight
+    completed = 0
+    failed = 0
+    
+    try:
+        response_cache = get_response_cache()
+        if preflight and not (response_cache and response_cache.mode == 'replay'):
+            # Disabled models' tasks still run, but fail fast and only write already-journaled rows
+            disabled = await preflight_models(sorted({task['model'] for task in tasks}))
+            if disabled:
+                logger.error(f"Models disabled by preflight: {disabled}")
         
-        for future in concurrent.futures.as_completed(futures):
-            task = futures[future]
-            try:
-                success = future.result()
-                if success:
-                    completed += 1
-                else:
-                    failed += 1
-            except Exception as e:
-                logger.error(f"Unexpected error in task {task['file_name']} with {task['model']}: {e}", exc_info=True)
+        for future in asyncio.as_completed([execute_task(task) for task in tasks]):
+            success = await future
+            if success:
+                completed += 1
+            else:
                 failed += 1
             
             logger.info(f"Progress: {completed + failed}/{len(tasks)} tasks completed ({completed} successful, {failed} failed)")
+    finally:
+        await close_clients()
     
     logger.info(f"All tasks completed. Successful: {completed}, Failed: {failed}, Total: {len(tasks)}")
+    report_incomplete_cells(tasks, journal, dead_letters)
+    log_run_summary()
+    log_concurrency_summary()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,94 @@
+"""Run-wide metrics collected while processing."""
+import threading
+import logging
+from collections import defaultdict
+
+logger = logging.getLogger(__name__)
+
+metrics_lock = threading.Lock()
+
+# model -> {'busy_seconds': time requests occupied window slots, 'slot_seconds': window size * wall time}
+slot_usage = defaultdict(lambda: {'busy_seconds': 0.0, 'slot_seconds': 0.0})
+
+# model -> billed token counts; 'cached_tokens' is the part of 'input_tokens' read from the provider's prompt cache
+token_usage = defaultdict(lambda: {'requests': 0, 'input_tokens': 0, 'cached_tokens': 0, 'cache_write_tokens': 0, 'output_tokens': 0})
+
+# model -> retries and seconds slept per error class, plus requests given up on per error class
+retry_usage = defaultdict(lambda: {'retries': defaultdict(int), 'wait_seconds': 0.0, 'failures': defaultdict(int)})
+
+
+def record_slot_usage(model: str, busy_seconds: float, slot_seconds: float):
+    """Add one task's window occupancy to the run totals."""
+    with metrics_lock:
+        usage = slot_usage[model]
+        usage['busy_seconds'] += busy_seconds
+        usage['slot_seconds'] += slot_seconds
+
+
+def slot_utilization(model: str = None) -> float:
+    """Fraction of available window slot time spent on in-flight requests."""
+    with metrics_lock:
+        if model is not None:
+            entries = [slot_usage[model]] if model in slot_usage else []
+        else:
+            entries = list(slot_usage.values())
+        busy = sum(u['busy_seconds'] for u in entries)
+        available = sum(u['slot_seconds'] for u in entries)
+    return busy / available if available else 0.0
+
+
+def record_token_usage(model: str, usage: dict):
+    """Add the token counts reported for one response."""
+    with metrics_lock:
+        totals = token_usage[model]
+        totals['requests'] += 1
+        for field, count in usage.items():
+            totals[field] += count or 0
+
+
+def record_retry(model: str, error_class: str, wait_seconds: float):
+    """Count one retry and the time slept before it."""
+    with metrics_lock:
+        stats = retry_usage[model]
+        stats['retries'][error_class] += 1
+        stats['wait_seconds'] += wait_seconds
+
+
+def record_retry_failure(model: str, error_class: str):
+    """Count a request that failed for good."""
+    with metrics_lock:
+        retry_usage[model]['failures'][error_class] += 1
+
+
+def retry_stats() -> dict:
+    """Snapshot of retry counts, wait time and failures per model."""
+    with metrics_lock:
+        return {
+            model: {'retries': dict(stats['retries']), 'wait_seconds': stats['wait_seconds'], 'failures': dict(stats['failures'])}
+            for model, stats in sorted(retry_usage.items())
+        }
+
+
+def log_run_summary():
+    """Log the metrics gathered over the run."""
+    with metrics_lock:
+        models = sorted(slot_usage)
+        usage_by_model = {model: dict(totals) for model, totals in sorted(token_usage.items())}
+    for model in models:
+        logger.info(f"Slot utilization for {model}: {slot_utilization(model):.1%}")
+    logger.info(f"Overall slot utilization: {slot_utilization():.1%}")
+    
+    for model, totals in usage_by_model.items():
+        cached_share = totals['cached_tokens'] / totals['input_tokens'] if totals['input_tokens'] else 0.0
+        logger.info(
+            f"Token usage for {model}: {totals['requests']} requests, "
+            f"{totals['input_tokens']} input ({totals['cached_tokens']} cached, {cached_share:.1%}; "
+            f"{totals['cache_write_tokens']} cache writes), {totals['output_tokens']} output"
+        )
+    
+    for model, stats in retry_stats().items():
+        retries = sum(stats['retries'].values())
+        logger.info(
+            f"Retries for {model}: {retries} ({stats['retries']}), "
+            f"{stats['wait_seconds']:.1f}s waiting; failed requests: {stats['failures'] or 0}"
+        )
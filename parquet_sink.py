@@ -0,0 +1,202 @@
+"""
+Optional columnar results store (Parquet), partitioned by provider, model and resume.
+
+Rows are typed once at write time:
+- Q1-Q17 are stored as int8.
+- ManipulationCheck is a dictionary-encoded categorical (YES / NO / UNKNOWN).
+- Iteration is int16.
+- Provider, model and resume are Hive partition directories
+  (provider=openai/model=gpt-4o/resume=resume_1_2/).
+
+Each file carries row-group statistics, so a reader can prune both columns and
+partitions instead of re-parsing every CSV. Requires pyarrow; without it the
+sink is disabled and the CSVs are unaffected.
+
+The CSVs and the journal stay the source of truth. Rows buffered here are
+written when a partition reaches CONFIG['parquet_max_rows_per_file'] and when
+the run ends. After a crash, rebuild the store from the journal:
+
+    python parquet_sink.py rebuild [--output-dir DIR]
+    python parquet_sink.py compact [--output-dir DIR]   # one file per partition after several runs
+    python parquet_sink.py load [--output-dir DIR] [--columns Q1 Q2 ...]
+"""
+import os
+import sys
+import time
+import uuid
+import shutil
+import argparse
+import logging
+from collections import defaultdict
+
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = ds = pq = None
+
+from config import CONFIG
+from utils import get_provider
+from journal import open_journal
+
+logger = logging.getLogger(__name__)
+
+def question_columns() -> list:
+    return [f'Q{i}' for i in range(1, CONFIG['num_questions'] + 1)]
+
+
+def results_schema():
+    """Schema of the data columns (partition columns live in the directory names)."""
+    return pa.schema(
+        [pa.field('Iteration', pa.int16())]
+        + [pa.field(q, pa.int8()) for q in question_columns()]
+        + [
+            pa.field('ManipulationCheck', pa.dictionary(pa.int8(), pa.string())),
+            pa.field('ThoughtProcess', pa.string()),
+            pa.field('prompt_hash', pa.string())
+        ]
+    )
+
+
+def resume_name(file_name: str) -> str:
+    return os.path.splitext(file_name)[0]
+
+
+def partition_path(directory: str, provider: str, model: str, resume: str) -> str:
+    return os.path.join(directory, f'provider={provider}', f'model={model}', f'resume={resume}')
+
+
+def rows_to_table(rows, prompt_digest: str):
+    """Typed Arrow table from result rows of one partition."""
+    columns = {'Iteration': [row['Iteration'] for row in rows]}
+    for q in question_columns():
+        columns[q] = [row[q] for row in rows]
+    columns['ManipulationCheck'] = [row['ManipulationCheck'] for row in rows]
+    columns['ThoughtProcess'] = [row['ThoughtProcess'] for row in rows]
+    columns['prompt_hash'] = [prompt_digest] * len(rows)
+    return pa.Table.from_pydict(columns, schema=results_schema())
+
+
+class ParquetSink:
+    """Buffers result rows per partition and writes them as Parquet files."""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.run_id = time.strftime('%Y%m%dT%H%M%S') + '-' + uuid.uuid4().hex[:6]
+        # (provider, model, resume, prompt_hash) -> rows
+        self.buffers = defaultdict(list)
+        self.files_written = 0
+
+    def add(self, file_name: str, model: str, prompt_digest: str, rows):
+        """Buffer rows of one (resume, model) cell; writes a file once the partition is full."""
+        key = (get_provider(model), model, resume_name(file_name), prompt_digest)
+        self.buffers[key].extend(rows)
+        if len(self.buffers[key]) >= CONFIG['parquet_max_rows_per_file']:
+            self.write_partition(key)
+
+    def write_partition(self, key):
+        rows = self.buffers.pop(key, [])
+        if not rows:
+            return
+        provider, model, resume, prompt_digest = key
+        path = partition_path(self.directory, provider, model, resume)
+        os.makedirs(path, exist_ok=True)
+        file_path = os.path.join(path, f'part-{self.run_id}-{self.files_written:05d}.parquet')
+        pq.write_table(
+            rows_to_table(rows, prompt_digest), file_path,
+            compression='zstd', row_group_size=CONFIG['parquet_row_group_size'], write_statistics=True
+        )
+        self.files_written += 1
+
+    def close(self):
+        """Write every buffered partition."""
+        for key in list(self.buffers):
+            self.write_partition(key)
+        logger.info(f"Parquet sink wrote {self.files_written} files under {self.directory}")
+
+
+def open_parquet_sink(output_base: str):
+    """The configured Parquet sink, or None when disabled or pyarrow is missing."""
+    if not CONFIG['parquet_sink']:
+        return None
+    if pa is None:
+        logger.warning("CONFIG['parquet_sink'] is on but pyarrow is not installed; skipping Parquet output")
+        return None
+    return ParquetSink(os.path.join(output_base, CONFIG['parquet_dir']))
+
+
+def rebuild_from_journal(journal, directory: str) -> int:
+    """Rewrite the whole store from the journal's results; returns the number of rows."""
+    if os.path.exists(directory):
+        shutil.rmtree(directory)
+    sink = ParquetSink(directory)
+    total = 0
+    with journal.lock:
+        cells = {key: list(rows.values()) for key, rows in journal.results.items()}
+    for (file_name, model, prompt_digest), rows in sorted(cells.items()):
+        sink.add(file_name, model, prompt_digest, sorted(rows, key=lambda row: row['Iteration']))
+        total += len(rows)
+    sink.close()
+    return total
+
+
+def compact(directory: str) -> int:
+    """Merge each partition's files (one per run) into a single file; returns partitions merged."""
+    merged = 0
+    for path, _, files in os.walk(directory):
+        parts = sorted(f for f in files if f.endswith('.parquet'))
+        if len(parts) < 2:
+            continue
+        table = pa.concat_tables(pq.read_table(os.path.join(path, f), schema=results_schema()) for f in parts)
+        table = table.sort_by('Iteration')
+        tmp_path = os.path.join(path, 'compacted.tmp')
+        pq.write_table(table, tmp_path, compression='zstd', row_group_size=CONFIG['parquet_row_group_size'],
+                       write_statistics=True)
+        for f in parts:
+            os.remove(os.path.join(path, f))
+        os.replace(tmp_path, os.path.join(path, f'part-compacted-{uuid.uuid4().hex[:6]}.parquet'))
+        merged += 1
+    return merged
+
+
+def load_results(directory: str, columns=None, filter=None):
+    """Load the store as one Arrow table, reading only `columns` and partitions matching `filter`.
+
+    Example: load_results(path, columns=['model', 'Q1'], filter=ds.field('provider') == 'openai')
+    """
+    dataset = ds.dataset(directory, format='parquet', partitioning='hive')
+    return dataset.to_table(columns=columns, filter=filter)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or load the Parquet results store.")
+    parser.add_argument('command', choices=['rebuild', 'compact', 'load'])
+    parser.add_argument('--output-dir', default=os.getenv('OUTPUT_DIR', '.'))
+    parser.add_argument('--columns', nargs='+', help="columns to load (default: all)")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    if pa is None:
+        sys.exit("pyarrow is not installed")
+    directory = os.path.join(args.output_dir, CONFIG['parquet_dir'])
+
+    if args.command == 'rebuild':
+        journal = open_journal(args.output_dir)
+        try:
+            rows = rebuild_from_journal(journal, directory)
+        finally:
+            journal.close()
+        print(f"Rebuilt {directory} with {rows} rows")
+    elif args.command == 'compact':
+        print(f"Compacted {compact(directory)} partitions under {directory}")
+    else:
+        start = time.perf_counter()
+        table = load_results(directory, columns=args.columns)
+        elapsed = time.perf_counter() - start
+        print(f"Loaded {table.num_rows} rows x {table.num_columns} columns in {elapsed * 1000:.1f} ms")
+        print(table.schema)
+
+
+if __name__ == "__main__":
+    main()
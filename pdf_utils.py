@@ -1,57 +1,324 @@
+"""
+PDF splitting and text extraction for the resume variants.
+
+Every variant is a subset of the pages of resumes/resume.pdf (see
+page_groups), so build_variant_texts extracts each source page once.
+Page text is cached under resumes/.page_cache/, keyed by (source PDF
+SHA-256, page number). Variants are assembled straight from the cached
+pages, and no intermediate PDFs are written. The split PDFs in
+resume_extracted/ are optional (--write-pdfs).
+
+When only the split PDFs exist, process_pdf_files extracts them
+incrementally and in parallel:
+- A manifest in the text directory records the SHA-256 of every PDF and of
+  the text extracted from it.
+- A PDF whose hash (and extractor version) is unchanged, and whose text file
+  is still intact, is skipped without being opened.
+- Changed PDFs are extracted in a process pool, one file per worker task.
+
+Extraction runs in two stages. Worker processes read the text layer of each
+page; pages without one are rendered and handed to a bounded pool of
+tesseract workers (OCR_WORKERS). OCR output is cached under
+resumes/.ocr_cache/ by rendered-image hash, so a scanned page shared by
+several PDFs is recognized once.
+
+Text files are written atomically (temporary file + rename), and only when
+their content changed. split_pdf skips variants already newer than the
+source PDF.
+"""
 import PyPDF2
+import io
 import os
+import json
+import hashlib
+import argparse
+import logging
+from concurrent.futures import ProcessPoolExecutor
+
 import pdfplumber
 import pytesseract
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_NAME = '.extract_manifest.json'
+# Bump when extraction output changes, so every PDF is extracted again
+EXTRACTOR_VERSION = 2
+OCR_PLACEHOLDER = "This page may contain images or non-standard text encoding."
+OCR_CACHE_DIR = 'resumes/.ocr_cache'
+OCR_WORKERS = min(4, os.cpu_count() or 1)
+# Scanned pages are OCR'd at OCR_RESOLUTION (dpi), which is enough for plain
+# text; pages where that finds fewer than OCR_MIN_CHARS characters are
+# rendered again at OCR_RETRY_RESOLUTION
+OCR_RESOLUTION = 72
+OCR_RETRY_RESOLUTION = 200
+OCR_MIN_CHARS = 20
+
 
 def split_pdf(input_pdf_path, output_pdf_paths, page_groups):
     with open(input_pdf_path, 'rb') as input_pdf_file:
         reader = PyPDF2.PdfReader(input_pdf_file)
-        
+
         for output_pdf_path in output_pdf_paths:
             os.makedirs(os.path.dirname(output_pdf_path), exist_ok=True)
-        
+
+        source_mtime = os.path.getmtime(input_pdf_path)
         for output_pdf_path, pages in zip(output_pdf_paths, page_groups):
+            if os.path.exists(output_pdf_path) and os.path.getmtime(output_pdf_path) >= source_mtime:
+                continue
             writer = PyPDF2.PdfWriter()
-            
+
             for page_num in pages:
                 try:
                     writer.add_page(reader.pages[page_num - 1])
                 except IndexError:
-                    print(f"Page number {page_num} is out of range for {input_pdf_path}")
+                    logger.warning(f"Page number {page_num} is out of range for {input_pdf_path}")
                     continue
-            
+
             try:
                 with open(output_pdf_path, 'wb') as output_pdf_file:
                     writer.write(output_pdf_file)
             except Exception as e:
-                print(f"Failed to write {output_pdf_path}: {e}")
+                logger.error(f"Failed to write {output_pdf_path}: {e}")
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def text_sha256(text: str) -> str:
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def atomic_write(path: str, data: str):
+    """Write `data` to `path` via a temporary file and rename, so readers never see a partial file."""
+    tmp_path = os.path.join(os.path.dirname(path), f'.{os.path.basename(path)}.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def render_page(page, resolution: int = OCR_RESOLUTION) -> tuple:
+    """(SHA-256 of the rendered pixels, PNG bytes) of a pdfplumber page."""
+    image = page.to_image(resolution=resolution).original
+    digest = hashlib.sha256(f'{image.mode}{image.size}'.encode('utf-8') + image.tobytes()).hexdigest()
+    buffer = io.BytesIO()
+    image.save(buffer, format='PNG')
+    return digest, buffer.getvalue()
+
+
+def read_pages(pdf_file: str, page_numbers=None) -> list:
+    """Worker: [(page number, text, rendered)] for `page_numbers` (1-based; default every page).
+
+    Only the text layer is read here. A page without one gets text None and
+    is rendered for the OCR stage (see render_page); other pages are never rendered.
+    """
+    with pdfplumber.open(pdf_file) as pdf:
+        pages = []
+        for page_num in page_numbers or range(1, len(pdf.pages) + 1):
+            page = pdf.pages[page_num - 1]
+            text = page.extract_text()
+            pages.append((page_num, text, None) if text else (page_num, None, render_page(page)))
+    return pages
+
+
+def limit_tesseract_threads():
+    # One tesseract thread per OCR worker, so the pool size bounds the CPUs used
+    os.environ['OMP_THREAD_LIMIT'] = '1'
+
+
+def ocr_page(job) -> str:
+    """OCR worker: text of one rendered page, re-rendered at OCR_RETRY_RESOLUTION if the first pass finds next to nothing."""
+    pdf_file, page_num, png = job
+    try:
+        text = pytesseract.image_to_string(Image.open(io.BytesIO(png)))
+        if len(text.strip()) < OCR_MIN_CHARS:
+            with pdfplumber.open(pdf_file) as pdf:
+                image = pdf.pages[page_num - 1].to_image(resolution=OCR_RETRY_RESOLUTION).original
+            retry = pytesseract.image_to_string(image)
+            if len(retry.strip()) > len(text.strip()):
+                text = retry
+    except pytesseract.TesseractNotFoundError as e:
+        # Its constructor takes no arguments, so it cannot be unpickled in the parent (BrokenProcessPool)
+        raise RuntimeError(str(e)) from None
+    return text if text.strip() else OCR_PLACEHOLDER
 
-def process_pdf_files(pdf_dir, txt_dir):
+
+def run_ocr(rendered_pages, cache_dir: str = OCR_CACHE_DIR, workers: int = OCR_WORKERS) -> dict:
+    """OCR stage: {image SHA-256: text} for [(pdf file, page number, (image SHA-256, PNG))].
+
+    Each distinct page image is OCR'd once, by a pool of at most `workers`
+    tesseract processes; results are cached in `cache_dir` by image hash.
+    """
+    cache_dir = os.path.join(cache_dir, f'v{EXTRACTOR_VERSION}')
+    os.makedirs(cache_dir, exist_ok=True)
+    texts = {}
+    jobs = {}
+    for pdf_file, page_num, (image_hash, png) in rendered_pages:
+        if image_hash in texts or image_hash in jobs:
+            continue
+        path = os.path.join(cache_dir, f'{image_hash}.txt')
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                texts[image_hash] = f.read()
+        else:
+            jobs[image_hash] = (pdf_file, page_num, png)
+
+    if jobs:
+        # Fails here, with tesseract's own message, rather than in every worker
+        pytesseract.get_tesseract_version()
+        with ProcessPoolExecutor(max_workers=max(1, min(workers, len(jobs))), initializer=limit_tesseract_threads) as pool:
+            for image_hash, text in zip(jobs, pool.map(ocr_page, jobs.values())):
+                atomic_write(os.path.join(cache_dir, f'{image_hash}.txt'), text)
+                texts[image_hash] = text
+    if rendered_pages:
+        logger.info(f"OCR: {len(rendered_pages)} pages, {len(texts) - len(jobs)} distinct images cached, {len(jobs)} recognized")
+    return texts
+
+
+def read_pdfs(jobs, workers=None, ocr_workers: int = OCR_WORKERS, ocr_cache_dir: str = OCR_CACHE_DIR) -> list:
+    """{page number: text} for each (pdf file, page numbers or None) job: text layers in parallel, then the OCR stage."""
+    jobs = list(jobs)
+    if not jobs:
+        return []
+    with ProcessPoolExecutor(max_workers=max(1, min(workers or os.cpu_count() or 1, len(jobs)))) as pool:
+        results = list(pool.map(read_pages, *zip(*jobs)))
+    rendered_pages = [
+        (pdf_file, page_num, rendered)
+        for (pdf_file, _), pages in zip(jobs, results)
+        for page_num, _, rendered in pages if rendered
+    ]
+    ocr_texts = run_ocr(rendered_pages, ocr_cache_dir, ocr_workers)
+    return [
+        {page_num: text if rendered is None else ocr_texts[rendered[0]] for page_num, text, rendered in pages}
+        for pages in results
+    ]
+
+
+def cached_page_texts(source_pdf: str, page_numbers, cache_dir: str, workers=None, ocr_workers: int = OCR_WORKERS) -> dict:
+    """{page number: text} for `page_numbers` of `source_pdf`, extracting only pages not cached yet.
+
+    The cache key is (source SHA-256, page number), so editing the source PDF invalidates every page.
+    """
+    source_dir = os.path.join(cache_dir, file_sha256(source_pdf))
+    os.makedirs(source_dir, exist_ok=True)
+    texts = {}
+    missing = []
+    for page_num in sorted(set(page_numbers)):
+        path = os.path.join(source_dir, f'page_{page_num:04d}.txt')
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                texts[page_num] = f.read()
+        else:
+            missing.append(page_num)
+
+    if missing:
+        worker_count = max(1, min(workers or os.cpu_count() or 1, len(missing)))
+        chunks = [missing[i::worker_count] for i in range(worker_count)]
+        for extracted in read_pdfs([(source_pdf, chunk) for chunk in chunks], workers, ocr_workers):
+            for page_num, text in extracted.items():
+                atomic_write(os.path.join(source_dir, f'page_{page_num:04d}.txt'), text)
+                texts[page_num] = text
+    logger.info(f"Page text for {source_pdf}: {len(texts) - len(missing)} cached, {len(missing)} extracted")
+    return texts
+
+
+def build_variant_texts(source_pdf: str, variant_names, page_groups, txt_dir: str, cache_dir: str,
+                        workers=None, ocr_workers: int = OCR_WORKERS) -> int:
+    """Write each variant's text (its pages' text joined as process_pdf_files would); returns files written."""
+    os.makedirs(txt_dir, exist_ok=True)
+    with open(source_pdf, 'rb') as f:
+        page_count = len(PyPDF2.PdfReader(f).pages)
+    wanted = {page_num for pages in page_groups for page_num in pages}
+    for page_num in sorted(wanted - set(range(1, page_count + 1))):
+        logger.warning(f"Page number {page_num} is out of range for {source_pdf}")
+    texts = cached_page_texts(source_pdf, wanted & set(range(1, page_count + 1)), cache_dir, workers, ocr_workers)
+
+    written = 0
+    for name, pages in zip(variant_names, page_groups):
+        text = "\n\n".join(texts[page_num] for page_num in pages if page_num in texts)
+        txt_file_path = os.path.join(txt_dir, f'{name}.txt')
+        current = None
+        if os.path.exists(txt_file_path):
+            with open(txt_file_path, 'r', encoding='utf-8') as f:
+                current = f.read()
+        if text != current:
+            atomic_write(txt_file_path, text)
+            written += 1
+    logger.info(f"Built {len(variant_names)} variant texts from {len(texts)} pages of {source_pdf} ({written} changed)")
+    return written
+
+
+def load_manifest(txt_dir: str) -> dict:
+    path = os.path.join(txt_dir, MANIFEST_NAME)
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return {}
+    if manifest.get('extractor_version') != EXTRACTOR_VERSION:
+        return {}
+    return manifest.get('files', {})
+
+
+def save_manifest(txt_dir: str, files: dict):
+    atomic_write(
+        os.path.join(txt_dir, MANIFEST_NAME),
+        json.dumps({'extractor_version': EXTRACTOR_VERSION, 'files': files}, indent=2, sort_keys=True)
+    )
+
+
+def is_current(entry: dict, pdf_hash: str, txt_file_path: str) -> bool:
+    """True when the manifest says this PDF was extracted as-is and its text file is untouched."""
+    if not entry or entry.get('pdf_sha256') != pdf_hash or not os.path.exists(txt_file_path):
+        return False
+    with open(txt_file_path, 'r', encoding='utf-8') as f:
+        return text_sha256(f.read()) == entry.get('txt_sha256')
+
+
+def process_pdf_files(pdf_dir, txt_dir, workers=None, ocr_workers: int = OCR_WORKERS):
+    """Extract every PDF in `pdf_dir` whose content changed into `txt_dir`; returns the number extracted."""
     os.makedirs(txt_dir, exist_ok=True)
 
-    pdf_files = [os.path.join(pdf_dir, f) for f in os.listdir(pdf_dir) if f.endswith('.pdf')]
+    pdf_files = sorted(os.path.join(pdf_dir, f) for f in os.listdir(pdf_dir) if f.endswith('.pdf'))
+    manifest = load_manifest(txt_dir)
+    updated = {}
+    changed = {}
 
     for pdf_file in pdf_files:
-        with pdfplumber.open(pdf_file) as pdf:
-            all_text = []
-            for page_num, page in enumerate(pdf.pages):
-                text = page.extract_text()
-                
-                if text:
-                    all_text.append(text)
-                else:
-                    image = page.to_image()
-                    ocr_text = pytesseract.image_to_string(image.original)
-                    if ocr_text.strip():
-                        all_text.append(ocr_text)
-                    else:
-                        all_text.append("This page may contain images or non-standard text encoding.")
-
-            txt_file_path = os.path.join(txt_dir, f"{os.path.splitext(os.path.basename(pdf_file))[0]}.txt")
-            with open(txt_file_path, 'w', encoding='utf-8') as txt_file:
-                txt_file.write("\n\n".join(all_text))
+        name = os.path.basename(pdf_file)
+        txt_file_path = os.path.join(txt_dir, f"{os.path.splitext(name)[0]}.txt")
+        pdf_hash = file_sha256(pdf_file)
+        if is_current(manifest.get(name), pdf_hash, txt_file_path):
+            updated[name] = manifest[name]
+        else:
+            changed[pdf_file] = (pdf_hash, txt_file_path)
+
+    if changed:
+        extracted = read_pdfs([(pdf_file, None) for pdf_file in changed], workers, ocr_workers)
+        for (pdf_file, (pdf_hash, txt_file_path)), pages in zip(changed.items(), extracted):
+            text = "\n\n".join(pages[page_num] for page_num in sorted(pages))
+            current = None
+            if os.path.exists(txt_file_path):
+                with open(txt_file_path, 'r', encoding='utf-8') as f:
+                    current = f.read()
+            if text != current:
+                atomic_write(txt_file_path, text)
+            updated[os.path.basename(pdf_file)] = {'pdf_sha256': pdf_hash, 'txt_sha256': text_sha256(text)}
+
+    if updated != manifest:
+        save_manifest(txt_dir, updated)
+    logger.info(f"Extracted {len(changed)} of {len(pdf_files)} PDFs into {txt_dir} ({len(pdf_files) - len(changed)} unchanged)")
+    return len(changed)
 
 input_pdf_path = 'resumes/resume.pdf'
+page_cache_dir = 'resumes/.page_cache'
 
 output_pdf_paths = [
     'resumes/resume_extracted/resume_1_4_5.pdf',
@@ -81,12 +348,27 @@ page_groups = [
     [6, 7],
     [1, 3],
     [6, 8]
-] 
+]
 def main():
-    split_pdf(input_pdf_path, output_pdf_paths, page_groups)
+    parser = argparse.ArgumentParser(description="Extract the resume variants' text.")
+    parser.add_argument('--write-pdfs', action='store_true', help="also write the split variant PDFs to resume_extracted/")
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--ocr-workers', type=int, default=OCR_WORKERS, help="tesseract processes for scanned pages")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
     pdf_dir = "resumes/resume_extracted"
     txt_dir = "resumes/md_extracted"
-    process_pdf_files(pdf_dir, txt_dir)
+
+    if not os.path.exists(input_pdf_path):
+        # Only the split PDFs are available
+        logger.info(f"{input_pdf_path} not found; extracting the PDFs in {pdf_dir}")
+        process_pdf_files(pdf_dir, txt_dir, args.workers, args.ocr_workers)
+        return
+
+    if args.write_pdfs:
+        split_pdf(input_pdf_path, output_pdf_paths, page_groups)
+    variant_names = [os.path.splitext(os.path.basename(path))[0] for path in output_pdf_paths]
+    build_variant_texts(input_pdf_path, variant_names, page_groups, txt_dir, page_cache_dir, args.workers, args.ocr_workers)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,143 @@
+"""Process-wide token-bucket rate limiting per provider and API key."""
+import time
+import asyncio
+import threading
+import logging
+from functools import lru_cache
+
+from config import CONFIG, RATE_LIMITS
+from utils import calculate_token_count, load_token_encoding, key_fingerprint
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """Bucket holding up to one minute of budget, refilled continuously."""
+
+    def __init__(self, per_minute: float):
+        self.capacity = per_minute
+        self.rate = per_minute / 60.0
+        self.level = per_minute
+        self.updated = time.monotonic()
+
+    def refill(self, now: float):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """Seconds until `amount` can be taken (requests larger than the bucket wait for a full one)."""
+        self.refill(now)
+        deficit = min(amount, self.capacity) - self.level
+        return deficit / self.rate if deficit > 0 else 0.0
+
+    def take(self, amount: float):
+        self.level -= amount
+
+
+class RateLimiter:
+    """Requests-per-minute and tokens-per-minute budget for one (provider, key).
+
+    Callers queue on an asyncio lock, so they are admitted in arrival order and
+    each waits only as long as the buckets need to refill.
+    """
+
+    def __init__(self, requests_per_minute: float, tokens_per_minute: float):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.queue_lock = asyncio.Lock()
+
+    async def acquire(self, estimated_tokens: int) -> float:
+        """Wait for budget and charge one request plus the estimated tokens.
+
+        Returns the number of seconds spent waiting.
+        """
+        waited = 0.0
+        async with self.queue_lock:
+            while True:
+                now = time.monotonic()
+                wait = max(
+                    self.requests.wait_time(1, now),
+                    self.tokens.wait_time(estimated_tokens, now)
+                )
+                if wait <= 0:
+                    break
+                waited += wait
+                await asyncio.sleep(wait)
+            self.requests.take(1)
+            self.tokens.take(estimated_tokens)
+        return waited
+
+    def reconcile(self, estimated_tokens: int, actual_tokens: int):
+        """Correct the token charge once the response reports real usage."""
+        self.tokens.take(actual_tokens - estimated_tokens)
+
+
+rate_limiters = {}
+rate_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(provider: str, api_key: str):
+    """Return the shared limiter for a provider and key, or None if the provider is unlimited."""
+    limits = RATE_LIMITS.get(provider)
+    if not limits:
+        return None
+    # Keys are held by fingerprint so the raw secret never sits in a dict key or log line
+    key_id = key_fingerprint(api_key)
+    with rate_limiters_lock:
+        limiter = rate_limiters.get((provider, key_id))
+        if limiter is None:
+            headroom = CONFIG['rate_limit_headroom']
+            limiter = RateLimiter(
+                limits['requests_per_minute'] * headroom,
+                limits['tokens_per_minute'] * headroom
+            )
+            rate_limiters[(provider, key_id)] = limiter
+            logger.info(
+                f"Rate limiter for {provider} key {key_id}: "
+                f"{limiter.requests.capacity:.0f} RPM, {limiter.tokens.capacity:.0f} TPM"
+            )
+    return limiter
+
+
+# Load the tokenizer at startup rather than in the first request
+load_token_encoding("gpt-4o")
+
+
+@lru_cache(maxsize=256)
+def estimate_prompt_tokens(text: str) -> int:
+    """Estimated prompt tokens; cached because every iteration of a task sends the same text."""
+    return calculate_token_count(text)
+
+
+def response_token_usage(response):
+    """Total tokens billed for a provider response, or None if it carries no usage."""
+    usage = getattr(response, 'usage', None)
+    if usage is None:
+        return None
+    total = getattr(usage, 'total_tokens', None)
+    if total is None:
+        total = (getattr(usage, 'input_tokens', 0) or 0) + (getattr(usage, 'output_tokens', 0) or 0)
+    return total
+
+
+async def rate_limited_call(provider: str, api_key: str, prompt_text: str, request):
+    """Await `request()` once the (provider, key) budget allows it.
+
+    The estimated prompt tokens are charged up front and corrected from the
+    usage reported in the response. A failed call keeps its charge, which
+    slows the next requests down after a rejection.
+    """
+    limiter = get_rate_limiter(provider, api_key)
+    if limiter is None:
+        return await request()
+    
+    estimated_tokens = estimate_prompt_tokens(prompt_text)
+    waited = await limiter.acquire(estimated_tokens)
+    if waited:
+        logger.debug(f"Waited {waited:.2f}s for {provider} rate limit budget")
+    
+    response = await request()
+    actual_tokens = response_token_usage(response)
+    if actual_tokens is not None:
+        limiter.reconcile(estimated_tokens, actual_tokens)
+    return response
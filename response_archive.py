@@ -0,0 +1,347 @@
+"""
+Compressed archive of every raw model response, with an offset index and parallel replay.
+
+Only responses that came back from an API are archived; a response cache
+hit was archived when it was first fetched. Each response is appended to a
+segment file as its own gzip member holding one JSON line, so
+`zcat segment-00000.jsonl.gz` reads a whole segment. Each segment has a
+small JSONL index with one entry per record: (resume, model, prompt hash,
+iteration, attempt) -> byte offset and length, loaded into a dict keyed by
+iteration when the archive is opened. A reader memory-maps the segment and
+decompresses just the slice it needs. A run
+starts a new segment, and a segment rolls over at
+CONFIG['response_archive_segment_bytes']. Index entries are written after
+their record, so a crash never leaves an entry pointing at a torn record.
+During a run, process_file archives from a worker thread, so compression
+and writes stay off the event loop.
+
+Parser fixes no longer need new API calls. Re-parse the archive in a process
+pool to regenerate the results CSVs (and the results database, if enabled):
+
+    python response_archive.py replay [--output-dir DIR] [--target DIR] [--workers N]
+    python response_archive.py show RESUME MODEL ITERATION [--attempt N] [--prompt-hash H]
+
+For each iteration, replay takes the first attempt that parses, as a live
+run would have.
+"""
+import os
+import csv
+import sys
+import json
+import mmap
+import zlib
+import time
+import argparse
+import itertools
+import threading
+import logging
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from config import CONFIG
+from utils import get_provider
+from parsers import build_result_row
+from result_writer import results_csv_path, csv_fieldnames
+from results_db import open_results_db
+from result_table import ResultTable
+
+logger = logging.getLogger(__name__)
+
+SEGMENT_PREFIX = 'segment-'
+SEGMENT_SUFFIX = '.jsonl.gz'
+INDEX_SUFFIX = '.idx'
+# Entries per replay work item
+REPLAY_CHUNK = 2000
+
+
+def gzip_member(data: bytes) -> bytes:
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    return compressor.compress(data) + compressor.flush()
+
+
+def read_record(segment: mmap.mmap, offset: int, length: int) -> dict:
+    return json.loads(zlib.decompress(segment[offset:offset + length], 31))
+
+
+class ResponseArchive:
+    """Append-only, segmented response store with per-segment offset indexes."""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        # (file_name, model, prompt_hash, iteration) -> attempts archived so far
+        self.attempts = defaultdict(int)
+        # (file_name, model, prompt_hash, iteration) -> index entries, and (file_name, model) -> prompt hashes
+        self.by_iteration = defaultdict(list)
+        self.prompt_hashes = defaultdict(set)
+        self.entries = self.load_index()
+        for entry in self.entries:
+            self.add_entry(entry)
+        self.segment_number = max((entry['segment'] for entry in self.entries), default=-1)
+        self.segment = self.index = None
+        self.segment_size = 0
+        self.archived = 0
+        self.readers = {}
+
+    def add_entry(self, entry: dict):
+        key = (entry['file'], entry['model'], entry['prompt_hash'], entry['iteration'])
+        self.attempts[key] = max(self.attempts[key], entry['attempt'] + 1)
+        self.by_iteration[key].append(entry)
+        self.prompt_hashes[(entry['file'], entry['model'])].add(entry['prompt_hash'])
+
+    def segment_path(self, number: int) -> str:
+        return os.path.join(self.directory, f'{SEGMENT_PREFIX}{number:05d}{SEGMENT_SUFFIX}')
+
+    def index_path(self, number: int) -> str:
+        return os.path.join(self.directory, f'{SEGMENT_PREFIX}{number:05d}{INDEX_SUFFIX}')
+
+    def load_index(self) -> list:
+        """Every index entry, with its segment number; a torn final line is skipped."""
+        entries = []
+        for name in sorted(os.listdir(self.directory)):
+            if not (name.startswith(SEGMENT_PREFIX) and name.endswith(INDEX_SUFFIX)):
+                continue
+            number = int(name[len(SEGMENT_PREFIX):-len(INDEX_SUFFIX)])
+            with open(os.path.join(self.directory, name), 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        logger.warning(f"Skipping unreadable archive index line in {name}")
+                        continue
+                    entry['segment'] = number
+                    entries.append(entry)
+        return entries
+
+    def roll_segment(self):
+        if self.segment:
+            self.segment.close()
+            self.index.close()
+        self.segment_number += 1
+        self.segment = open(self.segment_path(self.segment_number), 'ab')
+        self.index = open(self.index_path(self.segment_number), 'a', encoding='utf-8')
+        self.segment_size = self.segment.tell()
+
+    def record(self, file_name: str, model: str, prompt_digest: str, iteration: int, response: str):
+        """Archive one raw response as the next attempt of its iteration."""
+        with self.lock:
+            key = (file_name, model, prompt_digest, iteration)
+            attempt = self.attempts[key]
+            self.attempts[key] += 1
+            record = {
+                'file': file_name,
+                'model': model,
+                'prompt_hash': prompt_digest,
+                'iteration': iteration,
+                'attempt': attempt,
+                'time': time.time(),
+                'response': response
+            }
+            member = gzip_member((json.dumps(record, ensure_ascii=False) + '\n').encode('utf-8'))
+            if self.segment is None or self.segment_size >= CONFIG['response_archive_segment_bytes']:
+                self.roll_segment()
+            offset = self.segment_size
+            self.segment.write(member)
+            self.segment.flush()
+            self.segment_size += len(member)
+            entry = {field: record[field] for field in ('file', 'model', 'prompt_hash', 'iteration', 'attempt')}
+            entry.update(offset=offset, length=len(member))
+            self.index.write(json.dumps(entry, ensure_ascii=False) + '\n')
+            self.index.flush()
+            entry['segment'] = self.segment_number
+            self.entries.append(entry)
+            self.add_entry(entry)
+            self.archived += 1
+
+    def read(self, entry: dict) -> dict:
+        """The archived record behind an index entry."""
+        with self.lock:
+            if self.segment:
+                self.segment.flush()
+            number = entry['segment']
+            reader = self.readers.get(number)
+            if reader is None or len(reader) < entry['offset'] + entry['length']:
+                if reader is not None:
+                    reader.close()
+                with open(self.segment_path(number), 'rb') as f:
+                    reader = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                self.readers[number] = reader
+            return read_record(reader, entry['offset'], entry['length'])
+
+    def lookup(self, file_name: str, model: str, iteration: int, attempt: int = None,
+               prompt_digest: str = None) -> list:
+        """Archived records of one iteration (every attempt, or just `attempt`), for one prompt or all."""
+        with self.lock:
+            digests = [prompt_digest] if prompt_digest else sorted(self.prompt_hashes.get((file_name, model), ()))
+            entries = [
+                entry for digest in digests
+                for entry in self.by_iteration.get((file_name, model, digest, iteration), ())
+                if attempt is None or entry['attempt'] == attempt
+            ]
+        return [self.read(entry) for entry in entries]
+
+    def close(self):
+        with self.lock:
+            if self.segment:
+                self.segment.close()
+                self.index.close()
+                self.segment = None
+            for reader in self.readers.values():
+                reader.close()
+            self.readers.clear()
+        if self.archived:
+            logger.info(f"Archived {self.archived} raw responses under {self.directory}")
+
+
+response_archive = None
+response_archive_lock = threading.Lock()
+
+
+def get_response_archive():
+    """Process-wide archive under OUTPUT_DIR, or None when archiving is off."""
+    global response_archive
+    if not CONFIG['response_archive']:
+        return None
+    with response_archive_lock:
+        if response_archive is None:
+            directory = os.path.join(os.getenv('OUTPUT_DIR', '.'), CONFIG['response_archive_dir'])
+            response_archive = ResponseArchive(directory)
+    return response_archive
+
+
+def close_response_archive():
+    with response_archive_lock:
+        if response_archive is not None:
+            response_archive.close()
+
+
+def replay_chunk(segment_path: str, entries: list):
+    """Worker: parse a chunk of one segment's records.
+
+    Returns (ResultTable of the rows that parsed, their attempt numbers, error class counts).
+    """
+    # (file, model, prompt hash) -> [(attempt, row)]
+    cells = defaultdict(list)
+    errors = defaultdict(int)
+    with open(segment_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as segment:
+        for entry in entries:
+            try:
+                record = read_record(segment, entry['offset'], entry['length'])
+                row = build_result_row(record['model'], record['iteration'], record['response'])
+            except ValueError:
+                errors['validation'] += 1
+                continue
+            except Exception:
+                errors['parse'] += 1
+                continue
+            cells[(entry['file'], entry['model'], entry['prompt_hash'])].append((entry['attempt'], row))
+
+    table = ResultTable(capacity=len(entries))
+    attempts = []
+    for (file_name, model, prompt_digest), parsed in cells.items():
+        table.add(file_name, model, prompt_digest, [row for _, row in parsed])
+        attempts.extend(attempt for attempt, _ in parsed)
+    return table, np.array(attempts, dtype=np.int32), dict(errors)
+
+
+def quiet_worker():
+    # Missing-field warnings for thousands of responses would flood the console
+    logging.disable(logging.WARNING)
+
+
+def replay(archive: ResponseArchive, target: str, workers: int = None) -> dict:
+    """Re-parse every archived response and rewrite the results CSVs under `target`; returns counts."""
+    work = []
+    by_segment = defaultdict(list)
+    for entry in archive.entries:
+        by_segment[entry['segment']].append(entry)
+    for number, entries in by_segment.items():
+        for start in range(0, len(entries), REPLAY_CHUNK):
+            work.append((archive.segment_path(number), entries[start:start + REPLAY_CHUNK]))
+
+    parsed = ResultTable(capacity=len(archive.entries))
+    attempts = []
+    errors = defaultdict(int)
+    with ProcessPoolExecutor(max_workers=workers, initializer=quiet_worker) as pool:
+        futures = [pool.submit(replay_chunk, path, entries) for path, entries in work]
+        for future in futures:
+            table, chunk_attempts, chunk_errors = future.result()
+            parsed.extend_table(table)
+            attempts.append(chunk_attempts)
+            for error, count in chunk_errors.items():
+                errors[error] += count
+
+    # First parsing attempt per iteration, as a live run would have kept
+    order = parsed.sorted_indices(np.concatenate(attempts) if attempts else np.zeros(0, dtype=np.int32))
+    keys = np.stack([parsed.column(name)[order].astype(np.int64)
+                     for name in ('resume_id', 'model_id', 'prompt_id', 'iteration')], axis=1)
+    first = np.ones(len(order), dtype=bool)
+    first[1:] = np.any(keys[1:] != keys[:-1], axis=1)
+    chosen = parsed.take(order[first])
+
+    os.makedirs(target, exist_ok=True)
+    results_db = open_results_db(target)
+    handles = {}
+    try:
+        for (file_name, model, prompt_digest), cell in itertools.groupby(chosen.rows(), key=lambda r: r[:3]):
+            rows = [row for *_, row in cell]
+            path = results_csv_path(os.path.join(target, f'output_csvs_{get_provider(model)}'), file_name)
+            if path not in handles:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                handle = open(path, 'w', newline='', encoding='utf-8')
+                handles[path] = (handle, csv.DictWriter(handle, fieldnames=csv_fieldnames()))
+                handles[path][1].writeheader()
+            handles[path][1].writerows(rows)
+            if results_db:
+                results_db.add(file_name, model, prompt_digest, rows)
+    finally:
+        for handle, _ in handles.values():
+            handle.close()
+        if results_db:
+            results_db.close()
+
+    return {'responses': len(archive.entries), 'rows': len(chosen), 'csvs': len(handles), 'failed': dict(errors)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect or re-parse the raw response archive.")
+    parser.add_argument('--output-dir', default=os.getenv('OUTPUT_DIR', '.'))
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    replay_parser = subparsers.add_parser('replay', help="re-parse every archived response into fresh results tables")
+    replay_parser.add_argument('--target', help="where to write the results (default: <output-dir>/replayed)")
+    replay_parser.add_argument('--workers', type=int, default=None)
+    show_parser = subparsers.add_parser('show', help="print archived responses of one iteration")
+    show_parser.add_argument('resume')
+    show_parser.add_argument('model')
+    show_parser.add_argument('iteration', type=int)
+    show_parser.add_argument('--attempt', type=int)
+    show_parser.add_argument('--prompt-hash', help="only responses to this prompt (default: every prompt)")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    directory = os.path.join(args.output_dir, CONFIG['response_archive_dir'])
+    if not os.path.isdir(directory):
+        sys.exit(f"No response archive at {directory}")
+    archive = ResponseArchive(directory)
+    try:
+        if args.command == 'replay':
+            target = args.target or os.path.join(args.output_dir, 'replayed')
+            start = time.perf_counter()
+            counts = replay(archive, target, args.workers)
+            print(
+                f"Replayed {counts['responses']} responses into {counts['rows']} rows ({counts['csvs']} CSVs) "
+                f"under {target} in {time.perf_counter() - start:.1f}s; unparseable attempts: {counts['failed']}"
+            )
+        else:
+            for record in archive.lookup(args.resume, args.model, args.iteration, args.attempt, args.prompt_hash):
+                print(f"--- attempt {record['attempt']} ({time.ctime(record['time'])}) prompt {record['prompt_hash']}")
+                print(record['response'])
+    finally:
+        archive.close()
+
+
+if __name__ == "__main__":
+    main()
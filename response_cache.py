@@ -0,0 +1,185 @@
+"""Content-addressed on-disk cache of raw LLM responses.
+
+Entries are keyed by a hash of the exact request payload plus the iteration
+index and stored zlib-compressed under two-character shard directories.
+Modes (CONFIG['response_cache_mode'], overridable with RESPONSE_CACHE_MODE):
+
+- 'readwrite': serve hits, store misses
+- 'replay': serve hits only; a miss raises CacheMissError instead of calling the API
+- 'off': bypass the cache
+
+cached_call does the compression and file I/O in a worker thread, so the
+event loop keeps dispatching while entries are read and written.
+"""
+import os
+import asyncio
+import json
+import zlib
+import hashlib
+import threading
+import logging
+
+from config import CONFIG
+
+logger = logging.getLogger(__name__)
+
+
+class CacheMissError(Exception):
+    """Raised in replay mode when a request has no cached response."""
+
+
+class CachedText(str):
+    """Response text served from the cache rather than the API."""
+
+
+def request_cache_key(provider: str, payload: dict, iteration: int) -> str:
+    """Hash of the exact request payload sent to a provider for one iteration."""
+    canonical = json.dumps(
+        {'provider': provider, 'payload': payload, 'iteration': iteration},
+        sort_keys=True, separators=(',', ':'), ensure_ascii=False, default=str
+    )
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+class ResponseCache:
+    """Sharded response store with size-based, least-recently-used eviction."""
+
+    def __init__(self, directory: str, max_bytes: int, mode: str):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.mode = mode
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(directory, exist_ok=True)
+        self.total_bytes = sum(size for _, size, _ in self.entries())
+
+    def entry_path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], key[2:])
+
+    def entries(self):
+        """Yield (path, size, mtime) for every stored response."""
+        for shard in os.listdir(self.directory):
+            shard_dir = os.path.join(self.directory, shard)
+            if not os.path.isdir(shard_dir):
+                continue
+            for name in os.listdir(shard_dir):
+                if name.endswith('.tmp'):
+                    continue
+                path = os.path.join(shard_dir, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                yield path, stat.st_size, stat.st_mtime
+
+    def get(self, key: str):
+        """Cached response text for a key, or None."""
+        path = self.entry_path(key)
+        try:
+            with open(path, 'rb') as f:
+                text = zlib.decompress(f.read()).decode('utf-8')
+        except FileNotFoundError:
+            with self.lock:
+                self.misses += 1
+            return None
+        except zlib.error:
+            logger.warning(f"Discarding corrupt cache entry {path}")
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            with self.lock:
+                self.misses += 1
+            return None
+        
+        if self.mode == 'readwrite':
+            # Refresh mtime so eviction drops the least recently used entries first
+            try:
+                os.utime(path)
+            except FileNotFoundError:
+                # Evicted since it was read; the text is still good
+                pass
+        with self.lock:
+            self.hits += 1
+        return text
+
+    def put(self, key: str, text: str):
+        """Store a response atomically, evicting old entries past the size limit."""
+        if self.mode != 'readwrite' or text is None:
+            return
+        
+        path = self.entry_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        data = zlib.compress(text.encode('utf-8'), 6)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        
+        with self.lock:
+            self.total_bytes += len(data)
+            over_limit = self.total_bytes > self.max_bytes
+        if over_limit:
+            self.evict()
+
+    def evict(self):
+        """Remove least recently used entries until the store is at 90% of its limit."""
+        with self.lock:
+            entries = sorted(self.entries(), key=lambda entry: entry[2])
+            total = sum(size for _, size, _ in entries)
+            target = self.max_bytes * 0.9
+            removed = 0
+            for path, size, _ in entries:
+                if total <= target:
+                    break
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                total -= size
+                removed += 1
+            self.total_bytes = total
+        logger.info(f"Evicted {removed} cached responses; cache now {total / 1e6:.1f} MB")
+
+
+response_cache = None
+response_cache_lock = threading.Lock()
+
+
+def get_response_cache():
+    """Process-wide cache, or None when caching is off."""
+    global response_cache
+    mode = os.getenv('RESPONSE_CACHE_MODE', CONFIG['response_cache_mode'])
+    if mode == 'off':
+        return None
+    with response_cache_lock:
+        if response_cache is None:
+            directory = os.path.join(os.getenv('OUTPUT_DIR', '.'), CONFIG['response_cache_dir'])
+            response_cache = ResponseCache(directory, CONFIG['response_cache_max_bytes'], mode)
+            logger.info(f"Response cache at {directory} (mode={mode}, {response_cache.total_bytes / 1e6:.1f} MB)")
+    return response_cache
+
+
+async def cached_call(provider: str, payload: dict, iteration: int, request, refresh: bool = False):
+    """Return the cached response text for a payload, or await `request()` and store it.
+
+    `request` must return the response text. A hit is returned as CachedText.
+    With `refresh`, a cached response is ignored and replaced (except in replay
+    mode, which never calls the API).
+    """
+    cache = get_response_cache()
+    if cache is None:
+        return await request()
+    
+    key = request_cache_key(provider, payload, iteration)
+    text = await asyncio.to_thread(cache.get, key) if not refresh or cache.mode == 'replay' else None
+    if text is not None:
+        logger.debug(f"Response cache hit for {payload.get('model')} iteration {iteration}")
+        return CachedText(text)
+    if cache.mode == 'replay':
+        raise CacheMissError(f"No cached response for {payload.get('model')} iteration {iteration}")
+    
+    text = await request()
+    await asyncio.to_thread(cache.put, key, text)
+    return text
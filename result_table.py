@@ -0,0 +1,246 @@
+"""
+Compact, NumPy-backed container for result rows.
+
+A row dict (Model, Iteration, Q1..Q17, ManipulationCheck, ThoughtProcess)
+costs several hundred bytes of boxed Python objects. ResultTable stores the
+same data as preallocated columns instead:
+- int8 scores in one (rows x num_questions) array
+- int16 iterations
+- int8 manipulation-check codes
+- interned resume, model and prompt-hash IDs
+- thought-process text in a separate deduplicated string pool
+
+That is about 30 bytes per row plus the distinct thought-process strings,
+so millions of rows fit in memory.
+
+The table also accepts rows through the ResultWriter sink interface
+(`add`). It can be loaded from the journal or the results CSVs, and
+`to_pandas()` gives a DataFrame whose numeric columns are views of the
+table's arrays. Response replay and the analysis tools build on it.
+"""
+import os
+import csv
+import glob
+from collections import defaultdict
+
+import numpy as np
+
+from config import CONFIG
+
+MANIPULATION_CODES = {'NO': 0, 'YES': 1, 'UNKNOWN': 2}
+MANIPULATION_LABELS = ['NO', 'YES', 'UNKNOWN']
+INITIAL_CAPACITY = 1024
+
+
+class Interner:
+    """Bidirectional string <-> small integer ID mapping."""
+
+    def __init__(self, values=()):
+        self.ids = {}
+        self.values = []
+        for value in values:
+            self.id(value)
+
+    def id(self, value: str) -> int:
+        found = self.ids.get(value)
+        if found is None:
+            found = self.ids[value] = len(self.values)
+            self.values.append(value)
+        return found
+
+    def __len__(self):
+        return len(self.values)
+
+
+class ResultTable:
+    """Columnar result rows with geometric growth (amortized O(1) appends)."""
+
+    def __init__(self, capacity: int = INITIAL_CAPACITY):
+        self.num_questions = CONFIG['num_questions']
+        self.question_keys = [f'Q{q}' for q in range(1, self.num_questions + 1)]
+        self.size = 0
+        self.resumes = Interner()
+        self.models = Interner()
+        self.prompt_hashes = Interner()
+        self.thoughts = Interner()
+        self.allocate(max(capacity, 1))
+
+    def allocate(self, capacity: int):
+        self.resume_id = np.zeros(capacity, dtype=np.int32)
+        self.model_id = np.zeros(capacity, dtype=np.int16)
+        self.prompt_id = np.zeros(capacity, dtype=np.int32)
+        self.iteration = np.zeros(capacity, dtype=np.int16)
+        self.scores = np.zeros((capacity, self.num_questions), dtype=np.int8)
+        self.manipulation_check = np.zeros(capacity, dtype=np.int8)
+        self.thought_id = np.zeros(capacity, dtype=np.int32)
+
+    def column_names(self):
+        return ('resume_id', 'model_id', 'prompt_id', 'iteration', 'scores', 'manipulation_check', 'thought_id')
+
+    def reserve(self, capacity: int):
+        """Grow every column to hold at least `capacity` rows."""
+        current = len(self.iteration)
+        if capacity <= current:
+            return
+        new_capacity = max(capacity, current * 2)
+        for name in self.column_names():
+            old = getattr(self, name)
+            grown = np.zeros((new_capacity,) + old.shape[1:], dtype=old.dtype)
+            grown[:self.size] = old[:self.size]
+            setattr(self, name, grown)
+
+    def append(self, file_name: str, model: str, prompt_digest: str, row: dict):
+        """Add one result row (as produced by parsers.build_result_row); prefer `add` for many rows."""
+        self.add(file_name, model, prompt_digest, [row])
+
+    def add(self, file_name: str, model: str, prompt_digest: str, rows):
+        """Append the rows of one (resume, model) cell; also the ResultWriter sink interface."""
+        n = len(rows)
+        if not n:
+            return
+        self.reserve(self.size + n)
+        filled = slice(self.size, self.size + n)
+        self.resume_id[filled] = self.resumes.id(file_name)
+        self.model_id[filled] = self.models.id(model)
+        self.prompt_id[filled] = self.prompt_hashes.id(prompt_digest)
+        self.iteration[filled] = [int(row['Iteration']) for row in rows]
+        self.scores[filled] = [[int(row[q]) for q in self.question_keys] for row in rows]
+        unknown = MANIPULATION_CODES['UNKNOWN']
+        self.manipulation_check[filled] = [MANIPULATION_CODES.get(row['ManipulationCheck'], unknown) for row in rows]
+        self.thought_id[filled] = [self.thoughts.id(row['ThoughtProcess'] or '') for row in rows]
+        self.size += n
+
+    def close(self):
+        """Sink interface; the table stays usable."""
+
+    def __len__(self):
+        return self.size
+
+    @property
+    def nbytes(self) -> int:
+        """Bytes held by the (used part of the) columns, excluding the string pools."""
+        return sum(getattr(self, name)[:self.size].nbytes for name in self.column_names())
+
+    def column(self, name: str) -> np.ndarray:
+        """View of a column's filled rows."""
+        return getattr(self, name)[:self.size]
+
+    def row(self, i: int) -> dict:
+        """Row `i` as a results-CSV dict."""
+        row = {'Model': self.models.values[self.model_id[i]], 'Iteration': int(self.iteration[i])}
+        for q, score in enumerate(self.scores[i].tolist(), start=1):
+            row[f'Q{q}'] = score
+        row['ManipulationCheck'] = MANIPULATION_LABELS[self.manipulation_check[i]]
+        row['ThoughtProcess'] = self.thoughts.values[self.thought_id[i]]
+        return row
+
+    def rows(self, indices=None):
+        """Yield (resume file, model, prompt hash, row dict) for every row, or for `indices`."""
+        for i in (range(self.size) if indices is None else indices):
+            yield (
+                self.resumes.values[self.resume_id[i]], self.models.values[self.model_id[i]],
+                self.prompt_hashes.values[self.prompt_id[i]], self.row(i)
+            )
+
+    def take(self, indices) -> 'ResultTable':
+        """New table holding the rows at `indices` (in that order); string pools are shared."""
+        indices = np.asarray(indices, dtype=np.int64)
+        table = ResultTable(capacity=len(indices))
+        table.resumes, table.models, table.prompt_hashes, table.thoughts = (
+            self.resumes, self.models, self.prompt_hashes, self.thoughts
+        )
+        for name in self.column_names():
+            getattr(table, name)[:len(indices)] = self.column(name)[indices]
+        table.size = len(indices)
+        return table
+
+    def extend_table(self, other: 'ResultTable'):
+        """Append every row of `other`, remapping its interned IDs into this table's."""
+        n = len(other)
+        self.reserve(self.size + n)
+        remaps = {
+            'resume_id': np.array([self.resumes.id(v) for v in other.resumes.values], dtype=np.int32),
+            'model_id': np.array([self.models.id(v) for v in other.models.values], dtype=np.int16),
+            'prompt_id': np.array([self.prompt_hashes.id(v) for v in other.prompt_hashes.values], dtype=np.int32),
+            'thought_id': np.array([self.thoughts.id(v) for v in other.thoughts.values], dtype=np.int32),
+        }
+        for name in self.column_names():
+            values = other.column(name)
+            if name in remaps:
+                values = remaps[name][values] if n else values
+            getattr(self, name)[self.size:self.size + n] = values
+        self.size += n
+
+    def sorted_indices(self, *extra_keys) -> np.ndarray:
+        """Row order by resume, model and prompt hash (by name, not ID), then iteration, then `extra_keys`."""
+        def name_rank(interner: Interner) -> np.ndarray:
+            rank = np.empty(len(interner), dtype=np.int64)
+            rank[np.argsort(np.array(interner.values, dtype=object))] = np.arange(len(interner))
+            return rank
+
+        keys = [
+            name_rank(self.resumes)[self.column('resume_id')],
+            name_rank(self.models)[self.column('model_id')],
+            name_rank(self.prompt_hashes)[self.column('prompt_id')],
+            self.column('iteration'),
+        ] + list(extra_keys)
+        # lexsort's last key is the primary one
+        return np.lexsort(keys[::-1])
+
+    def cell_counts(self) -> dict:
+        """(resume file, model, prompt hash) -> number of rows, computed without a Python loop over rows."""
+        keys = np.stack([self.column('resume_id'), self.column('model_id').astype(np.int32), self.column('prompt_id')], axis=1)
+        cells, counts = np.unique(keys, axis=0, return_counts=True)
+        return {
+            (self.resumes.values[r], self.models.values[m], self.prompt_hashes.values[p]): int(c)
+            for (r, m, p), c in zip(cells.tolist(), counts.tolist())
+        }
+
+    def to_pandas(self, thought_process: bool = False):
+        """DataFrame over the table: score, iteration and code columns are views, not copies.
+
+        Resume, model and manipulation check are categoricals over the interned
+        IDs; pass thought_process=True to add the (materialized) text column.
+        """
+        # Imported here so replay workers and other numpy-only users skip pandas' import time
+        import pandas as pd
+
+        columns = {
+            'resume': pd.Categorical.from_codes(self.column('resume_id'), categories=self.resumes.values),
+            'model': pd.Categorical.from_codes(self.column('model_id'), categories=self.models.values),
+            'prompt_hash': pd.Categorical.from_codes(self.column('prompt_id'), categories=self.prompt_hashes.values),
+            'Iteration': self.column('iteration'),
+        }
+        scores = self.column('scores')
+        for q in range(self.num_questions):
+            columns[f'Q{q + 1}'] = scores[:, q]
+        columns['ManipulationCheck'] = pd.Categorical.from_codes(
+            self.column('manipulation_check'), categories=MANIPULATION_LABELS
+        )
+        if thought_process:
+            columns['ThoughtProcess'] = np.array(self.thoughts.values, dtype=object)[self.column('thought_id')]
+        return pd.DataFrame(columns, copy=False)
+
+    @classmethod
+    def from_journal(cls, journal) -> 'ResultTable':
+        """Every journaled result (the journal holds each iteration once)."""
+        with journal.lock:
+            cells = {key: list(rows.values()) for key, rows in journal.results.items()}
+        table = cls(capacity=sum(len(rows) for rows in cells.values()))
+        for (file_name, model, prompt_digest), rows in sorted(cells.items()):
+            table.add(file_name, model, prompt_digest, sorted(rows, key=lambda row: row['Iteration']))
+        return table
+
+    @classmethod
+    def from_csvs(cls, output_base: str) -> 'ResultTable':
+        """Every row of the per-provider results CSVs under `output_base` (prompt hash unknown: '')."""
+        table = cls()
+        for path in sorted(glob.glob(os.path.join(output_base, 'output_csvs_*', '*_results.csv'))):
+            file_name = os.path.basename(path)[:-len('_results.csv')]
+            by_model = defaultdict(list)
+            with open(path, 'r', newline='', encoding='utf-8') as f:
+                for row in csv.DictReader(f):
+                    by_model[row['Model']].append(row)
+            for model, rows in by_model.items():
+                table.add(file_name, model, '', rows)
+        return table
@@ -0,0 +1,138 @@
+"""Streaming results writer.
+
+Parsed rows are queued as soon as they are journaled, and a single background
+thread appends them to their results CSVs. It flushes every
+CONFIG['result_flush_rows'] rows or CONFIG['result_flush_seconds'] seconds,
+whichever comes first. The thread owns every CSV handle, so no lock is
+needed. Partial results reach disk (and the run.sh sync) while a cell is
+still running, and memory stays flat. After each flush the journal records
+the rows as written, so a restart neither loses nor duplicates rows.
+
+Written rows are also passed to optional sinks (see open_sinks) such as the
+Parquet store.
+"""
+import os
+import csv
+import time
+import queue
+import threading
+import logging
+from collections import defaultdict
+
+from config import CONFIG
+from journal import CompletionJournal
+from parquet_sink import open_parquet_sink
+
+logger = logging.getLogger(__name__)
+
+STOP = object()
+
+
+def results_csv_path(output_directory: str, file_name: str) -> str:
+    return os.path.join(output_directory, file_name.replace('.txt', '') + '_results.csv')
+
+
+def csv_fieldnames() -> list:
+    return ['Model', 'Iteration'] + [f'Q{i}' for i in range(1, CONFIG['num_questions'] + 1)] + ['ManipulationCheck', 'ThoughtProcess']
+
+
+def open_sinks(output_base: str) -> list:
+    """Extra destinations enabled in CONFIG for every written row."""
+    return [sink for sink in (open_parquet_sink(output_base),) if sink is not None]
+
+
+class ResultWriter:
+    """Background thread appending result rows to their CSVs (and any sinks) in small batches."""
+
+    def __init__(self, journal: CompletionJournal, sinks=()):
+        self.journal = journal
+        self.sinks = list(sinks)
+        self.queue = queue.Queue()
+        # csv path -> (file handle, DictWriter); only touched by the writer thread
+        self.writers = {}
+        # csv path -> [(journal key, row)] waiting for the next flush
+        self.buffers = defaultdict(list)
+        self.buffered = 0
+        self.written = 0
+        self.thread = threading.Thread(target=self.run, name='result-writer', daemon=True)
+        self.thread.start()
+
+    def submit(self, output_directory: str, file_name: str, model: str, prompt_digest: str, row: dict):
+        """Queue one journaled row for its resume's CSV."""
+        self.queue.put((results_csv_path(output_directory, file_name), (file_name, model, prompt_digest), row))
+
+    def submit_journaled(self, output_directory: str, file_name: str, model: str, prompt_digest: str):
+        """Queue a cell's journaled rows that are not in its CSV yet (e.g. from an interrupted run)."""
+        for row in self.journal.unflushed_results(file_name, model, prompt_digest):
+            self.submit(output_directory, file_name, model, prompt_digest, row)
+
+    def run(self):
+        last_flush = time.monotonic()
+        while True:
+            timeout = max(CONFIG['result_flush_seconds'] - (time.monotonic() - last_flush), 0.01)
+            try:
+                item = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+            if item is STOP:
+                break
+            if item is not None:
+                csv_path, key, row = item
+                self.buffers[csv_path].append((key, row))
+                self.buffered += 1
+            if self.buffered >= CONFIG['result_flush_rows'] or time.monotonic() - last_flush >= CONFIG['result_flush_seconds']:
+                self.flush()
+                last_flush = time.monotonic()
+        self.flush()
+        for handle, _ in self.writers.values():
+            handle.close()
+        self.writers.clear()
+        for sink in self.sinks:
+            try:
+                sink.close()
+            except Exception as e:
+                logger.error(f"Could not close result sink {type(sink).__name__}: {e}", exc_info=True)
+
+    def writer_for(self, csv_path: str):
+        if csv_path not in self.writers:
+            new_file = not os.path.exists(csv_path) or os.path.getsize(csv_path) == 0
+            handle = open(csv_path, 'a', newline='', encoding='utf-8')
+            writer = csv.DictWriter(handle, fieldnames=csv_fieldnames())
+            if new_file:
+                writer.writeheader()
+            self.writers[csv_path] = (handle, writer)
+        return self.writers[csv_path]
+
+    def flush(self):
+        """Append buffered rows, then note them as written in the journal."""
+        for csv_path, entries in self.buffers.items():
+            try:
+                handle, writer = self.writer_for(csv_path)
+                writer.writerows(row for _, row in entries)
+                handle.flush()
+            except OSError as e:
+                # The rows stay unflushed in the journal and are written by the next run
+                logger.error(f"Could not write {len(entries)} results to {csv_path}: {e}", exc_info=True)
+                continue
+
+            flushed = defaultdict(list)
+            for key, row in entries:
+                flushed[key].append(row)
+            for (file_name, model, prompt_digest), rows in flushed.items():
+                self.journal.record_flushed(file_name, model, prompt_digest, [row['Iteration'] for row in rows])
+                for sink in self.sinks:
+                    try:
+                        sink.add(file_name, model, prompt_digest, rows)
+                    except Exception as e:
+                        # Sinks are derived views; the CSV and journal stay complete
+                        logger.error(f"Result sink {type(sink).__name__} failed: {e}", exc_info=True)
+            self.written += len(entries)
+            logger.debug(f"Wrote {len(entries)} results to {csv_path}")
+        self.buffers.clear()
+        self.buffered = 0
+
+    def close(self):
+        """Write everything still queued and stop the thread."""
+        self.queue.put(STOP)
+        self.thread.join()
+        logger.info(f"Result writer finished: {self.written} rows written")
@@ -0,0 +1,281 @@
+"""
+SQLite results and task database (WAL mode) that can be queried while a run is going.
+
+The pipeline writes three tables from one background thread, in batched
+transactions:
+- tasks: one row per (resume, model, prompt hash) cell, with its status and counts
+- attempts: one row per API attempt (each retry is its own row), with the
+  seconds that call took and its outcome ('ok' or an error class); responses
+  served from the response cache get a 'cache_hit' row instead
+- results: one row per parsed iteration, unique per (resume, model, prompt hash, iteration)
+
+WAL mode lets main.py keep writing while the inspection CLI reads:
+
+    python results_db.py cells [--below 100]     # cells with fewer valid iterations
+    python results_db.py latency                 # API attempt latency and outcomes by model
+    python results_db.py tasks [--status running]
+    python results_db.py export DIR              # one deduplicated CSV per provider and resume
+"""
+import os
+import csv
+import sys
+import time
+import queue
+import sqlite3
+import argparse
+import threading
+import logging
+
+from config import CONFIG
+from utils import get_provider
+from result_writer import results_csv_path, csv_fieldnames
+
+logger = logging.getLogger(__name__)
+
+STOP = object()
+
+QUESTION_COLUMNS = [f'Q{i}' for i in range(1, CONFIG['num_questions'] + 1)]
+
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS tasks (
+    resume TEXT NOT NULL,
+    model TEXT NOT NULL,
+    prompt_hash TEXT NOT NULL,
+    provider TEXT NOT NULL,
+    status TEXT NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    PRIMARY KEY (resume, model, prompt_hash)
+);
+CREATE TABLE IF NOT EXISTS attempts (
+    id INTEGER PRIMARY KEY,
+    resume TEXT NOT NULL,
+    model TEXT NOT NULL,
+    iteration INTEGER NOT NULL,
+    outcome TEXT NOT NULL,
+    latency REAL NOT NULL,
+    finished_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS results (
+    resume TEXT NOT NULL,
+    model TEXT NOT NULL,
+    prompt_hash TEXT NOT NULL,
+    iteration INTEGER NOT NULL,
+    provider TEXT NOT NULL,
+    {', '.join(f'{q} INTEGER' for q in QUESTION_COLUMNS)},
+    manipulation_check TEXT,
+    thought_process TEXT,
+    written_at REAL NOT NULL,
+    PRIMARY KEY (resume, model, prompt_hash, iteration)
+);
+CREATE INDEX IF NOT EXISTS idx_results_cell ON results (resume, model, iteration);
+CREATE INDEX IF NOT EXISTS idx_attempts_model ON attempts (model, outcome);
+CREATE INDEX IF NOT EXISTS idx_tasks_status ON tasks (status);
+"""
+
+INSERT_RESULT = (
+    f"INSERT OR REPLACE INTO results (resume, model, prompt_hash, iteration, provider, "
+    f"{', '.join(QUESTION_COLUMNS)}, manipulation_check, thought_process, written_at) "
+    f"VALUES ({', '.join('?' * (len(QUESTION_COLUMNS) + 8))})"
+)
+
+
+def connect(path: str, readonly: bool = False) -> sqlite3.Connection:
+    if readonly:
+        connection = sqlite3.connect(f'file:{path}?mode=ro', uri=True, timeout=30)
+    else:
+        connection = sqlite3.connect(path, timeout=30)
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute('PRAGMA synchronous=NORMAL')
+    return connection
+
+
+def result_values(file_name: str, model: str, prompt_digest: str, row: dict, now: float) -> tuple:
+    return (
+        file_name, model, prompt_digest, row['Iteration'], get_provider(model),
+        *(row[q] for q in QUESTION_COLUMNS),
+        row['ManipulationCheck'], row['ThoughtProcess'], now
+    )
+
+
+class ResultsDatabase:
+    """Queue-fed writer thread for the run database; also a ResultWriter sink."""
+
+    def __init__(self, path: str):
+        self.path = path
+        connection = connect(path)
+        connection.executescript(SCHEMA)
+        connection.close()
+        self.queue = queue.Queue()
+        self.thread = threading.Thread(target=self.run, name='results-db', daemon=True)
+        self.thread.start()
+
+    def add(self, file_name: str, model: str, prompt_digest: str, rows):
+        """Sink interface: results just written to the CSV."""
+        now = time.time()
+        self.queue.put((INSERT_RESULT, [result_values(file_name, model, prompt_digest, row, now) for row in rows]))
+
+    def record_attempt(self, file_name: str, model: str, iteration: int, outcome: str, latency: float):
+        """One API attempt: its outcome and the seconds its call took (or a 'cache_hit' row)."""
+        self.queue.put((
+            "INSERT INTO attempts (resume, model, iteration, outcome, latency, finished_at) VALUES (?, ?, ?, ?, ?, ?)",
+            [(file_name, model, iteration, outcome, latency, time.time())]
+        ))
+
+    def record_task(self, file_name: str, model: str, prompt_digest: str, status: str):
+        """Set a cell's status: 'pending', 'running', or finished as 'done', 'incomplete' or 'failed'."""
+        now = time.time()
+        started_at = now if status == 'running' else None
+        finished_at = now if status in ('done', 'incomplete', 'failed') else None
+        self.queue.put((
+            "INSERT INTO tasks (resume, model, prompt_hash, provider, status, started_at, finished_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT (resume, model, prompt_hash) DO UPDATE SET status = excluded.status, "
+            "started_at = COALESCE(excluded.started_at, started_at), finished_at = excluded.finished_at",
+            [(file_name, model, prompt_digest, get_provider(model), status, started_at, finished_at)]
+        ))
+
+    def backfill(self, journal):
+        """Insert journaled results missing from the database (e.g. from runs before it existed)."""
+        now = time.time()
+        with journal.lock:
+            cells = {key: list(rows.values()) for key, rows in journal.results.items()}
+        values = [
+            result_values(file_name, model, prompt_digest, row, now)
+            for (file_name, model, prompt_digest), rows in cells.items()
+            for row in rows
+        ]
+        self.queue.put((INSERT_RESULT.replace('INSERT OR REPLACE', 'INSERT OR IGNORE'), values))
+
+    def run(self):
+        connection = connect(self.path)
+        batch = []
+        last_commit = time.monotonic()
+        while True:
+            timeout = max(CONFIG['results_db_commit_seconds'] - (time.monotonic() - last_commit), 0.01)
+            try:
+                item = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+            if item is not STOP and item is not None:
+                batch.append(item)
+            if batch and (item is STOP or len(batch) >= CONFIG['results_db_commit_rows']
+                          or time.monotonic() - last_commit >= CONFIG['results_db_commit_seconds']):
+                self.commit(connection, batch)
+                batch = []
+                last_commit = time.monotonic()
+            if item is STOP:
+                break
+        connection.close()
+
+    def commit(self, connection: sqlite3.Connection, batch):
+        """Apply queued statements in one transaction."""
+        try:
+            with connection:
+                for statement, values in batch:
+                    connection.executemany(statement, values)
+        except sqlite3.Error as e:
+            # The CSVs and journal stay complete; `backfill` restores results on the next run
+            logger.error(f"Could not write {len(batch)} statements to {self.path}: {e}", exc_info=True)
+
+    def close(self):
+        """Commit everything queued and stop the thread (also called by ResultWriter for sinks)."""
+        if not self.thread.is_alive():
+            return
+        self.queue.put(STOP)
+        self.thread.join()
+        logger.info(f"Results database written to {self.path}")
+
+
+def open_results_db(output_base: str):
+    """The run database, or None when CONFIG['results_db'] is off."""
+    if not CONFIG['results_db']:
+        return None
+    return ResultsDatabase(os.path.join(output_base, CONFIG['results_db']))
+
+
+def print_rows(cursor):
+    columns = [d[0] for d in cursor.description]
+    rows = cursor.fetchall()
+    widths = [max(len(str(c)), *(len(str(r[i])) for r in rows)) if rows else len(c) for i, c in enumerate(columns)]
+    print('  '.join(c.ljust(w) for c, w in zip(columns, widths)))
+    for row in rows:
+        print('  '.join(str(v).ljust(w) for v, w in zip(row, widths)))
+    print(f"({len(rows)} rows)")
+
+
+def export_csvs(connection: sqlite3.Connection, directory: str) -> int:
+    """Write one deduplicated, iteration-ordered CSV per provider and resume; returns rows written."""
+    cursor = connection.execute(
+        f"SELECT provider, resume, model, iteration, {', '.join(QUESTION_COLUMNS)}, manipulation_check, thought_process "
+        f"FROM results ORDER BY provider, resume, model, iteration"
+    )
+    written = 0
+    current = None
+    handle = writer = None
+    for provider, resume, *row in cursor:
+        if (provider, resume) != current:
+            if handle:
+                handle.close()
+            current = (provider, resume)
+            output_directory = os.path.join(directory, f'output_csvs_{provider}')
+            os.makedirs(output_directory, exist_ok=True)
+            handle = open(results_csv_path(output_directory, resume), 'w', newline='', encoding='utf-8')
+            writer = csv.writer(handle)
+            writer.writerow(csv_fieldnames())
+        writer.writerow(row)
+        written += 1
+    if handle:
+        handle.close()
+    return written
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect the run database while a run is going.")
+    parser.add_argument('--db', default=os.path.join(os.getenv('OUTPUT_DIR', '.'), CONFIG['results_db'] or 'results.sqlite'))
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    cells = subparsers.add_parser('cells', help="(resume, model) cells with fewer valid iterations than --below")
+    cells.add_argument('--below', type=int, default=CONFIG['iterations_per_file'])
+    subparsers.add_parser('latency', help="API attempt latency and outcomes by model (cache hits apart)")
+    tasks = subparsers.add_parser('tasks', help="task status")
+    tasks.add_argument('--status')
+    export = subparsers.add_parser('export', help="write deduplicated CSVs")
+    export.add_argument('directory')
+    args = parser.parse_args()
+
+    if not os.path.exists(args.db):
+        sys.exit(f"No database at {args.db}")
+    connection = connect(args.db, readonly=args.command != 'export')
+
+    if args.command == 'cells':
+        print_rows(connection.execute(
+            "SELECT t.resume, t.model, t.status, COUNT(r.iteration) AS valid_iterations "
+            "FROM tasks t LEFT JOIN results r "
+            "ON r.resume = t.resume AND r.model = t.model AND r.prompt_hash = t.prompt_hash "
+            "GROUP BY t.resume, t.model, t.prompt_hash HAVING valid_iterations < ? "
+            "ORDER BY valid_iterations, t.resume, t.model",
+            (args.below,)
+        ))
+    elif args.command == 'latency':
+        print_rows(connection.execute(
+            "SELECT model, SUM(outcome != 'cache_hit') AS attempts, SUM(outcome = 'ok') AS ok, "
+            "ROUND(AVG(CASE WHEN outcome != 'cache_hit' THEN latency END), 2) AS mean_s, "
+            "ROUND(MAX(CASE WHEN outcome != 'cache_hit' THEN latency END), 2) AS max_s, "
+            "SUM(outcome = 'cache_hit') AS cache_hits, "
+            "GROUP_CONCAT(DISTINCT CASE WHEN outcome NOT IN ('ok', 'cache_hit') THEN outcome END) AS errors "
+            "FROM attempts GROUP BY model ORDER BY model"
+        ))
+    elif args.command == 'tasks':
+        query = "SELECT resume, model, status, started_at, finished_at FROM tasks"
+        params = ()
+        if args.status:
+            query += " WHERE status = ?"
+            params = (args.status,)
+        print_rows(connection.execute(query + " ORDER BY resume, model", params))
+    else:
+        print(f"Exported {export_csvs(connection, args.directory)} rows to {args.directory}")
+    connection.close()
+
+
+if __name__ == "__main__":
+    main()
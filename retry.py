@@ -0,0 +1,116 @@
+"""
+Provider-agnostic retries with server-directed waits and decorrelated jitter.
+
+Errors are classified from the SDK exception types and HTTP status codes.
+A rate-limited or overloaded request sleeps exactly as long as the server
+asks (Retry-After, retry-after-ms, or the reset header of the exhausted
+x-ratelimit-* / anthropic-ratelimit-* budget). Other transient errors back
+off with decorrelated jitter between CONFIG['retry_base_delay'] and
+CONFIG['retry_max_delay']. Client errors (bad request, auth, unknown model)
+are not retried.
+"""
+import random
+import asyncio
+import logging
+
+import anthropic
+import httpx
+import openai
+
+from config import CONFIG
+from key_pool import (
+    get_key_pool, NoAvailableKeyError, QUOTA_ERROR_MARKERS,
+    error_headers, error_status, parse_reset_seconds, parse_rate_limit_headers
+)
+from response_cache import CacheMissError
+from metrics import record_retry, record_retry_failure
+from circuit_breaker import CircuitOpenError
+
+logger = logging.getLogger(__name__)
+
+# Error classes worth another attempt; 'quota' is retried only while another key is available
+RETRYABLE_ERRORS = ('rate_limit', 'overload', 'connection', 'other')
+
+CONNECTION_ERRORS = (openai.APIConnectionError, anthropic.APIConnectionError, httpx.TransportError, asyncio.TimeoutError)
+
+
+def classify_error(error: Exception) -> str:
+    """Classify an API error as 'quota', 'rate_limit', 'overload', 'connection', 'client' or 'other'."""
+    status = error_status(error)
+    code = getattr(error, 'code', None)
+    if code in QUOTA_ERROR_MARKERS or any(marker in str(error).lower() for marker in QUOTA_ERROR_MARKERS):
+        return 'quota'
+    if status == 429 or isinstance(error, (openai.RateLimitError, anthropic.RateLimitError)):
+        return 'rate_limit'
+    if isinstance(error, CONNECTION_ERRORS):
+        return 'connection'
+    if (status is not None and status >= 500) or isinstance(error, (openai.InternalServerError, anthropic.InternalServerError)):
+        # Includes Anthropic's 529 overloaded_error
+        return 'overload'
+    if status is not None and 400 <= status < 500:
+        return 'client'
+    return 'other'
+
+
+def server_retry_after(error: Exception):
+    """Seconds the server asked us to wait before retrying, or None if it did not say."""
+    headers = error_headers(error)
+    if not headers:
+        return None
+    if headers.get('retry-after-ms'):
+        try:
+            return float(headers['retry-after-ms']) / 1000.0
+        except ValueError:
+            pass
+    wait = parse_reset_seconds(headers.get('retry-after'))
+    if wait is not None:
+        return wait
+    info = parse_rate_limit_headers(headers)
+    resets = [
+        info[f'reset_{kind}'] for kind in ('requests', 'tokens')
+        if info.get(f'remaining_{kind}') == 0 and info.get(f'reset_{kind}') is not None
+    ]
+    return max(resets) if resets else None
+
+
+def jittered_delay(previous: float) -> float:
+    """Decorrelated jitter: uniform between the base delay and three times the previous one, capped."""
+    base = CONFIG['retry_base_delay']
+    return min(CONFIG['retry_max_delay'], random.uniform(base, max(previous, base) * 3))
+
+
+async def call_with_retries(provider: str, model: str, attempt, max_retries: int = None):
+    """Await `attempt()` until it succeeds, retrying transient errors up to `max_retries` times in total."""
+    max_retries = max_retries or CONFIG['max_retries']
+    delay = CONFIG['retry_base_delay']
+    for attempt_number in range(1, max_retries + 1):
+        try:
+            return await attempt()
+        except (CacheMissError, NoAvailableKeyError, CircuitOpenError):
+            raise
+        except Exception as e:
+            error_class = classify_error(e)
+
+            if error_class == 'quota' and attempt_number < max_retries and get_key_pool(provider).has_available_key():
+                # The pool has already benched the exhausted key; go straight to another one
+                logger.info(f"{provider} key out of quota for {model}, retrying on another key")
+                record_retry(model, error_class, 0.0)
+                continue
+
+            if error_class not in RETRYABLE_ERRORS or attempt_number == max_retries:
+                logger.error(
+                    f"Giving up on {model} after {attempt_number} attempt(s) ({error_class} error): {e}"
+                )
+                record_retry_failure(model, error_class)
+                raise
+
+            wait = server_retry_after(e) if error_class in ('rate_limit', 'overload') else None
+            if wait is None:
+                delay = jittered_delay(delay)
+                wait = delay
+            logger.warning(
+                f"{error_class} error for {model} (attempt {attempt_number}/{max_retries}), "
+                f"retrying in {wait:.1f}s: {e}"
+            )
+            record_retry(model, error_class, wait)
+            await asyncio.sleep(wait)
@@ -1,6 +1,9 @@
 """Utility functions."""
+import hashlib
 import tiktoken
 import logging
+from functools import lru_cache
+from config import CONFIG, OPENAI_MODELS_MAIN, CLAUDE_MODELS, MISTRAL_MODELS
 from prompts import SYSTEM_PROMPT
 
 logger = logging.getLogger(__name__)
@@ -104,22 +107,72 @@ def get_mistral_response_schema():
     }
 
 
-def calculate_token_count(prompt: str, model: str = "gpt-4o") -> int:
-    """Calculate token count for a prompt."""
+def get_provider(model: str) -> str:
+    """Return the provider name for a configured model."""
+    if model in OPENAI_MODELS_MAIN:
+        return 'openai'
+    if model in CLAUDE_MODELS:
+        return 'anthropic'
+    if model in MISTRAL_MODELS:
+        return 'mistral'
+    raise ValueError(f"Unknown model: {model}")
+
+
+def key_fingerprint(api_key: str) -> str:
+    """Short stable id for an API key, safe to log or use as a dict key."""
+    return hashlib.sha256((api_key or '').encode('utf-8')).hexdigest()[:12]
+
+
+@lru_cache(maxsize=None)
+def load_token_encoding(model: str):
+    """tiktoken encoding for a model, loaded once; None if tiktoken cannot load it (e.g. offline without its cache)."""
     try:
-        encoding = tiktoken.encoding_for_model(model)
-    except KeyError:
-        logger.warning(f"Encoding not found for model {model}, using cl100k_base")
-        encoding = tiktoken.get_encoding("cl100k_base")
-    
-    tokens = encoding.encode(prompt)
-    return len(tokens)
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            logger.warning(f"Encoding not found for model {model}, using cl100k_base")
+            return tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        logger.warning(f"Could not load a tiktoken encoding for {model} ({e}); counting tokens as characters / 4")
+        return None
+
+
+def calculate_token_count(prompt: str, model: str = "gpt-4o") -> int:
+    """Calculate token count for a prompt (characters / 4 if no encoding is available)."""
+    encoding = load_token_encoding(model)
+    if encoding is not None:
+        try:
+            return len(encoding.encode(prompt))
+        except Exception as e:
+            logger.warning(f"Token count failed ({e}); estimating from the prompt length")
+    return len(prompt) // 4
+
+
+# Separates the shared question block from the resume in the 'prefix_first' layout
+PROMPT_PREFIX_SEPARATOR = "\n\n---\n\nRESUME:\n"
 
 
-def process_txt_files_and_attach_to_prompt(file_path: str, global_prompt_template: str) -> str:
-    """Read resume text and construct prompt."""
+def process_txt_files_and_attach_to_prompt(file_path: str, global_prompt_template: str, layout: str = None) -> str:
+    """Read resume text and construct prompt (see attach_resume_to_prompt)."""
     with open(file_path, 'r', encoding='utf-8') as file:
-        extracted_text = file.read().strip()
+        return attach_resume_to_prompt(file.read(), global_prompt_template, layout)
+
+
+def attach_resume_to_prompt(resume_text: str, global_prompt_template: str, layout: str = None) -> str:
+    """Construct the prompt for a resume text.
+    
+    Layouts (default CONFIG['prompt_layout']):
+    - 'resume_first': resume, then the evaluation questions (original study layout)
+    - 'prefix_first': the evaluation questions, then the resume, so the question
+      block forms a stable prefix that providers can serve from their prompt cache
+    """
+    extracted_text = resume_text.strip()
+    
+    layout = layout or CONFIG['prompt_layout']
+    
+    if layout == 'prefix_first':
+        return f"""EVALUATION QUESTIONS:
+{global_prompt_template}{PROMPT_PREFIX_SEPARATOR}{extracted_text}"""
     
     full_prompt = f"""RESUME:
 {extracted_text}
@@ -131,3 +184,16 @@ EVALUATION QUESTIONS:
     
     return full_prompt
 
+
+def split_prompt_prefix(prompt: str):
+    """Split a 'prefix_first' prompt into (shared prefix, resume part).
+    
+    Returns ("", prompt) for prompts in any other layout.
+    """
+    if not prompt.startswith("EVALUATION QUESTIONS:"):
+        return "", prompt
+    prefix, separator, resume_part = prompt.partition(PROMPT_PREFIX_SEPARATOR)
+    if not separator:
+        return "", prompt
+    return prefix + separator, resume_part
+